@@ -0,0 +1,89 @@
+"""
+Measure peak memory (RSS) when formatting a large generated Markdown document:
+after each rendering step in a fresh process, and for a whole `tp format` run.
+Shows what a streamed rendering path could save at most, which is the memory
+used after Markdown conversion.
+
+Usage: uv run python devtools/bench_page_memory.py [megabytes]
+"""
+
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from rich import print as rprint
+
+CHILD = """
+import resource, sys
+from pathlib import Path
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+import textpress.actions.textpress_format
+from kash.model import Format, Item, ItemType
+from textpress.docs.render_webpage import render_webpage
+
+item = Item(type=ItemType.doc, format=Format.markdown, title="Big", body=Path(sys.argv[1]).read_text())
+print(peak_mb())
+content_html = item.body_as_html()
+print(peak_mb())
+page = render_webpage(item)
+print(peak_mb())
+print(len(page) / 1e6)
+"""
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda".split()
+
+
+def write_doc(path: Path, megabytes: float) -> None:
+    random.seed(1)
+    sections = ["# Big\n\n"]
+    size = 0
+    while size < megabytes * 1_000_000:
+        words = " ".join(random.choice(WORDS) for _ in range(120))
+        section = (
+            f"## Section {len(sections)}\n\n{words} *em* **strong** [link](https://x.com).\n\n"
+        )
+        sections.append(section)
+        size += len(section)
+    path.write_text("".join(sections))
+
+
+def main(megabytes: float = 2) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        doc_path = Path(tmp) / "big.md"
+        write_doc(doc_path, megabytes)
+
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD, str(doc_path)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        loaded, converted, rendered, page_mb = map(float, result.stdout.split()[-4:])
+
+        subprocess.run(
+            [
+                *[sys.executable, "-m", "textpress", "--work_root", str(Path(tmp) / "work")],
+                *["format", str(doc_path), "--no_daemon", "--no_minify"],
+            ],
+            env={"TEXTPRESS_API_KEY": "tp_bench", **os.environ},
+            capture_output=True,
+            check=True,
+        )
+        command = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    rprint(f"Peak RSS for a {megabytes:g}MB Markdown document ({page_mb:.1f}MB page):")
+    rprint(f"  imports and document:   {loaded:6.0f}MB")
+    rprint(f"  Markdown to HTML:       {converted:6.0f}MB (+{converted - loaded:.0f}MB)")
+    rprint(f"  page rendered:          {rendered:6.0f}MB (+{rendered - converted:.0f}MB)")
+    rprint(f"  `tp format --no_minify`: {command:5.0f}MB")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2)
@@ -0,0 +1,49 @@
+"""
+Benchmark loading the page templates in a fresh process (as each `tp` command
+does), with and without the on-disk bytecode cache.
+
+Usage: uv run python devtools/bench_templates.py [runs]
+"""
+
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from rich import print as rprint
+
+CHILD = """
+import sys, time
+from pathlib import Path
+from textpress.docs.render_webpage import template_env, template_search_path
+
+bytecode_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+start = time.perf_counter()
+env = template_env(template_search_path(), bytecode_dir=bytecode_dir)
+env.get_template("textpress_webpage.html.jinja")
+print(time.perf_counter() - start)
+"""
+
+
+def load_seconds(*args: str) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, *args], capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(runs: int = 10) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = [load_seconds() for _ in range(runs)]
+        load_seconds(tmp)  # Populate the cache.
+        warm = [load_seconds(tmp) for _ in range(runs)]
+
+    cold_ms = statistics.median(cold) * 1000
+    warm_ms = statistics.median(warm) * 1000
+    rprint(f"Template load in a new process (median of {runs}):")
+    rprint(f"  compiled from source:  {cold_ms:6.1f}ms")
+    rprint(f"  from bytecode cache:   {warm_ms:6.1f}ms ({cold_ms / warm_ms:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -1,4 +1,17 @@
+import contextvars
+import hashlib
+import json
+import shutil
+import tempfile
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
 from kash.config.logger import get_logger
+from kash.config.settings import global_settings
 from kash.exec import kash_action
 from kash.exec.preconditions import (
     has_html_body,
@@ -6,22 +19,136 @@ from kash.exec.preconditions import (
     is_docx_resource,
     is_url_resource,
 )
-from kash.kits.docs.actions.text.create_docx import create_docx
-from kash.kits.docs.actions.text.create_pdf import create_pdf
-from kash.kits.docs.actions.text.markdownify_doc import markdownify_doc
+from kash.exec.runtime_settings import current_runtime_settings
+from kash.kits.docs.doc_formats.pdf_output import html_to_pdf
+from kash.kits.docs.doc_formats.simple_html_to_docx import SimpleHtmlToDocx
 from kash.model import (
     ActionInput,
     ActionResult,
+    FileExt,
+    Format,
+    Item,
+    ItemType,
 )
+from kash.utils.errors import InvalidInput
+from kash.workspaces import current_ws
+from strif import atomic_output_file
+
+from textpress.actions.textpress_markdownify import markdownify_input
+from textpress.docs.render_cache import RenderCache
 
 log = get_logger(__name__)
 
+EXPORT_CACHE_DIR_NAME = "textpress_exports"
+"""Exported .docx and .pdf files by Markdown content hash, kept in the cache directory."""
+
+
+def write_docx(md_item: Item, out_path: Path) -> None:
+    """
+    Same conversion as the `create_docx` action, but to any path.
+    """
+    docx = SimpleHtmlToDocx().convert_html_string(md_item.body_as_html())
+    docx.save(str(out_path))
+
+
+def write_pdf(md_item: Item, out_path: Path) -> None:
+    """
+    Same conversion as the `create_pdf` action, but to any path.
+    """
+    html_to_pdf(md_item.body_as_html(), out_path, title=md_item.title)
+
+
+EXPORTERS: dict[Format, tuple[Callable[[Item, Path], None], FileExt]] = {
+    Format.docx: (write_docx, FileExt.docx),
+    Format.pdf: (write_pdf, FileExt.pdf),
+}
+
+
+@cache
+def export_caches(cache_dir: Path) -> dict[Format, RenderCache]:
+    return {
+        format: RenderCache(cache_dir / EXPORT_CACHE_DIR_NAME, suffix=f".{file_ext.value}")
+        for format, (_create, file_ext) in EXPORTERS.items()
+    }
+
+
+def export_cache_key(md_item: Item, format: Format) -> str:
+    """
+    Key for the file `format`'s exporter would produce for this item: a hash of
+    everything it depends on.
+    """
+    versions = {}
+    for package in ["textpress", "kash-shell", "kash-docs"]:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            pass
+    inputs = {
+        "versions": versions,
+        "export_format": format.value,
+        "format": md_item.format and md_item.format.value,
+        "title": md_item.title,
+        "body": md_item.body,
+    }
+    if format == Format.pdf:
+        # The PDF footer has the date it was generated.
+        inputs["date"] = date.today().isoformat()
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def cached_export(md_item: Item, format: Format, tmp_dir: Path) -> Path:
+    """
+    Export the item in the given format, reusing an earlier export of the same
+    content if there is one. Returns the path of the file, in the cache or in
+    `tmp_dir`. Doesn't touch the workspace, so it's safe to call from any thread.
+    """
+    write, file_ext = EXPORTERS[format]
+    export_cache = export_caches(global_settings().system_cache_dir)[format]
+    key = export_cache_key(md_item, format)
+
+    cached_path = None if current_runtime_settings().rerun else export_cache.get_file(key)
+    if cached_path:
+        log.message("Using cached %s export: %s", format.value, key)
+        return cached_path
+
+    out_path = tmp_dir / f"export.{file_ext.value}"
+    write(md_item, out_path)
+    export_cache.put_file(key, out_path)
+    return out_path
+
 
 @kash_action(precondition=is_url_resource | is_docx_resource | has_html_body | has_simple_text_body)
 def textpress_export(input: ActionInput) -> ActionResult:
-    md_item = markdownify_doc(input.items[0])
+    md_item = markdownify_input(input.items[0])
+    if not md_item.body:
+        raise InvalidInput(f"Item must have a body: {md_item}")
 
-    docx_item = create_docx(md_item)
-    pdf_item = create_pdf(md_item)
+    # Both exporters only read the Markdown item, so run them side by side.
+    # They're mostly Python (holding the GIL), so threads overlap the PDF's
+    # text layout in Pango (which releases it) and file IO with the .docx,
+    # rather than running fully in parallel. For batches, `tp export` also
+    # runs documents in separate processes. Only this thread uses the
+    # workspace, to pick filenames and save.
+    ws = current_ws()
+    export_items: list[Item] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with ThreadPoolExecutor(max_workers=len(EXPORTERS)) as executor:
+            futures = {
+                format: executor.submit(
+                    contextvars.copy_context().run, cached_export, md_item, format, Path(tmp_dir)
+                )
+                for format in EXPORTERS
+            }
+        export_paths = {format: future.result() for format, future in futures.items()}
+        for format, export_path in export_paths.items():
+            export_item = md_item.derived_copy(
+                type=ItemType.export, format=format, file_ext=EXPORTERS[format][1]
+            )
+            target_path = ws.assign_store_path(export_item)
+            with atomic_output_file(target_path, make_parents=True) as tmp_path:
+                shutil.copyfile(export_path, tmp_path)
+            # Already in the store, so saving the result only adds the metadata.
+            export_item.mark_as_saved(target_path)
+            export_items.append(export_item)
 
-    return ActionResult(items=[docx_item, pdf_item])
+    return ActionResult(items=export_items)
@@ -1,5 +1,5 @@
-from kash.actions.core.minify_html import minify_html
 from kash.config.logger import get_logger
+from kash.config.settings import global_settings
 from kash.exec import kash_action
 from kash.exec.preconditions import (
     has_fullpage_html_body,
@@ -9,13 +9,14 @@ from kash.exec.preconditions import (
     is_pdf_resource,
     is_url_resource,
 )
-from kash.kits.docs.actions.text.markdownify_doc import markdownify_doc
+from kash.exec.runtime_settings import current_runtime_settings
 from kash.model import (
     ONE_ARG,
     TWO_ARGS,
     ActionInput,
     ActionResult,
     Format,
+    Item,
     ItemType,
     Param,
 )
@@ -23,10 +24,20 @@ from kash.web_gen.webpage_render import copy_item_sidematter, rewrite_item_image
 from kash.workspaces import current_ws
 from prettyfmt import fmt_lines
 
+from textpress.actions.textpress_markdownify import markdownify_input
 from textpress.actions.textpress_render_template import textpress_render_template
+from textpress.api.precompress import precompress_file
+from textpress.docs.minify_page import minify_page
+from textpress.docs.optimize_images import ImageOptimizer, optimize_page_images
+from textpress.docs.pdf_chunks import DEFAULT_PDF_WORKERS
+from textpress.docs.shared_assets import externalize_assets, shared_asset_uploads
+from textpress.spans import span
 
 log = get_logger(__name__)
 
+IMAGE_CACHE_DIR_NAME = "textpress_images"
+"""Optimized images by source hash, kept in the cache directory."""
+
 
 @kash_action(
     expected_args=ONE_ARG,
@@ -39,6 +50,16 @@ log = get_logger(__name__)
         Param("add_title", "Add a title to the page body.", type=bool),
         Param("add_classes", "Space-delimited classes to add to the body of the page.", type=str),
         Param("no_minify", "Skip HTML/CSS/JS/Tailwind minification step.", type=bool),
+        Param(
+            "optimize_images",
+            "Scale down large images and add WebP/AVIF versions with srcsets.",
+            type=bool,
+        ),
+        Param(
+            "shared_assets",
+            "Move the page's large inline CSS/JS into content-hashed files shared across pages.",
+            type=bool,
+        ),
         Param(
             name="pdf_converter",
             description="The converter to use to convert the PDF to Markdown.",
@@ -46,6 +67,24 @@ log = get_logger(__name__)
             default_value="marker",
             valid_str_values=["markitdown", "marker"],
         ),
+        Param(
+            "pdf_chunk_pages",
+            "Convert PDFs this many pages at a time, in parallel (0 to convert in one pass).",
+            type=int,
+            default_value=0,
+        ),
+        Param(
+            "pdf_workers",
+            "Number of processes converting PDF chunks in parallel.",
+            type=int,
+            default_value=DEFAULT_PDF_WORKERS,
+        ),
+        Param(
+            "pdf_worker_memory",
+            "Memory cap for each PDF worker process, in MB (0 for no cap).",
+            type=int,
+            default_value=0,
+        ),
     ),
 )
 def textpress_format(
@@ -53,21 +92,42 @@ def textpress_format(
     add_title: bool = False,
     add_classes: str | None = None,
     no_minify: bool = False,
+    optimize_images: bool = False,
+    shared_assets: bool = False,
     pdf_converter: str = "marker",
+    pdf_chunk_pages: int = 0,
+    pdf_workers: int = DEFAULT_PDF_WORKERS,
+    pdf_worker_memory: int = 0,
 ) -> ActionResult:
     original_item = input.items[0]
-    md_item = markdownify_doc(original_item, pdf_converter=pdf_converter)
+    with span("markdownify") as s:
+        md_item = markdownify_input(
+            original_item,
+            pdf_converter=pdf_converter,
+            pdf_chunk_pages=pdf_chunk_pages,
+            pdf_workers=pdf_workers,
+            pdf_worker_memory=pdf_worker_memory,
+        )
+        s.set(bytes=len(md_item.body or ""))
     log.message("Original textpress_format input:\n%s", fmt_lines([original_item, md_item]))
 
     # Export the text item with original title or the heading if we can get it from the body.
     title = md_item.title or md_item.body_heading()
-    raw_html_item = textpress_render_template(md_item, add_title=add_title, add_classes=add_classes)
+    with span("render_template"):
+        raw_html_item = textpress_render_template(
+            md_item, add_title=add_title, add_classes=add_classes
+        )
 
-    if no_minify:
-        html_body = raw_html_item.body
-    else:
-        minified_item = minify_html(raw_html_item)
-        html_body = minified_item.body
+    html_body = raw_html_item.body
+    if not no_minify:
+        assert html_body
+        with span("minify", bytes=len(html_body)) as s:
+            html_body = minify_page(
+                html_body,
+                global_settings().system_cache_dir,
+                rerun=current_runtime_settings().rerun,
+            )
+            s.set(output_bytes=len(html_body))
 
     # Put the final results as an export with the same title as the original.
     export_md_item = md_item.derived_copy(type=ItemType.export, title=title)
@@ -83,6 +143,20 @@ def textpress_format(
     # Rewrite any image URLs to point to the new location.
     rewrite_item_image_urls(export_html_item, from_prefix, to_prefix)
 
+    assert export_html_item.store_path and export_html_item.body
+    page_dir = (ws.base_dir / export_html_item.store_path).parent
+
+    if optimize_images:
+        optimizer = ImageOptimizer(global_settings().system_cache_dir / IMAGE_CACHE_DIR_NAME)
+        with span("optimize_images") as s:
+            export_html_item.body = optimize_page_images(export_html_item.body, page_dir, optimizer)
+            s.set(bytes=optimizer.bytes_before, output_bytes=optimizer.bytes_after)
+
+    if shared_assets:
+        with span("shared_assets"):
+            export_html_item.body, asset_paths = externalize_assets(export_html_item.body, page_dir)
+        log.message("Shared assets: %s", fmt_lines(asset_paths))
+
     log.message("Formatted HTML item from text item:\n%s", fmt_lines([md_item, export_html_item]))
     if is_pdf_resource(input.items[0]):
         log.warning(
@@ -92,3 +166,20 @@ def textpress_format(
     # Setting overwrite means we'll always pick the same output paths and
     # both .html and .md filenames will match.
     return ActionResult(items=[export_md_item, export_html_item], overwrite=True)
+
+
+def precompress_outputs(items: list[Item]) -> None:
+    """
+    Write gzip/brotli compressed copies of saved `textpress_format` outputs
+    and the shared assets their pages use, for publishing. Call this once the
+    action result is saved, so the copies match the saved files byte for byte.
+    """
+    ws = current_ws()
+    for item in items:
+        assert item.store_path
+        saved_path = ws.base_dir / item.store_path
+        with span("precompress", bytes=saved_path.stat().st_size):
+            precompress_file(saved_path)
+            if item.format == Format.html:
+                for asset_path in shared_asset_uploads(saved_path).values():
+                    precompress_file(asset_path)
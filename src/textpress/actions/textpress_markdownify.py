@@ -0,0 +1,119 @@
+import hashlib
+import json
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from kash.actions.core.markdownify_html import markdownify_html
+from kash.config.logger import get_logger
+from kash.config.settings import global_settings
+from kash.exec import fetch_url_item_content, kash_action
+from kash.exec.preconditions import (
+    has_fullpage_html_body,
+    is_docx_resource,
+    is_pdf_resource,
+    is_url_resource,
+)
+from kash.exec.runtime_settings import current_runtime_settings
+from kash.kits.docs.actions.text.docx_to_md import docx_to_md
+from kash.kits.docs.actions.text.markdownify_doc import markdownify_doc
+from kash.model import Format, Item
+
+from textpress.actions.textpress_pdf_to_md import textpress_pdf_to_md
+from textpress.docs.pdf_chunks import DEFAULT_PDF_WORKERS
+from textpress.docs.render_cache import RenderCache
+
+log = get_logger(__name__)
+
+MARKDOWN_CACHE_DIR_NAME = "textpress_markdown"
+"""Documents converted to Markdown by content hash, kept in the cache directory."""
+
+MARKDOWN_CACHE_VERSION = 1
+"""Bump if conversion changes, so cached documents are converted again."""
+
+
+@cache
+def markdown_cache(cache_dir: Path) -> RenderCache:
+    return RenderCache(cache_dir / MARKDOWN_CACHE_DIR_NAME, suffix=".json")
+
+
+def markdown_cache_key(item: Item) -> str:
+    """
+    Key for the Markdown converted from this .docx or HTML item: a hash of its
+    content, URL (which readability uses to resolve links), and the versions of
+    the converters.
+    """
+    if item.body is not None and not is_docx_resource(item):
+        content = item.body.encode()
+    else:
+        content = item.absolute_path().read_bytes()
+    versions = {}
+    for package in ["kash-shell", "kash-docs"]:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    inputs = {
+        "cache_version": MARKDOWN_CACHE_VERSION,
+        "versions": versions,
+        "url": item.url,
+        "content_hash": hashlib.sha256(content).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+@kash_action(
+    precondition=is_url_resource | is_docx_resource | has_fullpage_html_body,
+    output_format=Format.markdown,
+)
+def textpress_markdownify(item: Item) -> Item:
+    """
+    Same as `markdownify_doc` for URLs, .docx files, and HTML pages, but caching
+    the Markdown by a hash of the content, so converting the same content again
+    (as in another workspace) is quick.
+    """
+    if is_url_resource(item):
+        # The fetched page is cached by kash.
+        item = fetch_url_item_content(item).item
+
+    cache = markdown_cache(global_settings().system_cache_dir)
+    key = markdown_cache_key(item)
+    # With rerun set, convert again but still refresh the cache.
+    cached = None if current_runtime_settings().rerun else cache.get(key)
+    if cached is not None:
+        log.info("Using cached Markdown: %s", key)
+        converted = json.loads(cached)
+    else:
+        result = docx_to_md(item) if is_docx_resource(item) else markdownify_html(item)
+        converted = {"title": result.title, "body": result.body}
+        cache.put(key, json.dumps(converted))
+
+    return item.derived_copy(
+        format=Format.markdown, title=converted["title"] or item.title, body=converted["body"]
+    )
+
+
+def markdownify_input(
+    item: Item,
+    pdf_converter: str = "marker",
+    pdf_chunk_pages: int = 0,
+    pdf_workers: int = DEFAULT_PDF_WORKERS,
+    pdf_worker_memory: int = 0,
+) -> Item:
+    """
+    Same as `markdownify_doc`, but with conversions cached by content, so
+    re-converting a document (as when a batch's workers have already converted
+    it) is quick. PDFs are converted with `textpress_pdf_to_md`, in chunks of
+    `pdf_chunk_pages` pages if set, or else all at once.
+    """
+    if is_pdf_resource(item):
+        return textpress_pdf_to_md(
+            item,
+            converter=pdf_converter,
+            chunk_pages=pdf_chunk_pages,
+            workers=pdf_workers,
+            worker_memory=pdf_worker_memory,
+        )
+    if is_url_resource(item) or has_fullpage_html_body(item) or is_docx_resource(item):
+        return textpress_markdownify(item)
+    return markdownify_doc(item, pdf_converter=pdf_converter)
@@ -0,0 +1,102 @@
+from kash.config.logger import get_logger
+from kash.config.settings import global_settings
+from kash.exec import kash_action
+from kash.exec.preconditions import is_pdf_resource
+from kash.exec.runtime_settings import current_runtime_settings
+from kash.kits.docs.actions.text.pdf_to_md import pdf_to_md
+from kash.model import Format, Item, Param
+from kash.workspaces import current_ws
+from prettyfmt import fmt_path
+from sidematter_format import Sidematter
+from strif import atomic_output_file
+
+from textpress.docs.pdf_chunks import (
+    DEFAULT_CHUNK_PAGES,
+    DEFAULT_PDF_WORKERS,
+    PdfChunk,
+    chunking_available,
+    convert_pdf_in_chunks,
+)
+
+log = get_logger(__name__)
+
+
+@kash_action(
+    precondition=is_pdf_resource,
+    output_format=Format.markdown,
+    params=(
+        Param(
+            name="converter",
+            description="The converter to use to convert the PDF to Markdown.",
+            type=str,
+            default_value="marker",
+            valid_str_values=["markitdown", "marker"],
+        ),
+        Param(
+            "chunk_pages",
+            "Number of pages converted at a time (0 for the whole PDF at once).",
+            type=int,
+            default_value=DEFAULT_CHUNK_PAGES,
+        ),
+        Param(
+            "workers",
+            "Number of processes converting chunks in parallel.",
+            type=int,
+            default_value=DEFAULT_PDF_WORKERS,
+        ),
+        Param(
+            "worker_memory",
+            "Memory cap for each worker process, in MB (0 for no cap).",
+            type=int,
+            default_value=0,
+        ),
+    ),
+    live_output=True,
+)
+def textpress_pdf_to_md(
+    item: Item,
+    converter: str = "marker",
+    chunk_pages: int = DEFAULT_CHUNK_PAGES,
+    workers: int = DEFAULT_PDF_WORKERS,
+    worker_memory: int = 0,
+) -> Item:
+    """
+    Convert a PDF to Markdown a chunk of pages at a time, across worker
+    processes, caching each chunk's result. Same output as `pdf_to_md`, except
+    that text flowing across a chunk boundary may be split into two paragraphs.
+    With `chunk_pages` 0, the whole PDF is one chunk, converted in this process
+    (unless capped by `worker_memory`), but still cached.
+    """
+    if not chunking_available():
+        return pdf_to_md(item, converter=converter)
+
+    def progress(chunk: PdfChunk, done: int, total: int) -> None:
+        log.message("Converted pages %s (%s of %s chunks)", chunk.pages, done, total)
+
+    pdf_path = item.absolute_path()
+    if chunk_pages:
+        log.message("Converting PDF in chunks of %s pages: %s", chunk_pages, fmt_path(pdf_path))
+    else:
+        log.message("Converting PDF: %s", fmt_path(pdf_path))
+    result = convert_pdf_in_chunks(
+        pdf_path,
+        converter,
+        global_settings().system_cache_dir,
+        chunk_pages=max(0, chunk_pages),
+        workers=workers,
+        max_worker_memory_mb=worker_memory,
+        use_cache=not current_runtime_settings().rerun,
+        progress=progress,
+    )
+
+    md_item = item.derived_copy(format=Format.markdown, title=item.title, body=result.markdown)
+
+    # Images go in the sidematter assets directory, as with `pdf_to_md`.
+    if result.images:
+        assets_dir = Sidematter(current_ws().assign_store_path(md_item)).assets_dir
+        log.message("Writing %s images to %s", len(result.images), fmt_path(assets_dir))
+        for filename, data in result.images.items():
+            with atomic_output_file(assets_dir / filename, make_parents=True) as tmp_path:
+                tmp_path.write_bytes(data)
+
+    return md_item
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 from kash.config.logger import get_logger
+from kash.config.settings import global_settings
 from kash.exec import kash_action
 from kash.exec.preconditions import (
     has_html_body,
@@ -9,9 +10,8 @@ from kash.exec.preconditions import (
     is_pdf_resource,
     is_url_resource,
 )
-from kash.exec_model.args_model import TWO_ARGS
 from kash.model import (
-    ONE_ARG,
+    ONE_OR_MORE_ARGS,
     ActionInput,
     ActionResult,
     Format,
@@ -19,19 +19,79 @@ from kash.model import (
     ItemType,
     Param,
 )
+from kash.utils.errors import InvalidInput
 from kash.workspaces import current_ws
 from prettyfmt import fmt_lines, fmt_path
 from sidematter_format import Sidematter
 
-from textpress.actions.textpress_format import textpress_format
+from textpress.actions.textpress_format import precompress_outputs, textpress_format
+from textpress.api.api_cache import ApiCache
+from textpress.api.file_metadata_cache import FileMetadataCache
+from textpress.api.multipart_upload import MultipartSettings
 from textpress.api.textpress_api import publish_files
+from textpress.docs.shared_assets import shared_asset_uploads
+from textpress.spans import span
 
 log = get_logger(__name__)
 
+FILE_METADATA_CACHE_NAME = "textpress_file_metadata.json"
+"""Cache of file hashes for publishing, kept in the work root cache directory."""
+
+UPLOAD_RESUME_DIR_NAME = "textpress_upload_resume"
+"""Resume records for interrupted multipart uploads, also in the cache directory."""
+
+API_CACHE_NAME = "textpress_api_cache.json"
+"""Recent user profile and manifest responses, also in the cache directory."""
+
+
+DEFAULT_FORMAT_JOBS = 4
+"""Default number of documents to format concurrently when publishing several."""
+
+
+def api_cache() -> ApiCache:
+    return ApiCache(global_settings().system_cache_dir / API_CACHE_NAME)
+
+
+def sidematter_uploads(primary: Path) -> dict[str, Path]:
+    """
+    Upload paths for any sidematter (meta and assets) of a document.
+    """
+    sm = Sidematter(primary).resolve(parse_meta=False)
+    out: dict[str, Path] = {}
+    if sm.meta_path and sm.meta_path.exists():
+        # Upload meta as a sibling file (just the filename)
+        out[sm.meta_path.name] = sm.meta_path
+    if sm.assets_dir and sm.assets_dir.is_dir():
+        # Upload all files under <stem>.assets, preserving subpaths
+        for p in sm.assets_dir.rglob("*"):
+            if p.is_file():
+                rel = p.relative_to(sm.assets_dir)
+                upload = f"{sm.assets_dir.name}/{rel.as_posix()}"
+                out[upload] = p
+    return out
+
+
+def document_uploads(md_item: Item, html_item: Item) -> dict[str, Path]:
+    """
+    Upload paths for a formatted document: the .md and .html files, plus any
+    sidematter (meta + assets) and any shared assets the page uses.
+    """
+    md_path = md_item.absolute_path()
+    html_path = html_item.absolute_path()
+
+    upload_map: dict[str, Path] = {
+        md_path.name: md_path,
+        html_path.name: html_path,
+    }
+    # Use just one of the files for the sidematter (since they share the sidematter).
+    upload_map.update(sidematter_uploads(md_path))
+    upload_map.update(shared_asset_uploads(html_path))
+    return upload_map
+
 
 @kash_action(
-    expected_args=ONE_ARG,
-    expected_outputs=TWO_ARGS,
+    expected_args=ONE_OR_MORE_ARGS,
+    expected_outputs=ONE_OR_MORE_ARGS,
     precondition=(
         is_url_resource | is_docx_resource | is_pdf_resource | has_html_body | has_simple_text_body
     ),
@@ -39,6 +99,27 @@ log = get_logger(__name__)
         Param("add_title", "Add the document title to the page body.", type=bool),
         Param("add_classes", "Space-delimited classes to add to the body of the page.", type=str),
         Param("no_minify", "Skip HTML/CSS/JS/Tailwind minification step.", type=bool),
+        Param(
+            "precompress",
+            "Upload gzip/brotli compressed copies of the HTML and Markdown.",
+            type=bool,
+        ),
+        Param(
+            "optimize_images",
+            "Scale down large images and add WebP/AVIF versions with srcsets.",
+            type=bool,
+        ),
+        Param(
+            "shared_assets",
+            "Publish the page's large CSS/JS as shared, long-cached files, uploaded once.",
+            type=bool,
+        ),
+        Param(
+            "jobs",
+            "Number of documents to format concurrently.",
+            type=int,
+            default_value=DEFAULT_FORMAT_JOBS,
+        ),
     ),
     cacheable=False,
 )
@@ -47,57 +128,101 @@ def textpress_publish(
     add_title: bool = False,
     add_classes: str | None = None,
     no_minify: bool = False,
+    precompress: bool = False,
+    optimize_images: bool = False,
+    shared_assets: bool = False,
+    jobs: int = DEFAULT_FORMAT_JOBS,
 ) -> ActionResult:
-    item = input.items[0]
-    format_result = textpress_format(
-        input, add_title=add_title, add_classes=add_classes, no_minify=no_minify
-    )
-    md_item = format_result.get_by_format(Format.markdown, Format.md_html)
-    html_item = format_result.get_by_format(Format.html)
+    """
+    Format and publish one or more documents. All documents are published
+    together, with a single manifest fetch, presign, and commit.
+    """
 
-    md_path = md_item.absolute_path()
-    html_path = html_item.absolute_path()
+    def format_item(item: Item) -> tuple[Item, Item]:
+        with span("format", input=str(item.store_path or item.url)):
+            format_result = textpress_format(
+                ActionInput(items=[item]),
+                add_title=add_title,
+                add_classes=add_classes,
+                no_minify=no_minify,
+                optimize_images=optimize_images,
+                shared_assets=shared_assets,
+            )
+        md_item = format_result.get_by_format(Format.markdown, Format.md_html)
+        html_item = format_result.get_by_format(Format.html)
+        if precompress:
+            precompress_outputs([md_item, html_item])
+        return md_item, html_item
 
-    def sidematter_uploads(primary: Path) -> dict[str, Path]:
-        sm = Sidematter(primary).resolve(parse_meta=False)
-        out: dict[str, Path] = {}
-        if sm.meta_path and sm.meta_path.exists():
-            # Upload meta as a sibling file (just the filename)
-            out[sm.meta_path.name] = sm.meta_path
-        if sm.assets_dir and sm.assets_dir.is_dir():
-            # Upload all files under <stem>.assets, preserving subpaths
-            for p in sm.assets_dir.rglob("*"):
-                if p.is_file():
-                    rel = p.relative_to(sm.assets_dir)
-                    upload = f"{sm.assets_dir.name}/{rel.as_posix()}"
-                    out[upload] = p
-        return out
+    # The slow work (converting, rendering, minifying, images) runs first in
+    # worker processes, which fill the caches without touching this workspace.
+    # Then each document is formatted here in turn, mostly from the caches, so
+    # only this thread saves to the workspace.
+    from textpress.cli.cli_parallel import FormatOptions, format_cacheable, format_one, warm_caches
+
+    options = FormatOptions(
+        add_title=add_title,
+        add_classes=add_classes,
+        no_minify=no_minify,
+        optimize_images=optimize_images,
+        shared_assets=shared_assets,
+    )
+    warm_caches(
+        format_one,
+        [
+            item.url if is_url_resource(item) and item.url else item.absolute_path()
+            for item in input.items
+        ],
+        options,
+        jobs=jobs,
+        cacheable=format_cacheable,
+    )
+    formatted = [format_item(item) for item in input.items]
 
     # Build upload set: originals, plus any sidematter (meta + assets) for each
-    upload_map: dict[str, Path] = {
-        md_path.name: md_path,
-        html_path.name: html_path,
-    }
-    # Use just one of the files for the sidematter (since they share the sidematter).
-    upload_map.update(sidematter_uploads(md_path))
+    upload_map: dict[str, Path] = {}
+    for md_item, html_item in formatted:
+        for upload_path, path in document_uploads(md_item, html_item).items():
+            if upload_map.get(upload_path, path) != path:
+                raise InvalidInput(
+                    f"Two documents would publish to the same path: {upload_path}: "
+                    f"{fmt_path(upload_map[upload_path])} and {fmt_path(path)}"
+                )
+            upload_map[upload_path] = path
 
     files_with_paths: list[tuple[Path, str]] = [(p, up) for up, p in upload_map.items()]
     log.message(
         "Publishing files:\n%s",
         fmt_lines([up for _p, up in upload_map.items()]),
     )
-    manifest = publish_files(files_with_paths)
+    metadata_cache = FileMetadataCache(
+        global_settings().system_cache_dir / FILE_METADATA_CACHE_NAME
+    )
+    with span("publish_files", files=len(files_with_paths)):
+        publish_result = publish_files(
+            files_with_paths,
+            metadata_cache=metadata_cache,
+            multipart=MultipartSettings(
+                resume_dir=global_settings().system_cache_dir / UPLOAD_RESUME_DIR_NAME
+            ),
+            precompressed=precompress,
+            api_cache=api_cache(),
+        )
+    manifest = publish_result.manifest
 
-    log.message("Published: %s", list(manifest.files.keys()))
+    log.message("Published (%s): %s", publish_result.summary(), list(manifest.files.keys()))
 
     # Save the manifest so we have it but don't include it in the output.
+    first_title = input.items[0].title
     manifest_item = Item(
         type=ItemType.data,
         format=Format.json,
-        title=f"Textpress Manifest: {item.title}",
+        title=f"Textpress Manifest: {first_title}"
+        if len(input.items) == 1
+        else f"Textpress Manifest: {first_title} and {len(input.items) - 1} more",
         body=manifest.model_dump_json(indent=2),
     )
     manifest_path = current_ws().save(manifest_item)
     log.message("Manifest saved: %s", fmt_path(manifest_path))
 
-    return ActionResult(items=[md_item, html_item])
+    return ActionResult(items=[item for pair in formatted for item in pair])
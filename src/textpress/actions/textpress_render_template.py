@@ -1,12 +1,29 @@
+from functools import cache
+from pathlib import Path
+
+from kash.config.logger import get_logger
+from kash.config.settings import global_settings
 from kash.exec import kash_action
 from kash.exec.preconditions import (
     has_fullpage_html_body,
     has_html_body,
     has_simple_text_body,
 )
+from kash.exec.runtime_settings import current_runtime_settings
 from kash.model import ONE_OR_MORE_ARGS, Format, Item, Param
 
-from textpress.docs.render_webpage import render_webpage
+from textpress.docs.render_cache import RenderCache
+from textpress.docs.render_webpage import render_cache_key, render_webpage
+
+log = get_logger(__name__)
+
+RENDER_CACHE_DIR_NAME = "textpress_render_cache"
+"""Rendered pages by content hash, kept in the cache directory."""
+
+
+@cache
+def render_cache(cache_dir: Path) -> RenderCache:
+    return RenderCache(cache_dir)
 
 
 @kash_action(
@@ -20,7 +37,15 @@ from textpress.docs.render_webpage import render_webpage
 def textpress_render_template(
     item: Item, add_title: bool = False, add_classes: str | None = None
 ) -> Item:
-    html_body = render_webpage(item, add_title_h1=add_title, add_classes=add_classes)
+    cache = render_cache(global_settings().system_cache_dir / RENDER_CACHE_DIR_NAME)
+    key = render_cache_key(item, add_title_h1=add_title, add_classes=add_classes)
+    # With rerun set, render again but still refresh the cache.
+    html_body = None if current_runtime_settings().rerun else cache.get(key)
+    if html_body is None:
+        html_body = render_webpage(item, add_title_h1=add_title, add_classes=add_classes)
+        cache.put(key, html_body)
+    else:
+        log.info("Using cached render: %s", key)
     html_item = item.derived_copy(format=Format.html, body=html_body)
 
     return html_item
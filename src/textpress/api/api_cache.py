@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from strif import atomic_output_file
+
+from textpress.api.textpress_env import ApiConfig
+
+log = logging.getLogger(__name__)
+
+
+CACHE_FORMAT_VERSION = 1
+"""Bump if the entry format changes, to discard older caches."""
+
+USER_PROFILE_TTL = 15 * 60.0
+"""Seconds a fetched user profile is reused. Usernames rarely change."""
+
+
+@dataclass(frozen=True)
+class CachedManifest:
+    etag: str
+    data: dict[str, Any]
+    """The manifest response JSON."""
+
+
+def _account_key(config: ApiConfig) -> str:
+    # A hash, so the API key itself is never written to disk.
+    return hashlib.sha256(f"{config.api_root}\n{config.api_key}".encode()).hexdigest()[:32]
+
+
+class ApiCache:
+    """
+    Persistent cache of API metadata responses, per API root and key, so a
+    steady-state publish needs a single metadata round trip: user profiles are
+    reused for `user_ttl` seconds, and the last manifest is kept with its ETag
+    so it can be revalidated with `If-None-Match` instead of refetched.
+
+    The cache is a single small JSON file, loaded lazily and written atomically
+    on each update. Thread safe.
+    """
+
+    def __init__(self, cache_path: Path, user_ttl: float = USER_PROFILE_TTL):
+        self.cache_path = cache_path
+        self.user_ttl = user_ttl
+        self._accounts: dict[str, dict[str, Any]] | None = None
+        self._lock = threading.RLock()
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if self._accounts is None:
+            self._accounts = {}
+            try:
+                data = json.loads(self.cache_path.read_text())
+                if data.get("version") == CACHE_FORMAT_VERSION:
+                    self._accounts = data["accounts"]
+            except FileNotFoundError:
+                pass
+            except (ValueError, TypeError, KeyError) as e:
+                log.warning("Ignoring unreadable API cache: %s: %s", self.cache_path, e)
+        return self._accounts
+
+    def _save(self) -> None:
+        data = {"version": CACHE_FORMAT_VERSION, "accounts": self._accounts}
+        with atomic_output_file(self.cache_path, make_parents=True) as tmp_path:
+            Path(tmp_path).write_text(json.dumps(data))
+
+    def _put(self, config: ApiConfig, name: str, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self._load().setdefault(_account_key(config), {})[name] = entry
+            self._save()
+
+    def user_profile(self, config: ApiConfig) -> dict[str, Any] | None:
+        """
+        The user profile JSON, if fetched within the TTL.
+        """
+        with self._lock:
+            entry = self._load().get(_account_key(config), {}).get("user")
+        if entry and time.time() - entry["fetched"] < self.user_ttl:
+            return entry["data"]
+        return None
+
+    def put_user_profile(self, config: ApiConfig, data: dict[str, Any]) -> None:
+        self._put(config, "user", {"fetched": time.time(), "data": data})
+
+    def manifest(self, config: ApiConfig) -> CachedManifest | None:
+        """
+        The last manifest fetched and its ETag, to revalidate. May be stale.
+        """
+        with self._lock:
+            entry = self._load().get(_account_key(config), {}).get("manifest")
+        return entry and CachedManifest(etag=entry["etag"], data=entry["data"])
+
+    def put_manifest(self, config: ApiConfig, etag: str, data: dict[str, Any]) -> None:
+        self._put(config, "manifest", {"etag": etag, "data": data})
+
+
+## Tests
+
+
+def test_api_cache():
+    import tempfile
+
+    config = ApiConfig(api_key="tp_a", api_root="https://api.test", publish_root="https://pub")
+    other = ApiConfig(api_key="tp_b", api_root="https://api.test", publish_root="https://pub")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = Path(tmp) / "api_cache.json"
+        cache = ApiCache(cache_path)
+        cache.put_user_profile(config, {"userId": "u1", "username": "a"})
+        cache.put_manifest(config, '"v3"', {"version": 3})
+
+        cache = ApiCache(cache_path)
+        assert cache.user_profile(config) == {"userId": "u1", "username": "a"}
+        assert cache.manifest(config) == CachedManifest(etag='"v3"', data={"version": 3})
+        assert cache.user_profile(other) is None and cache.manifest(other) is None
+        assert "tp_a" not in cache_path.read_text()
+
+        # Profiles expire, but manifests are kept to revalidate.
+        cache = ApiCache(cache_path, user_ttl=0)
+        assert cache.user_profile(config) is None
+        assert cache.manifest(config)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from strif import atomic_output_file
+
+log = logging.getLogger(__name__)
+
+
+CACHE_FORMAT_VERSION = 1
+"""Bump if the entry format changes, to discard older caches."""
+
+DEFAULT_MAX_ENTRIES = 50_000
+"""Cap on cached files. Each entry is ~200 bytes of JSON."""
+
+RACY_MTIME_SECS = 2.0
+"""
+Files modified this recently aren't cached, since a further write within the
+same mtime tick would leave size and mtime unchanged (the "racy git" problem).
+"""
+
+
+@dataclass(frozen=True)
+class FileMetadata:
+    md5: str
+    """Hex MD5 of the file contents."""
+
+    content_type: str
+
+
+@dataclass
+class _Entry:
+    size: int
+    mtime_ns: int
+    inode: int
+    md5: str
+    content_type: str
+    used: float
+
+
+def _stat_key(stat: os.stat_result) -> tuple[int, int, int]:
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class FileMetadataCache:
+    """
+    Persistent cache of MD5 and content type for local files, so republishing
+    large asset trees doesn't rehash files that haven't changed.
+
+    Entries are keyed by resolved path and are only valid while the file's size,
+    mtime_ns, and inode all still match. The cache is a single JSON file, loaded
+    lazily and written atomically by `save()`, keeping at most `max_entries`
+    (least recently used entries are dropped first). Thread safe.
+    """
+
+    def __init__(self, cache_path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._entries: dict[str, _Entry] | None = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> dict[str, _Entry]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                data = json.loads(self.cache_path.read_text())
+                if data.get("version") == CACHE_FORMAT_VERSION:
+                    self._entries = {
+                        path: _Entry(**entry) for path, entry in data["entries"].items()
+                    }
+            except FileNotFoundError:
+                pass
+            except (ValueError, TypeError, KeyError) as e:
+                log.warning("Ignoring unreadable file metadata cache: %s: %s", self.cache_path, e)
+        return self._entries
+
+    def get(self, file_path: Path) -> FileMetadata | None:
+        """
+        Cached metadata for the file, or None if it's missing or stale.
+        """
+        key = str(file_path.resolve())
+        stat = file_path.stat()
+        with self._lock:
+            entry = self._load().get(key)
+            if entry and (entry.size, entry.mtime_ns, entry.inode) == _stat_key(stat):
+                entry.used = time.time()
+                self._dirty = True
+                self.hits += 1
+                return FileMetadata(md5=entry.md5, content_type=entry.content_type)
+            self.misses += 1
+            return None
+
+    def put(self, file_path: Path, metadata: FileMetadata, stat: os.stat_result) -> None:
+        """
+        Record metadata computed from the file as of `stat` (taken before reading
+        the file, so a concurrent write makes the entry stale rather than wrong).
+        """
+        now = time.time()
+        if now - stat.st_mtime < RACY_MTIME_SECS:
+            return
+        size, mtime_ns, inode = _stat_key(stat)
+        with self._lock:
+            self._load()[str(file_path.resolve())] = _Entry(
+                size=size,
+                mtime_ns=mtime_ns,
+                inode=inode,
+                md5=metadata.md5,
+                content_type=metadata.content_type,
+                used=now,
+            )
+            self._dirty = True
+
+    def invalidate(self, file_path: Path) -> None:
+        with self._lock:
+            if self._load().pop(str(file_path.resolve()), None):
+                self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._dirty = True
+
+    def save(self) -> None:
+        """
+        Write the cache if it changed, evicting least recently used entries
+        beyond `max_entries`.
+        """
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            if len(self._entries) > self.max_entries:
+                keep = sorted(self._entries.items(), key=lambda kv: kv[1].used, reverse=True)
+                self._entries = dict(keep[: self.max_entries])
+            data = {
+                "version": CACHE_FORMAT_VERSION,
+                "entries": {path: asdict(entry) for path, entry in self._entries.items()},
+            }
+            with atomic_output_file(self.cache_path, make_parents=True) as tmp_path:
+                Path(tmp_path).write_text(json.dumps(data))
+            self._dirty = False
+            log.info(
+                "Saved file metadata cache (%s entries, %s hits, %s misses): %s",
+                len(self._entries),
+                self.hits,
+                self.misses,
+                self.cache_path,
+            )
+
+
+## Tests
+
+
+def test_file_metadata_cache():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        cache_path = tmp_dir / "cache.json"
+        file_path = tmp_dir / "a.txt"
+        file_path.write_text("hello")
+        # Backdate so the entry isn't skipped as too recent.
+        old = time.time() - 60
+        os.utime(file_path, (old, old))
+
+        cache = FileMetadataCache(cache_path)
+        assert cache.get(file_path) is None
+        cache.put(file_path, FileMetadata(md5="abc", content_type="text/plain"), file_path.stat())
+        cache.save()
+
+        cache = FileMetadataCache(cache_path)
+        assert cache.get(file_path) == FileMetadata(md5="abc", content_type="text/plain")
+
+        # Any change to size or mtime invalidates the entry.
+        file_path.write_text("hello!")
+        os.utime(file_path, (old, old + 1))
+        assert cache.get(file_path) is None
+
+        # Recently modified files aren't cached.
+        file_path.write_text("new")
+        cache.put(file_path, FileMetadata(md5="def", content_type="text/plain"), file_path.stat())
+        assert cache.get(file_path) is None
+
+        # Least recently used entries are evicted beyond the cap.
+        cache = FileMetadataCache(cache_path, max_entries=2)
+        for i in range(3):
+            path = tmp_dir / f"f{i}.txt"
+            path.write_text(str(i))
+            os.utime(path, (old, old))
+            cache.put(path, FileMetadata(md5=str(i), content_type="text/plain"), path.stat())
+            time.sleep(0.01)
+        cache.save()
+        cache = FileMetadataCache(cache_path)
+        assert cache.get(tmp_dir / "f0.txt") is None
+        assert cache.get(tmp_dir / "f2.txt") == FileMetadata(md5="2", content_type="text/plain")
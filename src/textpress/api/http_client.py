@@ -1,39 +1,189 @@
+from __future__ import annotations
+
 import atexit
+import logging
+from dataclasses import dataclass, replace
+from enum import Enum
+from importlib.util import find_spec
 from typing import Any
 
 import httpx
 from strif import AtomicVar
 
-default_client_settings: dict[str, Any] = {
+from textpress.api.textpress_env import Env
+
+log = logging.getLogger(__name__)
+
+
+class HttpPool(Enum):
+    """
+    Separate connection pools, so bulk uploads to presigned storage URLs can't
+    starve API metadata calls (manifest, presign, commit) of connections.
+    """
+
+    api = "api"
+    storage = "storage"
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """
+    Connection pool, keep-alive, and timeout settings for an HTTP client.
+    """
+
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
     # httpx's default timeout of 5 seconds is pretty short.
-    "timeout": 120,
-}
+    read_timeout: float = 120.0
+    write_timeout: float = 120.0
+    http2: bool = False
+
+    def client_kwargs(self) -> dict[str, Any]:
+        http2 = self.http2
+        if http2 and not find_spec("h2"):
+            log.warning("HTTP/2 requires the `h2` package (`httpx[http2]`), using HTTP/1.1")
+            http2 = False
+        return {
+            "timeout": httpx.Timeout(
+                connect=self.connect_timeout,
+                read=self.read_timeout,
+                write=self.write_timeout,
+                # Waiting for a free pooled connection is bounded like a read.
+                pool=self.read_timeout,
+            ),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "http2": http2,
+        }
+
+
+def http_settings_from_env() -> HttpSettings:
+    """
+    Default settings, overridden by any `TEXTPRESS_HTTP_*` environment variables.
+    """
+    defaults = HttpSettings()
+    return HttpSettings(
+        max_connections=Env.TEXTPRESS_HTTP_MAX_CONNECTIONS.read_int(
+            default=defaults.max_connections
+        ),
+        max_keepalive_connections=Env.TEXTPRESS_HTTP_MAX_KEEPALIVE.read_int(
+            default=defaults.max_keepalive_connections
+        ),
+        keepalive_expiry=Env.TEXTPRESS_HTTP_KEEPALIVE_EXPIRY.read_float(
+            default=defaults.keepalive_expiry
+        ),
+        connect_timeout=Env.TEXTPRESS_HTTP_CONNECT_TIMEOUT.read_float(
+            default=defaults.connect_timeout
+        ),
+        read_timeout=Env.TEXTPRESS_HTTP_READ_TIMEOUT.read_float(default=defaults.read_timeout),
+        write_timeout=Env.TEXTPRESS_HTTP_WRITE_TIMEOUT.read_float(default=defaults.write_timeout),
+        http2=Env.TEXTPRESS_HTTP2.read_bool(default=defaults.http2),
+    )
+
+
+_http_settings: AtomicVar[dict[HttpPool, HttpSettings]] = AtomicVar({})
 
-_http_client: AtomicVar[httpx.Client | None] = AtomicVar(None)
+_http_clients: AtomicVar[dict[HttpPool, httpx.Client]] = AtomicVar({})
 
 
-def get_http_client() -> httpx.Client:
+def get_http_settings(pool: HttpPool = HttpPool.api) -> HttpSettings:
     """
-    Simple global, lazily initialized `httpx.Client` with default settings.
+    Current settings for a pool: as set by `configure_http()`, or else from the
+    environment.
+    """
+    with _http_settings.lock:
+        settings = _http_settings.value.get(pool)
+    return settings or http_settings_from_env()
+
+
+def configure_http(settings: HttpSettings, pool: HttpPool | None = None, **overrides: Any) -> None:
+    """
+    Set the HTTP settings for one pool (or both if `pool` is None), with optional
+    field overrides. Any existing client for the pool is closed, so the next
+    `get_http_client()` uses the new settings.
+    """
+    settings = replace(settings, **overrides)
+    pools = [pool] if pool else list(HttpPool)
+    with _http_settings.lock:
+        _http_settings.set({**_http_settings.value, **dict.fromkeys(pools, settings)})
+    for p in pools:
+        close_http_client(p)
+
+
+def get_http_client(pool: HttpPool = HttpPool.api) -> httpx.Client:
+    """
+    Simple global, lazily initialized `httpx.Client` for the given pool.
     Can be shared across threads.
     """
-    with _http_client.lock:
-        client = _http_client.value
+    with _http_clients.lock:
+        client = _http_clients.value.get(pool)
         if client is None or client.is_closed:
-            client = httpx.Client(**default_client_settings)
-            _http_client.set(client)
+            client = httpx.Client(**get_http_settings(pool).client_kwargs())
+            _http_clients.set({**_http_clients.value, pool: client})
         return client
 
 
-def close_http_client() -> None:
+def close_http_client(pool: HttpPool | None = None) -> None:
     """
-    Idempotent close of global `httpx.Client`.
+    Idempotent close of the global `httpx.Client` for a pool (or all pools).
     """
-    with _http_client.lock:
-        client = _http_client.value
-        if client is not None and not client.is_closed:
-            client.close()
-            _http_client.set(None)
+    with _http_clients.lock:
+        clients = dict(_http_clients.value)
+        for p in [pool] if pool else list(clients):
+            client = clients.pop(p, None)
+            if client is not None and not client.is_closed:
+                client.close()
+        _http_clients.set(clients)
 
 
 atexit.register(close_http_client)
+
+
+def new_async_http_client(pool: HttpPool = HttpPool.api) -> httpx.AsyncClient:
+    """
+    New `httpx.AsyncClient` with the settings for the given pool. Unlike the sync
+    clients these aren't globals, since async clients are bound to the event loop
+    they're used on. Use it as an async context manager and share it across
+    concurrent calls.
+    """
+    return httpx.AsyncClient(**get_http_settings(pool).client_kwargs())
+
+
+## Tests
+
+
+def test_http_settings():
+    import os
+
+    os.environ[Env.TEXTPRESS_HTTP_MAX_CONNECTIONS.value] = "4"
+    os.environ[Env.TEXTPRESS_HTTP_READ_TIMEOUT.value] = "2.5"
+    try:
+        settings = http_settings_from_env()
+    finally:
+        del os.environ[Env.TEXTPRESS_HTTP_MAX_CONNECTIONS.value]
+        del os.environ[Env.TEXTPRESS_HTTP_READ_TIMEOUT.value]
+    assert settings == HttpSettings(max_connections=4, read_timeout=2.5)
+
+    configure_http(settings, HttpPool.storage, max_connections=2)
+    try:
+        assert get_http_settings(HttpPool.storage).max_connections == 2
+        assert get_http_settings(HttpPool.api) == HttpSettings()
+        assert get_http_client(HttpPool.api) is not get_http_client(HttpPool.storage)
+    finally:
+        with _http_settings.lock:
+            _http_settings.set({})
+        close_http_client()
+
+    os.environ[Env.TEXTPRESS_HTTP_MAX_CONNECTIONS.value] = "4.5"
+    try:
+        http_settings_from_env()
+        raise AssertionError("Expected a ValueError")
+    except ValueError as e:
+        assert "whole number" in str(e)
+    finally:
+        del os.environ[Env.TEXTPRESS_HTTP_MAX_CONNECTIONS.value]
@@ -0,0 +1,436 @@
+"""
+Resumable multipart uploads for large files (like recordings or big PDFs in
+sidematter assets).
+
+A file is split into fixed-size parts, each uploaded in parallel to its own
+presigned URL with a per-part Content-MD5. Completed parts are recorded in a
+small JSON resume record, so after a failure (or in a later run) only the parts
+that didn't make it are sent again. Once all parts are up, the server assembles
+them into the same staged object a single presigned PUT would have produced, so
+the normal commit applies.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from httpx import HTTPStatusError
+from pydantic import BaseModel, ConfigDict, Field
+from strif import atomic_output_file, hash_string
+
+from textpress.api.textpress_api import (
+    UPLOAD_CHUNK_SIZE,
+    PresignUploadInfo,
+    Route,
+    UploadError,
+)
+from textpress.api.textpress_env import ApiConfig
+
+if TYPE_CHECKING:
+    from httpx import Client
+
+log = logging.getLogger(__name__)
+
+# Debug logging for API calls.
+log_api = log.debug
+
+
+class MultipartUnsupported(RuntimeError):
+    """
+    The server doesn't offer multipart uploads, so the file should be uploaded whole.
+    """
+
+
+class PartNotPresigned(RuntimeError):
+    """
+    The server left a part out of its presign response.
+    """
+
+
+@dataclass(frozen=True)
+class MultipartSettings:
+    threshold: int = 64 * 1024 * 1024
+    """Files at least this large are uploaded in parts."""
+
+    part_size: int = 16 * 1024 * 1024
+    """Bytes per part (storage backends generally require at least 5 MB)."""
+
+    part_workers: int = 4
+    """Parts uploaded concurrently per file."""
+
+    part_retries: int = 2
+    """Extra attempts for failed parts within one run, before giving up."""
+
+    resume_dir: Path | None = None
+    """Where resume records are kept. If None, uploads can't resume across runs."""
+
+
+class _Model(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)  # pyright: ignore
+
+
+class MultipartStartRequest(_Model):
+    path: str
+    md5: str
+    content_type: str = Field(..., alias="contentType")
+    content_encoding: str | None = Field(None, alias="contentEncoding")
+    cache_control: str | None = Field(None, alias="cacheControl")
+    size: int
+    part_size: int = Field(..., alias="partSize")
+
+
+class MultipartStartResponse(_Model):
+    upload_id: str = Field(..., alias="uploadId")
+    part_size: int = Field(..., alias="partSize")
+
+
+class PartChecksum(_Model):
+    part_number: int = Field(..., alias="partNumber")
+    md5: str
+    size: int
+
+
+class PresignPartsRequest(_Model):
+    upload_id: str = Field(..., alias="uploadId")
+    path: str
+    parts: list[PartChecksum]
+
+
+class PresignedPart(_Model):
+    part_number: int = Field(..., alias="partNumber")
+    url: str
+    headers: dict[str, str]
+
+
+class PresignPartsResponse(_Model):
+    parts: list[PresignedPart]
+
+
+class CompletedPart(_Model):
+    part_number: int = Field(..., alias="partNumber")
+    etag: str
+
+
+class MultipartCompleteRequest(_Model):
+    upload_id: str = Field(..., alias="uploadId")
+    path: str
+    parts: list[CompletedPart]
+
+
+@dataclass
+class ResumeRecord:
+    """
+    Local record of a multipart upload in progress. Parts maps part number
+    (as a string, for JSON) to its MD5 hex and ETag.
+    """
+
+    upload_id: str
+    path: str
+    md5: str
+    size: int
+    part_size: int
+    parts: dict[str, dict[str, str]] = field(default_factory=dict)
+
+
+def _resume_record_path(settings: MultipartSettings, upload_path: str, md5: str) -> Path | None:
+    if not settings.resume_dir:
+        return None
+    return settings.resume_dir / f"{hash_string(f'{upload_path}:{md5}', 'sha1').hex}.json"
+
+
+def _load_resume_record(record_path: Path | None, md5: str, size: int) -> ResumeRecord | None:
+    if not record_path or not record_path.exists():
+        return None
+    try:
+        record = ResumeRecord(**json.loads(record_path.read_text()))
+    except (ValueError, TypeError) as e:
+        log.warning("Ignoring unreadable resume record: %s: %s", record_path, e)
+        return None
+    if record.md5 != md5 or record.size != size:
+        return None
+    return record
+
+
+def _save_resume_record(record_path: Path | None, record: ResumeRecord) -> None:
+    if record_path:
+        with atomic_output_file(record_path, make_parents=True) as tmp_path:
+            Path(tmp_path).write_text(json.dumps(asdict(record)))
+
+
+def iter_file_range(
+    file_path: Path, offset: int, length: int, chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Stream `length` bytes of a file starting at `offset`.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+MAX_CACHED_PART_CHECKSUMS = 256
+"""Files whose part checksums are kept in memory between hashing and uploading."""
+
+_part_checksums: dict[tuple[str, int, int, int], list[PartChecksum]] = {}
+_part_checksums_lock = threading.Lock()
+
+
+def _part_checksums_key(file_path: Path, stat: os.stat_result, part_size: int):
+    return (str(file_path.resolve()), stat.st_size, stat.st_mtime_ns, part_size)
+
+
+def hash_file_parts(file_path: Path, part_size: int) -> str:
+    """
+    MD5 hex of the whole file, computing the MD5 of each part in the same
+    pass. The part checksums are kept for `part_checksums`, so a multipart
+    upload doesn't read the file again to hash it.
+    """
+    stat = file_path.stat()
+    whole = hashlib.md5()
+    checksums: list[PartChecksum] = []
+    with open(file_path, "rb") as f:
+        for number, offset in enumerate(range(0, stat.st_size, part_size), start=1):
+            length = min(part_size, stat.st_size - offset)
+            md5 = hashlib.md5()
+            remaining = length
+            while remaining > 0 and (chunk := f.read(min(UPLOAD_CHUNK_SIZE, remaining))):
+                remaining -= len(chunk)
+                md5.update(chunk)
+                whole.update(chunk)
+            checksums.append(PartChecksum(partNumber=number, md5=md5.hexdigest(), size=length))
+    with _part_checksums_lock:
+        if len(_part_checksums) >= MAX_CACHED_PART_CHECKSUMS:
+            _part_checksums.pop(next(iter(_part_checksums)))
+        _part_checksums[_part_checksums_key(file_path, stat, part_size)] = checksums
+    return whole.hexdigest()
+
+
+def part_checksums(file_path: Path, part_size: int) -> list[PartChecksum]:
+    """
+    MD5 of each part, from `hash_file_parts` if the file was hashed with the
+    same part size and hasn't changed since, or else computed in one pass.
+    """
+    key = _part_checksums_key(file_path, file_path.stat(), part_size)
+    with _part_checksums_lock:
+        checksums = _part_checksums.get(key)
+    if checksums is None:
+        hash_file_parts(file_path, part_size)
+        with _part_checksums_lock:
+            checksums = _part_checksums[key]
+    return checksums
+
+
+def _upload_part(
+    client: Client, file_path: Path, part: PartChecksum, part_size: int, presigned: PresignedPart
+) -> str:
+    headers = {
+        **presigned.headers,
+        "Content-MD5": base64.b64encode(bytes.fromhex(part.md5)).decode(),
+        "Content-Length": str(part.size),
+    }
+    offset = (part.part_number - 1) * part_size
+    log_api(">> upload_part: %s - part %s", presigned.url, part.part_number)
+    response = client.put(
+        presigned.url, headers=headers, content=iter_file_range(file_path, offset, part.size)
+    )
+    response.raise_for_status()
+    return response.headers.get("ETag", part.md5)
+
+
+def _is_client_error(e: HTTPStatusError) -> bool:
+    return 400 <= e.response.status_code < 500
+
+
+def _start_upload(
+    config: ApiConfig,
+    file_path: Path,
+    upload_info: PresignUploadInfo,
+    md5: str,
+    settings: MultipartSettings,
+) -> ResumeRecord:
+    """
+    Start a new multipart upload. A client error (like a 404 from a server
+    without multipart routes) raises `MultipartUnsupported`, so the file is
+    uploaded whole instead.
+    """
+    size = file_path.stat().st_size
+    start_req = MultipartStartRequest(
+        path=upload_info.path,
+        md5=md5,
+        contentType=upload_info.headers["Content-Type"],
+        contentEncoding=upload_info.headers.get("Content-Encoding"),
+        cacheControl=upload_info.headers.get("Cache-Control"),
+        size=size,
+        partSize=settings.part_size,
+    )
+    try:
+        response = Route.sync_multipart_start.post(
+            config, start_req.model_dump(by_alias=True, exclude_none=True)
+        )
+    except HTTPStatusError as e:
+        if _is_client_error(e):
+            raise MultipartUnsupported(upload_info.path) from e
+        raise
+    start = MultipartStartResponse.model_validate(response.json())
+    return ResumeRecord(
+        upload_id=start.upload_id,
+        path=upload_info.path,
+        md5=md5,
+        size=size,
+        part_size=start.part_size,
+    )
+
+
+def upload_file_multipart(
+    config: ApiConfig,
+    client: Client,
+    file_path: Path,
+    upload_info: PresignUploadInfo,
+    settings: MultipartSettings,
+) -> None:
+    """
+    Upload a large file in parts, resuming from a previous attempt if a resume
+    record matches. Raises `UploadError` (keyed by part) if any part still fails
+    after retries; the resume record is kept so a rerun only sends those parts.
+    """
+    md5 = base64.b64decode(upload_info.headers["Content-MD5"]).hex()
+    size = file_path.stat().st_size
+    record_path = _resume_record_path(settings, upload_info.path, md5)
+
+    record = _load_resume_record(record_path, md5, size)
+    resumed = record is not None
+    if record:
+        log.info(
+            "Resuming upload of %s (%s parts already uploaded)",
+            upload_info.path,
+            len(record.parts),
+        )
+    else:
+        record = _start_upload(config, file_path, upload_info, md5, settings)
+        _save_resume_record(record_path, record)
+
+    checksums = part_checksums(file_path, record.part_size)
+    # A part is done only if it was uploaded with the same checksum.
+    remaining = [
+        part
+        for part in checksums
+        if record.parts.get(str(part.part_number), {}).get("md5") != part.md5
+    ]
+
+    lock = threading.Lock()
+    failures: dict[str, Exception] = {}
+    for attempt in range(settings.part_retries + 1):
+        if not remaining:
+            break
+        if attempt:
+            log.warning(
+                "Retrying %s failed parts of %s (attempt %s)",
+                len(remaining),
+                upload_info.path,
+                attempt + 1,
+            )
+        presign_req = PresignPartsRequest(
+            uploadId=record.upload_id, path=upload_info.path, parts=remaining
+        )
+        try:
+            response = Route.sync_multipart_presign.post(
+                config, presign_req.model_dump(by_alias=True, exclude_none=True)
+            )
+        except HTTPStatusError as e:
+            if not (resumed and _is_client_error(e)):
+                raise
+            # The server no longer knows the upload we were resuming (it may
+            # have expired), so drop the record and start over.
+            log.warning(
+                "Can't resume upload of %s (status %s), starting again",
+                upload_info.path,
+                e.response.status_code,
+            )
+            if record_path:
+                record_path.unlink(missing_ok=True)
+            resumed = False
+            record = _start_upload(config, file_path, upload_info, md5, settings)
+            _save_resume_record(record_path, record)
+            checksums = part_checksums(file_path, record.part_size)
+            presign_req = PresignPartsRequest(
+                uploadId=record.upload_id, path=upload_info.path, parts=checksums
+            )
+            response = Route.sync_multipart_presign.post(
+                config, presign_req.model_dump(by_alias=True, exclude_none=True)
+            )
+            remaining = checksums
+        presigned = {
+            p.part_number: p for p in PresignPartsResponse.model_validate(response.json()).parts
+        }
+
+        failures = {}
+        failed_parts: list[PartChecksum] = []
+        for part in remaining:
+            if part.part_number not in presigned:
+                failures[f"{upload_info.path}#part{part.part_number}"] = PartNotPresigned(
+                    f"Part {part.part_number} of {upload_info.path} was not presigned"
+                )
+                failed_parts.append(part)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(settings.part_workers, len(remaining))),
+            thread_name_prefix="tp-part",
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _upload_part,
+                    client,
+                    file_path,
+                    part,
+                    record.part_size,
+                    presigned[part.part_number],
+                ): part
+                for part in remaining
+                if part.part_number in presigned
+            }
+            for future in as_completed(futures):
+                part = futures[future]
+                try:
+                    etag = future.result()
+                except Exception as e:
+                    failures[f"{upload_info.path}#part{part.part_number}"] = e
+                    failed_parts.append(part)
+                    continue
+                with lock:
+                    record.parts[str(part.part_number)] = {"md5": part.md5, "etag": etag}
+                    _save_resume_record(record_path, record)
+        remaining = sorted(failed_parts, key=lambda p: p.part_number)
+
+    if remaining:
+        raise UploadError(failures)
+
+    complete_req = MultipartCompleteRequest(
+        uploadId=record.upload_id,
+        path=upload_info.path,
+        parts=[
+            CompletedPart(
+                partNumber=part.part_number, etag=record.parts[str(part.part_number)]["etag"]
+            )
+            for part in checksums
+        ],
+    )
+    Route.sync_multipart_complete.post(
+        config, complete_req.model_dump(by_alias=True, exclude_none=True)
+    )
+    if record_path:
+        record_path.unlink(missing_ok=True)
@@ -0,0 +1,159 @@
+"""
+Precompressed variants of published files, so compression happens once, when
+a document is formatted, rather than on every publish or every request.
+
+Variants are written alongside the original (`page.html` -> `page.html.br`,
+`page.html.gz`) and are deterministic (no timestamps or filenames embedded),
+so unchanged content keeps the same MD5 and isn't re-uploaded. Each variant is
+given the original's mtime, and is only used while the two still match.
+"""
+
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+from importlib.util import find_spec
+from pathlib import Path
+
+from strif import atomic_output_file
+
+from textpress.spans import span
+
+log = logging.getLogger(__name__)
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+"""Content-Encoding values and their file suffixes, in order of preference."""
+
+MIN_PRECOMPRESS_SIZE = 512
+"""Files smaller than this aren't worth compressing."""
+
+
+def available_encodings() -> list[str]:
+    """
+    Encodings we can produce. Brotli needs the optional `brotli` package.
+    """
+    return [enc for enc in ENCODING_SUFFIXES if enc != "br" or find_spec("brotli")]
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime=0 and no filename keep the output identical for identical input.
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    elif encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=11)
+    else:
+        raise ValueError(f"Unsupported encoding: {encoding!r}")
+
+
+def variant_path(path: Path, encoding: str) -> Path:
+    return path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+
+
+def _is_current(out_path: Path, stat: os.stat_result) -> bool:
+    return out_path.is_file() and out_path.stat().st_mtime_ns == stat.st_mtime_ns
+
+
+def precompress_file(path: Path, encodings: list[str] | None = None) -> dict[str, Path]:
+    """
+    Write compressed variants of a file next to it, skipping any already up to
+    date and any that wouldn't be smaller than the original. Stale variants are
+    removed. Returns the current variants by encoding.
+    """
+    if encodings is None:
+        encodings = available_encodings()
+
+    stat = path.stat()
+    variants: dict[str, Path] = {}
+    data: bytes | None = None
+    for encoding in encodings:
+        out_path = variant_path(path, encoding)
+        if _is_current(out_path, stat):
+            variants[encoding] = out_path
+            continue
+        out_path.unlink(missing_ok=True)
+        if stat.st_size < MIN_PRECOMPRESS_SIZE:
+            continue
+        if data is None:
+            data = path.read_bytes()
+        with span("compress", encoding=encoding, bytes=len(data)):
+            compressed = _compress(data, encoding)
+        if len(compressed) >= len(data):
+            continue
+        with atomic_output_file(out_path) as tmp_path:
+            Path(tmp_path).write_bytes(compressed)
+        os.utime(out_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        variants[encoding] = out_path
+
+    log.info(
+        "Precompressed %s: %s",
+        path,
+        ", ".join(f"{enc} {p.stat().st_size} bytes" for enc, p in variants.items()) or "skipped",
+    )
+    return variants
+
+
+def precompressed_variant(path: Path) -> tuple[Path, str] | None:
+    """
+    The preferred up-to-date compressed variant of a file and its Content-Encoding,
+    if one exists.
+    """
+    stat = path.stat()
+    for encoding in ENCODING_SUFFIXES:
+        out_path = variant_path(path, encoding)
+        if _is_current(out_path, stat):
+            return out_path, encoding
+    return None
+
+
+def precompressed_uploads(
+    files_with_paths: list[tuple[Path, str]],
+) -> tuple[list[tuple[Path, str]], dict[str, str]]:
+    """
+    Swap in precompressed variants where available. Returns the files to upload
+    and the Content-Encoding for each upload path that uses a variant.
+    """
+    resolved: list[tuple[Path, str]] = []
+    encodings: dict[str, str] = {}
+    for file_path, upload_path in files_with_paths:
+        variant = precompressed_variant(file_path)
+        if variant:
+            file_path, encodings[upload_path] = variant
+        resolved.append((file_path, upload_path))
+    return resolved, encodings
+
+
+## Tests
+
+
+def test_precompress_file():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "page.html"
+        path.write_text("<p>Hello, world!</p>\n" * 200)
+
+        variants = precompress_file(path, ["gzip"])
+        assert list(variants) == ["gzip"]
+        assert gzip.decompress(variants["gzip"].read_bytes()) == path.read_bytes()
+
+        # Deterministic, and not rewritten while up to date.
+        first = variants["gzip"].read_bytes()
+        mtime_ns = variants["gzip"].stat().st_mtime_ns
+        assert precompress_file(path, ["gzip"]) == variants
+        assert variants["gzip"].stat().st_mtime_ns == mtime_ns
+        variants["gzip"].unlink()
+        assert precompress_file(path, ["gzip"])["gzip"].read_bytes() == first
+
+        assert precompressed_uploads([(path, "page.html")]) == (
+            [(variant_path(path, "gzip"), "page.html")],
+            {"page.html": "gzip"},
+        )
+
+        # Small files are left alone, and stale variants are removed.
+        path.write_text("tiny")
+        os.utime(path, ns=(0, mtime_ns + 1))
+        assert precompress_file(path, ["gzip"]) == {}
+        assert precompressed_variant(path) is None
@@ -2,6 +2,11 @@ from __future__ import annotations
 
 import base64
 import logging
+import random
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
@@ -12,9 +17,14 @@ from strif import hash_file
 from typing_extensions import override
 
 from textpress.api.textpress_env import ApiConfig, get_api_config
+from textpress.spans import span
 
 if TYPE_CHECKING:
-    from httpx import Client, Response
+    from httpx import AsyncClient, Client, Response
+
+    from textpress.api.api_cache import ApiCache
+    from textpress.api.file_metadata_cache import FileMetadataCache
+    from textpress.api.multipart_upload import MultipartSettings
 
 log = logging.getLogger(__name__)
 
@@ -23,6 +33,34 @@ log = logging.getLogger(__name__)
 log_api = log.debug
 
 
+DEFAULT_UPLOAD_WORKERS = 8
+"""
+Default number of concurrent uploads. Uploads go to presigned storage URLs so
+this is mostly bounded by bandwidth, not by the API server.
+"""
+
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+"""Read size when streaming file contents in request bodies."""
+
+
+class UploadError(RuntimeError):
+    """
+    One or more uploads to presigned URLs failed. Nothing is committed when this
+    is raised, so the published manifest is unchanged and it's safe to retry.
+    """
+
+    def __init__(self, failures: dict[str, Exception]):
+        self.failures: dict[str, Exception] = failures
+        """Maps upload path to the error for that upload."""
+
+        details = "; ".join(f"{path}: {e}" for path, e in failures.items())
+        super().__init__(f"{len(failures)} upload(s) failed: {details}")
+
+
+NOT_MODIFIED = 304
+
+
 class Route(Enum):
     """
     Textpress API routes.
@@ -32,6 +70,9 @@ class Route(Enum):
     sync_manifest = "/api/sync/manifest"
     sync_presign_batch = "/api/sync/presign-batch"
     sync_commit = "/api/sync/commit"
+    sync_multipart_start = "/api/sync/multipart/start"
+    sync_multipart_presign = "/api/sync/multipart/presign-parts"
+    sync_multipart_complete = "/api/sync/multipart/complete"
 
     def _route_url(self, api_root: str) -> str:
         return f"{api_root}{self.value}"
@@ -40,17 +81,33 @@ class Route(Enum):
     def __str__(self):
         return self.value
 
-    def get(self, config: ApiConfig, params: dict[str, Any] | None = None) -> Response:
+    def _headers(self, config: ApiConfig, json: bool = False) -> dict[str, str]:
+        headers = {"x-api-key": config.api_key}
+        if json:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+    def get(
+        self,
+        config: ApiConfig,
+        params: dict[str, Any] | None = None,
+        extra_headers: dict[str, str] | None = None,
+    ) -> Response:
+        """
+        GET the route. With conditional `extra_headers` (like `If-None-Match`),
+        a 304 Not Modified response is returned for the caller to handle.
+        """
         from textpress.api.http_client import get_http_client
 
         client = get_http_client()
         url = self._route_url(config.api_root)
-        headers = {"x-api-key": config.api_key}
+        headers = {**self._headers(config), **(extra_headers or {})}
         log_api(">> GET %s - headers: %s - params: %s", url, headers, params)
         response = client.get(url, headers=headers, params=params)
         log_api("<< GET %s - response: %s", url, response)
 
-        response.raise_for_status()
+        if response.status_code != NOT_MODIFIED:
+            response.raise_for_status()
         return response
 
     def post(self, config: ApiConfig, json_data: dict[str, Any]) -> Response:
@@ -58,10 +115,7 @@ class Route(Enum):
 
         client = get_http_client()
         url = self._route_url(config.api_root)
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": config.api_key,
-        }
+        headers = self._headers(config, json=True)
         log_api(">> POST %s - headers: %s - json: %s", url, headers, json_data)
         response = client.post(url, headers=headers, json=json_data)
         log_api("<< POST %s - response: %s", url, response)
@@ -69,6 +123,37 @@ class Route(Enum):
         response.raise_for_status()
         return response
 
+    async def aget(
+        self,
+        client: AsyncClient,
+        config: ApiConfig,
+        params: dict[str, Any] | None = None,
+        extra_headers: dict[str, str] | None = None,
+    ) -> Response:
+        """Async version of `get`, using the given client."""
+        url = self._route_url(config.api_root)
+        headers = {**self._headers(config), **(extra_headers or {})}
+        log_api(">> GET %s - headers: %s - params: %s", url, headers, params)
+        response = await client.get(url, headers=headers, params=params)
+        log_api("<< GET %s - response: %s", url, response)
+
+        if response.status_code != NOT_MODIFIED:
+            response.raise_for_status()
+        return response
+
+    async def apost(
+        self, client: AsyncClient, config: ApiConfig, json_data: dict[str, Any]
+    ) -> Response:
+        """Async version of `post`, using the given client."""
+        url = self._route_url(config.api_root)
+        headers = self._headers(config, json=True)
+        log_api(">> POST %s - headers: %s - json: %s", url, headers, json_data)
+        response = await client.post(url, headers=headers, json=json_data)
+        log_api("<< POST %s - response: %s", url, response)
+
+        response.raise_for_status()
+        return response
+
 
 class UserProfileResponse(BaseModel):
     # TODO: Be consistent in api on snake_case vs camelCase.
@@ -78,12 +163,34 @@ class UserProfileResponse(BaseModel):
     username: str
 
 
+SHARED_ASSETS_DIR = "_shared"
+"""
+Upload directory for content-hashed assets shared by many pages. A file here
+never changes once published, so it can be cached indefinitely.
+"""
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def cache_control_for(upload_path: str) -> str | None:
+    """
+    Cache-Control to request for an upload, if not the server's default.
+    """
+    if upload_path.startswith(f"{SHARED_ASSETS_DIR}/"):
+        return IMMUTABLE_CACHE_CONTROL
+    return None
+
+
 class UploadFileMetadata(BaseModel):
     """Metadata for a file to be uploaded."""
 
     path: str
     md5: str
     content_type: str = Field(..., alias="contentType")
+    content_encoding: str | None = Field(None, alias="contentEncoding")
+    """Set (e.g. "gzip" or "br") if the uploaded bytes are precompressed."""
+    cache_control: str | None = Field(None, alias="cacheControl")
+    """Set to override the default Cache-Control the file is served with."""
 
 
 class DeleteFileMetadata(BaseModel):
@@ -129,20 +236,193 @@ class ManifestResponse(BaseModel):
     """Maps file path to MD5 hash."""
 
 
-def get_manifest(config: ApiConfig) -> ManifestResponse:
+@dataclass(frozen=True)
+class PublishResult:
     """
-    Fetch the current manifest from the Textpress API.
+    Result of `publish_files`: the resulting manifest and which paths were
+    actually uploaded or deleted versus skipped as already up to date.
     """
-    response = Route.sync_manifest.get(config)
-    return ManifestResponse.model_validate(response.json())
 
+    manifest: ManifestResponse
+    uploaded: list[str]
+    unchanged: list[str]
+    deleted: list[str]
+    retries: int = 0
+    """Number of times we rebased after a version conflict with another publisher."""
+
+    def summary(self) -> str:
+        summary = f"{len(self.unchanged)} unchanged, {len(self.uploaded)} uploaded"
+        if self.deleted:
+            summary += f", {len(self.deleted)} deleted"
+        if self.retries:
+            summary += f", {self.retries} conflict retries"
+        return summary
+
+
+CONFLICT_STATUS_CODES = (409, 412)
+"""Statuses the API uses when `baseVersion` is no longer the current manifest version."""
+
+DEFAULT_CONFLICT_RETRIES = 5
+
+CONFLICT_RETRY_BASE_DELAY = 0.25
+CONFLICT_RETRY_MAX_DELAY = 8.0
+
+
+def is_version_conflict(e: BaseException) -> bool:
+    from httpx import HTTPStatusError
+
+    return isinstance(e, HTTPStatusError) and e.response.status_code in CONFLICT_STATUS_CODES
 
-def get_user(config: ApiConfig) -> UserProfileResponse:
+
+def conflict_retry_delay(retry: int) -> float:
+    """
+    Exponential backoff with jitter, so concurrent publishers that collided don't
+    retry in lockstep.
+    """
+    delay = min(CONFLICT_RETRY_MAX_DELAY, CONFLICT_RETRY_BASE_DELAY * 2 ** (retry - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+@dataclass(frozen=True)
+class Rebase:
     """
-    Fetch the user profile from the Textpress API.
+    How pending uploads relate to a newer manifest after a version conflict.
     """
-    response = Route.user.get(config)
-    return UserProfileResponse.model_validate(response.json())
+
+    already_current: list[str]
+    """Paths where the latest manifest already has our content, so can be skipped."""
+
+    conflicting: list[str]
+    """Paths someone else changed since our base version, which must be re-presigned."""
+
+
+def rebase_uploads(
+    base: ManifestResponse, latest: ManifestResponse, pending: list[UploadFileMetadata]
+) -> Rebase:
+    already_current: list[str] = []
+    conflicting: list[str] = []
+    for upload in pending:
+        latest_md5 = latest.files.get(upload.path)
+        if latest_md5 == upload.md5:
+            already_current.append(upload.path)
+        elif base.files.get(upload.path) != latest_md5:
+            conflicting.append(upload.path)
+    return Rebase(already_current=already_current, conflicting=conflicting)
+
+
+def manifest_request_headers(config: ApiConfig, api_cache: ApiCache | None) -> dict[str, str]:
+    cached = api_cache and api_cache.manifest(config)
+    return {"If-None-Match": cached.etag} if cached else {}
+
+
+def manifest_from_response(
+    config: ApiConfig, response: Response, api_cache: ApiCache | None
+) -> ManifestResponse:
+    """
+    The manifest from a (possibly conditional) manifest response, caching it
+    by ETag if the server sent one.
+    """
+    cached = api_cache and api_cache.manifest(config)
+    if response.status_code == NOT_MODIFIED and cached:
+        log_api("<< manifest not modified, using cached: %s", cached.etag)
+        return ManifestResponse.model_validate(cached.data)
+    data = response.json()
+    etag = response.headers.get("ETag")
+    if api_cache and etag:
+        api_cache.put_manifest(config, etag, data)
+    return ManifestResponse.model_validate(data)
+
+
+def user_from_response(
+    config: ApiConfig, response: Response, api_cache: ApiCache | None
+) -> UserProfileResponse:
+    data = response.json()
+    if api_cache:
+        api_cache.put_user_profile(config, data)
+    return UserProfileResponse.model_validate(data)
+
+
+def get_manifest(config: ApiConfig, api_cache: ApiCache | None = None) -> ManifestResponse:
+    """
+    Fetch the current manifest from the Textpress API. With `api_cache`, the
+    last manifest is revalidated by ETag rather than downloaded again.
+    """
+    with span("get_manifest") as s:
+        response = Route.sync_manifest.get(
+            config, extra_headers=manifest_request_headers(config, api_cache)
+        )
+        s.set(status=response.status_code, bytes=len(response.content))
+        return manifest_from_response(config, response, api_cache)
+
+
+def get_user(config: ApiConfig, api_cache: ApiCache | None = None) -> UserProfileResponse:
+    """
+    Fetch the user profile from the Textpress API, or from `api_cache` if it
+    was fetched recently.
+    """
+    cached = api_cache and api_cache.user_profile(config)
+    if cached:
+        return UserProfileResponse.model_validate(cached)
+    with span("get_user"):
+        return user_from_response(config, Route.user.get(config), api_cache)
+
+
+def file_upload_metadata(
+    file_path: Path,
+    upload_path: str,
+    metadata_cache: FileMetadataCache | None = None,
+    *,
+    content_encoding: str | None = None,
+    multipart: MultipartSettings | None = None,
+) -> UploadFileMetadata:
+    """
+    Compute the upload metadata (MD5 and content type) for a local file, using
+    `metadata_cache` if provided to skip rehashing unchanged files.
+
+    If `content_encoding` is given, `file_path` is a precompressed variant (like
+    `page.html.gz`): the MD5 is of the compressed bytes but the content type is
+    that of the original file alongside it.
+
+    If the file is large enough to be uploaded in parts per `multipart`, the
+    part checksums are computed in the same pass (see `hash_file_parts`).
+    """
+    from kash.utils.file_utils.file_formats_model import Format, detect_file_format
+
+    from textpress.api.file_metadata_cache import FileMetadata
+
+    if not file_path.is_file():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    cached = metadata_cache.get(file_path) if metadata_cache else None
+    if cached:
+        return UploadFileMetadata(
+            path=upload_path,
+            md5=cached.md5,
+            contentType=cached.content_type,
+            contentEncoding=content_encoding,
+            cacheControl=cache_control_for(upload_path),
+        )
+
+    stat = file_path.stat()
+    original_path = file_path.with_suffix("") if content_encoding else file_path
+    format = detect_file_format(original_path) or Format.binary
+    mime = format.mime_type or "application/octet-stream"
+    with span("hash_file", path=upload_path, bytes=stat.st_size):
+        if multipart and stat.st_size >= multipart.threshold:
+            from textpress.api.multipart_upload import hash_file_parts
+
+            md5 = hash_file_parts(file_path, multipart.part_size)
+        else:
+            md5 = hash_file(file_path, "md5").hex  # API expects hex
+    if metadata_cache:
+        metadata_cache.put(file_path, FileMetadata(md5=md5, content_type=mime), stat)
+    return UploadFileMetadata(
+        path=upload_path,
+        md5=md5,
+        contentType=mime,
+        contentEncoding=content_encoding,
+        cacheControl=cache_control_for(upload_path),
+    )
 
 
 def get_presigned_urls(
@@ -150,64 +430,190 @@ def get_presigned_urls(
     base_version: int,
     files_to_upload: list[tuple[Path, str]],
     files_to_delete: list[str] | None = None,
+    metadata_cache: FileMetadataCache | None = None,
 ) -> PresignResponse:
     """
     Gets presigned URLs for uploading files, preserving provided upload paths.
     """
-    from kash.utils.file_utils.file_formats_model import Format, detect_file_format
+    uploads_metadata = [
+        file_upload_metadata(file_path, upload_path, metadata_cache)
+        for file_path, upload_path in files_to_upload
+    ]
+    return presign_uploads(config, base_version, uploads_metadata, files_to_delete)
+
 
+def presign_request(
+    base_version: int,
+    uploads_metadata: list[UploadFileMetadata],
+    files_to_delete: list[str] | None = None,
+) -> PresignRequest:
     if files_to_delete is None:
         files_to_delete = []
 
-    uploads_metadata: list[UploadFileMetadata] = []
     delete_metadata: list[DeleteFileMetadata] = []
-
-    for file_path, upload_path in files_to_upload:
-        if not file_path.is_file():
-            raise FileNotFoundError(f"File not found: {file_path}")
-        format = detect_file_format(file_path) or Format.binary
-        mime = format.mime_type or "application/octet-stream"
-        md5 = hash_file(file_path, "md5").hex  # API expects hex
-        uploads_metadata.append(UploadFileMetadata(path=upload_path, md5=md5, contentType=mime))
-
     for file_path_str in files_to_delete:
         delete_metadata.append(DeleteFileMetadata(path=file_path_str))
 
-    presign_req = PresignRequest(
+    return PresignRequest(
         baseVersion=base_version,
         uploads=uploads_metadata,
         delete=delete_metadata,
     )
 
+
+def presign_uploads(
+    config: ApiConfig,
+    base_version: int,
+    uploads_metadata: list[UploadFileMetadata],
+    files_to_delete: list[str] | None = None,
+) -> PresignResponse:
+    """
+    Gets presigned URLs for uploads whose metadata has already been computed.
+    """
+    presign_req = presign_request(base_version, uploads_metadata, files_to_delete)
     request_data_json = presign_req.model_dump(by_alias=True, exclude_none=True)
-    response = Route.sync_presign_batch.post(config=config, json_data=request_data_json)
+    with span("presign", uploads=len(uploads_metadata), deletes=len(presign_req.delete)):
+        response = Route.sync_presign_batch.post(config=config, json_data=request_data_json)
     return PresignResponse.model_validate(response.json())
 
 
+def changed_uploads(
+    manifest: ManifestResponse, uploads_metadata: list[UploadFileMetadata]
+) -> tuple[list[UploadFileMetadata], list[str]]:
+    """
+    Diff local upload metadata against the manifest. Returns the uploads whose
+    MD5 differs from (or is missing in) the manifest and the paths that are unchanged.
+    """
+    changed: list[UploadFileMetadata] = []
+    unchanged: list[str] = []
+    for upload in uploads_metadata:
+        if manifest.files.get(upload.path) == upload.md5:
+            unchanged.append(upload.path)
+        else:
+            changed.append(upload)
+    return changed, unchanged
+
+
+def iter_file_chunks(file_path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a file in fixed-size chunks, so request bodies can be streamed.
+    """
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
 def upload_file(client: Client, file_path: Path, upload_info: dict[str, Any]) -> None:
     """
     Uploads a single file using the presigned URL and headers.
+
+    The body is streamed from disk so memory use stays flat regardless of file size.
+    Presigned storage URLs generally don't accept chunked transfer encoding, so we
+    always send an explicit Content-Length.
     """
     url: str = upload_info["url"]
-    headers: dict[str, str] = upload_info["headers"]
+    size = file_path.stat().st_size
+    headers: dict[str, str] = {**upload_info["headers"], "Content-Length": str(size)}
 
     log_api(">> upload_file: %s - %s", url, headers)
-    with open(file_path, "rb") as f:
-        content = f.read()
-        # httpx handles Content-Length automatically
-        response = client.put(url, headers=headers, content=content)
+    with span("upload_file", path=upload_info.get("path", url), bytes=size):
+        response = client.put(url, headers=headers, content=iter_file_chunks(file_path))
     response.raise_for_status()
 
 
-def sync_commit(
-    config: ApiConfig,
+def presigned_uploads(
+    files_with_paths: list[tuple[Path, str]],
+    changed_metadata: list[UploadFileMetadata],
+    presign_response: PresignResponse,
+) -> list[tuple[Path, PresignUploadInfo]]:
+    """
+    Pair local files with their presigned upload info. Files the server left out
+    of the presign response are skipped (the server considers them up to date).
+    """
+    upload_info_map = {info.path: info for info in presign_response.uploads}
+    changed_paths = {upload.path for upload in changed_metadata}
+
+    uploads: list[tuple[Path, PresignUploadInfo]] = []
+    for file_path, upload_path in files_with_paths:
+        if upload_path not in changed_paths:
+            continue
+        if upload_path in upload_info_map:
+            uploads.append((file_path, upload_info_map[upload_path]))
+        else:
+            log_api(
+                "File %s (%s) was requested for upload but not included in presign response (already up-to-date?)",
+                file_path,
+                upload_path,
+            )
+    return uploads
+
+
+def _upload_one(
+    client: Client,
+    file_path: Path,
+    info: PresignUploadInfo,
+    config: ApiConfig | None,
+    multipart: MultipartSettings | None,
+) -> None:
+    if config and multipart and file_path.stat().st_size >= multipart.threshold:
+        from textpress.api.multipart_upload import MultipartUnsupported, upload_file_multipart
+
+        try:
+            with span("upload_file_multipart", path=info.path, bytes=file_path.stat().st_size):
+                upload_file_multipart(config, client, file_path, info, multipart)
+            return
+        except MultipartUnsupported:
+            log.info("Multipart uploads not supported by server, uploading whole: %s", info.path)
+    upload_file(client, file_path, info.model_dump())
+
+
+def upload_files(
+    client: Client,
+    uploads: list[tuple[Path, PresignUploadInfo]],
+    max_workers: int = DEFAULT_UPLOAD_WORKERS,
+    *,
+    config: ApiConfig | None = None,
+    multipart: MultipartSettings | None = None,
+) -> list[PresignUploadInfo]:
+    """
+    Uploads files to their presigned URLs with bounded concurrency.
+
+    If `config` and `multipart` are given, files at or above the multipart
+    threshold are uploaded in resumable parts instead of a single PUT.
+
+    Every upload is attempted even if some fail, so a single `UploadError` reports
+    all failures at once. Returns the upload infos in the order given.
+    """
+    if not uploads:
+        return []
+
+    failures: dict[str, Exception] = {}
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(uploads))), thread_name_prefix="tp-upload"
+    ) as executor:
+        futures = {
+            executor.submit(_upload_one, client, file_path, info, config, multipart): info
+            for file_path, info in uploads
+        }
+        for future in as_completed(futures):
+            info = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                log.warning("Upload failed: %s: %s", info.path, e)
+                failures[info.path] = e
+
+    if failures:
+        raise UploadError(failures)
+
+    return [info for _file_path, info in uploads]
+
+
+def commit_request(
     base_version: int,
     uploaded_files_details: list[PresignUploadInfo],
     files_to_delete_paths: list[str] | None = None,
-) -> ManifestResponse:
-    """
-    Commits the changes to the manifest.
-    """
+) -> CommitRequest:
     if files_to_delete_paths is None:
         files_to_delete_paths = []
 
@@ -221,6 +627,8 @@ def sync_commit(
                 path=info.path,
                 md5=md5_hex,
                 contentType=info.headers["Content-Type"],
+                contentEncoding=info.headers.get("Content-Encoding"),
+                cacheControl=info.headers.get("Cache-Control"),
             )
         )
 
@@ -228,57 +636,246 @@ def sync_commit(
         DeleteFileMetadata(path=p) for p in files_to_delete_paths
     ]
 
-    commit_req = CommitRequest(
-        baseVersion=base_version, uploads=uploads_metadata, delete=delete_metadata
-    )
+    return CommitRequest(baseVersion=base_version, uploads=uploads_metadata, delete=delete_metadata)
+
+
+def sync_commit(
+    config: ApiConfig,
+    base_version: int,
+    uploaded_files_details: list[PresignUploadInfo],
+    files_to_delete_paths: list[str] | None = None,
+) -> ManifestResponse:
+    """
+    Commits the changes to the manifest.
+    """
+    commit_req = commit_request(base_version, uploaded_files_details, files_to_delete_paths)
     request_data_json = commit_req.model_dump(by_alias=True, exclude_none=True)
 
-    response = Route.sync_commit.post(config=config, json_data=request_data_json)
+    with span("commit", uploads=len(commit_req.uploads), deletes=len(commit_req.delete)):
+        response = Route.sync_commit.post(config=config, json_data=request_data_json)
 
     return ManifestResponse.model_validate(response.json())
 
 
+class PublishState:
+    """
+    Progress of a publish: what's left to presign, upload, and commit against
+    which manifest version, and how to rebase after a version conflict. Both
+    `publish_files` (here and in `textpress_api_async`) step through this, so
+    they only differ in how they make the calls.
+    """
+
+    def __init__(
+        self,
+        manifest: ManifestResponse,
+        files_with_paths: list[tuple[Path, str]],
+        uploads_metadata: list[UploadFileMetadata],
+        delete_paths: list[str],
+        max_retries: int,
+    ):
+        self.manifest = manifest
+        self.files_with_paths = files_with_paths
+        self.pending, self.unchanged = changed_uploads(manifest, uploads_metadata)
+        self.delete_paths = [path for path in delete_paths if path in manifest.files]
+        self.to_presign = self.pending
+        self.uploaded: list[PresignUploadInfo] = []
+        self.retries = 0
+        self.max_retries = max_retries
+        log.info(
+            "Manifest v%s: %s unchanged, %s to upload, %s to delete",
+            manifest.version,
+            len(self.unchanged),
+            len(self.pending),
+            len(self.delete_paths),
+        )
+
+    @property
+    def up_to_date(self) -> bool:
+        """
+        True if there's nothing to upload or delete, so no presign or commit.
+        """
+        return not self.pending and not self.delete_paths
+
+    @property
+    def needs_presign(self) -> bool:
+        # A presign also registers deletes, so is needed even with no uploads.
+        return bool(self.to_presign) or not self.uploaded
+
+    def presigned(self, presign_response: PresignResponse) -> list[tuple[Path, PresignUploadInfo]]:
+        """
+        Uploads to make for a presign response. Files the server left out are
+        counted as unchanged.
+        """
+        uploads = presigned_uploads(self.files_with_paths, self.to_presign, presign_response)
+        presigned_paths = {info.path for _file_path, info in uploads}
+        skipped = [u.path for u in self.to_presign if u.path not in presigned_paths]
+        self.unchanged += skipped
+        self.pending = [u for u in self.pending if u.path not in skipped]
+        return uploads
+
+    def add_uploaded(self, uploaded: list[PresignUploadInfo]) -> None:
+        self.uploaded += uploaded
+        self.to_presign = []
+
+    def should_retry(self, e: BaseException) -> bool:
+        """
+        Whether to rebase and retry after this error. If so, counts the retry.
+        """
+        if not is_version_conflict(e) or self.retries >= self.max_retries:
+            return False
+        self.retries += 1
+        return True
+
+    def retry_delay(self) -> float:
+        return conflict_retry_delay(self.retries)
+
+    def rebase(self, latest: ManifestResponse) -> None:
+        """
+        Move onto a newer manifest: drop files it already has, and re-presign and
+        re-upload any that someone else changed.
+        """
+        rebase = rebase_uploads(self.manifest, latest, self.pending)
+        log.warning(
+            "Manifest changed (v%s -> v%s) while publishing, rebasing (retry %s/%s): "
+            "%s already current, %s conflicting",
+            self.manifest.version,
+            latest.version,
+            self.retries,
+            self.max_retries,
+            len(rebase.already_current),
+            len(rebase.conflicting),
+        )
+        redo = set(rebase.already_current) | set(rebase.conflicting)
+        self.unchanged += rebase.already_current
+        self.pending = [u for u in self.pending if u.path not in rebase.already_current]
+        self.uploaded = [info for info in self.uploaded if info.path not in redo]
+        uploaded_paths = {info.path for info in self.uploaded}
+        self.to_presign = [u for u in self.pending if u.path not in uploaded_paths]
+        self.delete_paths = [path for path in self.delete_paths if path in latest.files]
+        self.manifest = latest
+
+    def result(self, manifest: ManifestResponse | None = None) -> PublishResult:
+        """
+        The result, with the committed manifest, or else the current one if
+        already up to date.
+        """
+        if manifest is None:
+            return PublishResult(
+                manifest=self.manifest,
+                uploaded=[],
+                unchanged=self.unchanged,
+                deleted=[],
+                retries=self.retries,
+            )
+        return PublishResult(
+            manifest=manifest,
+            uploaded=[info.path for info in self.uploaded],
+            unchanged=self.unchanged,
+            deleted=self.delete_paths,
+            retries=self.retries,
+        )
+
+
 def publish_files(
-    files_with_paths: list[tuple[Path, str]], delete_paths: list[str] | None = None
-) -> ManifestResponse:
+    files_with_paths: list[tuple[Path, str]],
+    delete_paths: list[str] | None = None,
+    *,
+    max_workers: int = DEFAULT_UPLOAD_WORKERS,
+    max_retries: int = DEFAULT_CONFLICT_RETRIES,
+    config: ApiConfig | None = None,
+    metadata_cache: FileMetadataCache | None = None,
+    multipart: MultipartSettings | None = None,
+    precompressed: bool = False,
+    api_cache: ApiCache | None = None,
+) -> PublishResult:
     """
     Publishes files (uploads and deletes) to Textpress using explicit upload paths.
+
+    Files whose MD5 already matches the current manifest are dropped before
+    presigning, so only changed files are presigned, uploaded, and committed. If
+    nothing changed, no presign or commit is made at all.
+
+    If another publisher commits first (a version conflict), we refetch the
+    manifest and rebase: files that now match are dropped, files the other
+    publisher also changed are re-presigned and re-uploaded, and everything else
+    already uploaded is kept. This is retried up to `max_retries` times with
+    jittered backoff.
+
+    Uploads run concurrently with up to `max_workers` at once. Uses the API config
+    from the environment unless `config` is given. If `metadata_cache` is given,
+    it is used for file hashes and saved afterwards. Large files are uploaded in
+    resumable parts per `multipart` (default `MultipartSettings()`, which has no
+    resume directory, so parts only resume within this call).
+
+    If `precompressed` is set, files with an up-to-date precompressed variant
+    (see `precompress`) are uploaded compressed, with a Content-Encoding.
+
+    If `api_cache` is given, the manifest is revalidated against the last one
+    fetched rather than downloaded in full.
     """
-    from textpress.api.http_client import get_http_client
+    from textpress.api.http_client import HttpPool, get_http_client
+    from textpress.api.multipart_upload import MultipartSettings
+
+    if multipart is None:
+        multipart = MultipartSettings()
 
-    config = get_api_config()
+    if config is None:
+        config = get_api_config()
 
     if delete_paths is None:
         delete_paths = []
 
-    manifest: ManifestResponse = get_manifest(config)
-    log_api("<< get_manifest response: %s", manifest)
+    encodings: dict[str, str] = {}
+    if precompressed:
+        from textpress.api.precompress import precompressed_uploads
 
-    presign_response: PresignResponse = get_presigned_urls(
-        config, manifest.version, files_with_paths, delete_paths
-    )
+        files_with_paths, encodings = precompressed_uploads(files_with_paths)
 
-    upload_info_map = {info.path: info for info in presign_response.uploads}
+    manifest: ManifestResponse = get_manifest(config, api_cache)
+    log_api("<< get_manifest response: %s", manifest)
 
-    upload_client = get_http_client()
-    uploaded_files_details: list[PresignUploadInfo] = []
-    for file_path, upload_path in files_with_paths:
-        if upload_path in upload_info_map:
-            upload_info = upload_info_map[upload_path]
-            upload_file(upload_client, file_path, upload_info.model_dump())
-            uploaded_files_details.append(upload_info)
-        else:
-            log_api(
-                "File %s (%s) was requested for upload but not included in presign response (already up-to-date?)",
-                file_path,
-                upload_path,
+    uploads_metadata = [
+        file_upload_metadata(
+            file_path,
+            upload_path,
+            metadata_cache,
+            content_encoding=encodings.get(upload_path),
+            multipart=multipart,
+        )
+        for file_path, upload_path in files_with_paths
+    ]
+    if metadata_cache:
+        metadata_cache.save()
+
+    state = PublishState(manifest, files_with_paths, uploads_metadata, delete_paths, max_retries)
+    while not state.up_to_date:
+        try:
+            if state.needs_presign:
+                presign_response: PresignResponse = presign_uploads(
+                    config, state.manifest.version, state.to_presign, state.delete_paths
+                )
+                # Only commit once every upload has succeeded (`upload_files` raises otherwise).
+                state.add_uploaded(
+                    upload_files(
+                        get_http_client(HttpPool.storage),
+                        state.presigned(presign_response),
+                        max_workers=max_workers,
+                        config=config,
+                        multipart=multipart,
+                    )
+                )
+
+            commit_response: ManifestResponse = sync_commit(
+                config,
+                state.manifest.version,
+                state.uploaded,
+                files_to_delete_paths=state.delete_paths,
             )
-
-    commit_response: ManifestResponse = sync_commit(
-        config,
-        manifest.version,
-        uploaded_files_details,
-        files_to_delete_paths=delete_paths,
-    )
-
-    return commit_response
+            return state.result(commit_response)
+        except Exception as e:
+            if not state.should_retry(e):
+                raise
+            time.sleep(state.retry_delay())
+            state.rebase(get_manifest(config, api_cache))
+
+    return state.result()
@@ -0,0 +1,259 @@
+"""
+Async versions of the Textpress API calls in `textpress_api`, for embedding in
+asyncio services. These share the same request and response models. Each call
+takes an explicit `httpx.AsyncClient`, typically from `new_async_http_client()`,
+so one client (and its connection pool) can be shared by many concurrent publishes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from textpress.api.precompress import precompressed_uploads
+from textpress.api.textpress_api import (
+    DEFAULT_CONFLICT_RETRIES,
+    DEFAULT_UPLOAD_WORKERS,
+    UPLOAD_CHUNK_SIZE,
+    ManifestResponse,
+    PresignResponse,
+    PresignUploadInfo,
+    PublishResult,
+    PublishState,
+    Route,
+    UploadError,
+    UploadFileMetadata,
+    UserProfileResponse,
+    commit_request,
+    file_upload_metadata,
+    manifest_from_response,
+    manifest_request_headers,
+    presign_request,
+    user_from_response,
+)
+from textpress.api.textpress_env import ApiConfig, get_api_config
+from textpress.spans import span
+
+if TYPE_CHECKING:
+    from httpx import AsyncClient
+
+    from textpress.api.api_cache import ApiCache
+    from textpress.api.file_metadata_cache import FileMetadataCache
+
+log = logging.getLogger(__name__)
+
+# Debug logging for API calls.
+log_api = log.debug
+
+
+async def get_manifest(
+    client: AsyncClient, config: ApiConfig, api_cache: ApiCache | None = None
+) -> ManifestResponse:
+    with span("get_manifest") as s:
+        response = await Route.sync_manifest.aget(
+            client, config, extra_headers=manifest_request_headers(config, api_cache)
+        )
+        s.set(status=response.status_code, bytes=len(response.content))
+        return manifest_from_response(config, response, api_cache)
+
+
+async def get_user(
+    client: AsyncClient, config: ApiConfig, api_cache: ApiCache | None = None
+) -> UserProfileResponse:
+    cached = api_cache and api_cache.user_profile(config)
+    if cached:
+        return UserProfileResponse.model_validate(cached)
+    with span("get_user"):
+        return user_from_response(config, await Route.user.aget(client, config), api_cache)
+
+
+async def get_presigned_urls(
+    client: AsyncClient,
+    config: ApiConfig,
+    base_version: int,
+    files_to_upload: list[tuple[Path, str]],
+    files_to_delete: list[str] | None = None,
+    metadata_cache: FileMetadataCache | None = None,
+) -> PresignResponse:
+    uploads_metadata = await _file_upload_metadata(files_to_upload, metadata_cache)
+    return await presign_uploads(client, config, base_version, uploads_metadata, files_to_delete)
+
+
+async def presign_uploads(
+    client: AsyncClient,
+    config: ApiConfig,
+    base_version: int,
+    uploads_metadata: list[UploadFileMetadata],
+    files_to_delete: list[str] | None = None,
+) -> PresignResponse:
+    presign_req = presign_request(base_version, uploads_metadata, files_to_delete)
+    request_data_json = presign_req.model_dump(by_alias=True, exclude_none=True)
+    with span("presign", uploads=len(uploads_metadata), deletes=len(presign_req.delete)):
+        response = await Route.sync_presign_batch.apost(client, config, request_data_json)
+    return PresignResponse.model_validate(response.json())
+
+
+async def _file_upload_metadata(
+    files_with_paths: list[tuple[Path, str]],
+    metadata_cache: FileMetadataCache | None,
+    encodings: dict[str, str] | None = None,
+) -> list[UploadFileMetadata]:
+    encodings = encodings or {}
+    # Hashing is blocking file IO, so keep it off the event loop.
+    return await asyncio.to_thread(
+        lambda: [
+            file_upload_metadata(
+                file_path, upload_path, metadata_cache, content_encoding=encodings.get(upload_path)
+            )
+            for file_path, upload_path in files_with_paths
+        ]
+    )
+
+
+async def aiter_file_chunks(
+    file_path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Read a file in fixed-size chunks without blocking the event loop.
+    """
+    f = await asyncio.to_thread(open, file_path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+async def upload_file(client: AsyncClient, file_path: Path, upload_info: dict[str, Any]) -> None:
+    """
+    Streams a single file to its presigned URL, with an explicit Content-Length
+    as in the sync `upload_file`.
+    """
+    url: str = upload_info["url"]
+    size = file_path.stat().st_size
+    headers: dict[str, str] = {**upload_info["headers"], "Content-Length": str(size)}
+
+    log_api(">> upload_file: %s - %s", url, headers)
+    with span("upload_file", path=upload_info.get("path", url), bytes=size):
+        response = await client.put(url, headers=headers, content=aiter_file_chunks(file_path))
+    response.raise_for_status()
+
+
+async def upload_files(
+    client: AsyncClient,
+    uploads: list[tuple[Path, PresignUploadInfo]],
+    max_workers: int = DEFAULT_UPLOAD_WORKERS,
+) -> list[PresignUploadInfo]:
+    """
+    Uploads files concurrently, at most `max_workers` at once. As with the sync
+    version, all uploads are attempted and failures raised together as `UploadError`.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def upload(file_path: Path, info: PresignUploadInfo) -> None:
+        async with semaphore:
+            await upload_file(client, file_path, info.model_dump())
+
+    results = await asyncio.gather(
+        *(upload(file_path, info) for file_path, info in uploads), return_exceptions=True
+    )
+
+    failures: dict[str, Exception] = {}
+    for (_file_path, info), result in zip(uploads, results, strict=True):
+        if isinstance(result, Exception):
+            log.warning("Upload failed: %s: %s", info.path, result)
+            failures[info.path] = result
+        elif isinstance(result, BaseException):
+            raise result
+    if failures:
+        raise UploadError(failures)
+
+    return [info for _file_path, info in uploads]
+
+
+async def sync_commit(
+    client: AsyncClient,
+    config: ApiConfig,
+    base_version: int,
+    uploaded_files_details: list[PresignUploadInfo],
+    files_to_delete_paths: list[str] | None = None,
+) -> ManifestResponse:
+    commit_req = commit_request(base_version, uploaded_files_details, files_to_delete_paths)
+    request_data_json = commit_req.model_dump(by_alias=True, exclude_none=True)
+    with span("commit", uploads=len(commit_req.uploads), deletes=len(commit_req.delete)):
+        response = await Route.sync_commit.apost(client, config, request_data_json)
+    return ManifestResponse.model_validate(response.json())
+
+
+async def publish_files(
+    client: AsyncClient,
+    files_with_paths: list[tuple[Path, str]],
+    delete_paths: list[str] | None = None,
+    *,
+    max_workers: int = DEFAULT_UPLOAD_WORKERS,
+    max_retries: int = DEFAULT_CONFLICT_RETRIES,
+    config: ApiConfig | None = None,
+    metadata_cache: FileMetadataCache | None = None,
+    storage_client: AsyncClient | None = None,
+    precompressed: bool = False,
+    api_cache: ApiCache | None = None,
+) -> PublishResult:
+    """
+    Async version of `textpress_api.publish_files`, with the same semantics
+    (including rebasing after version conflicts). Uploads use `storage_client`
+    if given, e.g. from `new_async_http_client(HttpPool.storage)`, so they
+    don't compete with API calls for connections.
+    """
+    if config is None:
+        config = get_api_config()
+
+    if delete_paths is None:
+        delete_paths = []
+
+    encodings: dict[str, str] = {}
+    if precompressed:
+        files_with_paths, encodings = precompressed_uploads(files_with_paths)
+
+    # Hashing can overlap with the manifest fetch.
+    manifest, uploads_metadata = await asyncio.gather(
+        get_manifest(client, config, api_cache),
+        _file_upload_metadata(files_with_paths, metadata_cache, encodings),
+    )
+    log_api("<< get_manifest response: %s", manifest)
+    if metadata_cache:
+        await asyncio.to_thread(metadata_cache.save)
+
+    state = PublishState(manifest, files_with_paths, uploads_metadata, delete_paths, max_retries)
+    while not state.up_to_date:
+        try:
+            if state.needs_presign:
+                presign_response = await presign_uploads(
+                    client, config, state.manifest.version, state.to_presign, state.delete_paths
+                )
+                # Only commit once every upload has succeeded (`upload_files` raises otherwise).
+                state.add_uploaded(
+                    await upload_files(
+                        storage_client or client,
+                        state.presigned(presign_response),
+                        max_workers=max_workers,
+                    )
+                )
+
+            commit_response = await sync_commit(
+                client,
+                config,
+                state.manifest.version,
+                state.uploaded,
+                files_to_delete_paths=state.delete_paths,
+            )
+            return state.result(commit_response)
+        except Exception as e:
+            if not state.should_retry(e):
+                raise
+            await asyncio.sleep(state.retry_delay())
+            state.rebase(await get_manifest(client, config, api_cache))
+
+    return state.result()
@@ -19,6 +19,51 @@ class Env(EnvEnum):
     TEXTPRESS_PUBLISH_ROOT = "TEXTPRESS_PUBLISH_ROOT"
     """The root directory for Textpress publish."""
 
+    TEXTPRESS_HTTP_MAX_CONNECTIONS = "TEXTPRESS_HTTP_MAX_CONNECTIONS"
+    """Max open connections per HTTP pool (API and storage pools are separate)."""
+
+    TEXTPRESS_HTTP_MAX_KEEPALIVE = "TEXTPRESS_HTTP_MAX_KEEPALIVE"
+    """Max idle keep-alive connections kept per HTTP pool."""
+
+    TEXTPRESS_HTTP_KEEPALIVE_EXPIRY = "TEXTPRESS_HTTP_KEEPALIVE_EXPIRY"
+    """Seconds an idle keep-alive connection is kept open."""
+
+    TEXTPRESS_HTTP_CONNECT_TIMEOUT = "TEXTPRESS_HTTP_CONNECT_TIMEOUT"
+    """HTTP connect timeout in seconds."""
+
+    TEXTPRESS_HTTP_READ_TIMEOUT = "TEXTPRESS_HTTP_READ_TIMEOUT"
+    """HTTP read timeout in seconds."""
+
+    TEXTPRESS_HTTP_WRITE_TIMEOUT = "TEXTPRESS_HTTP_WRITE_TIMEOUT"
+    """HTTP write timeout in seconds."""
+
+    TEXTPRESS_HTTP2 = "TEXTPRESS_HTTP2"
+    """Set to enable HTTP/2 (requires the `h2` package)."""
+
+    def read_float(self, *, default: float) -> float:
+        """
+        Read a numeric value, falling back to `default` if unset.
+        """
+        value = self.read_str(default=None)
+        if value is None or not value.strip():
+            return default
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Expected a number for {self.value}: {value!r}") from None
+
+    def read_int(self, *, default: int) -> int:
+        """
+        Read a whole number, falling back to `default` if unset.
+        """
+        value = self.read_str(default=None)
+        if value is None or not value.strip():
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"Expected a whole number for {self.value}: {value!r}") from None
+
 
 @dataclass(frozen=True)
 class ApiConfig:
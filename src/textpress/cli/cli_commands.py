@@ -3,13 +3,14 @@ from __future__ import annotations
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-from kash.utils.common.url import Url
-
 # We wrap each command as a convenient way to customize CLI docs and to make
 # all imports lazy, since some of these actions have a lot of dependencies that
 # make imports slow. This way CLI help etc feels snappy.
 if TYPE_CHECKING:
     from kash.model import ActionResult
+    from kash.utils.common.url import Url
+
+    from textpress.cli.cli_parallel import FormatOutcome
 
 
 def help() -> None:
@@ -85,7 +86,13 @@ def files(all: bool = False) -> None:
     files(ws.base_dir, overview=True, all=all)
 
 
-def convert(md_path: Path | Url, pdf_converter: str = "marker") -> ActionResult:
+def convert(
+    md_path: Path | Url,
+    pdf_converter: str = "marker",
+    pdf_chunk_pages: int = 0,
+    pdf_workers: int | None = None,
+    pdf_worker_memory: int = 0,
+) -> ActionResult:
     """
     Convert a document to clean Markdown.
 
@@ -99,18 +106,39 @@ def convert(md_path: Path | Url, pdf_converter: str = "marker") -> ActionResult:
 
     Uses Marker (for PDF) and MarkItDown/Mammoth (for docx) as well as Markdownify
     and flowmark to get clean Markdown formatting results.
+    For long PDFs, use `--pdf_chunk_pages` to convert a chunk of pages at a time
+    across `--pdf_workers` processes, with progress as each chunk finishes.
+    Chunks are cached, so converting again only converts changed pages.
     """
     from kash.exec import prepare_action_input
-    from kash.kits.docs.actions.text.markdownify_doc import markdownify_doc
     from kash.model import ActionResult
 
+    from textpress.actions.textpress_markdownify import markdownify_input
+    from textpress.docs.pdf_chunks import DEFAULT_PDF_WORKERS
+
     input = prepare_action_input(md_path)
-    return ActionResult(items=[markdownify_doc(input.items[0], pdf_converter=pdf_converter)])
+    md_item = markdownify_input(
+        input.items[0],
+        pdf_converter=pdf_converter,
+        pdf_chunk_pages=pdf_chunk_pages,
+        pdf_workers=pdf_workers or DEFAULT_PDF_WORKERS,
+        pdf_worker_memory=pdf_worker_memory,
+    )
+    return ActionResult(items=[md_item])
 
 
 def format(
-    md_path: Path | Url, add_classes: str | None = None, no_minify: bool = False
-) -> ActionResult:
+    paths: list[Path | Url],
+    add_classes: str | None = None,
+    no_minify: bool = False,
+    precompress: bool = False,
+    optimize_images: bool = False,
+    shared_assets: bool = False,
+    pdf_chunk_pages: int = 0,
+    pdf_workers: int | None = None,
+    pdf_worker_memory: int = 0,
+    jobs: int | None = None,
+) -> list[FormatOutcome]:
     """
     Convert and format documents to pretty, formatted, minified HTML using the TextPress template.
 
@@ -118,41 +146,185 @@ def format(
     Result contains clean Markdown and HTML. Supports GFM-flavored Markdown
     and HTML, including GFM-flavored Markdown tables and footnotes.
     Calls `convert` (with the default "marker" converter) to do necessary
-    conversions.
+    conversions. With `--precompress`, also writes .gz and .br copies of the outputs.
+    With `--optimize_images`, large images are scaled down and WebP/AVIF versions
+    are added, so browsers download the smallest suitable size and format.
+    With `--shared_assets`, the large CSS/JS common to all pages is written to
+    separate content-hashed files in `_shared/` instead of inline in each page.
+    Accepts several paths, directories, or globs, formatted in parallel across
+    `--jobs` processes (default: one per CPU). PDFs can be converted in chunks,
+    as with `convert`.
     """
-    from kash.exec import prepare_action_input
-
-    from textpress.actions.textpress_format import textpress_format
-
-    input = prepare_action_input(md_path)
-    return textpress_format(input, add_classes=add_classes, no_minify=no_minify)
+    from textpress.cli.cli_parallel import FormatOptions, default_jobs, format_documents
+    from textpress.docs.pdf_chunks import DEFAULT_PDF_WORKERS
+
+    options = FormatOptions(
+        add_classes=add_classes,
+        no_minify=no_minify,
+        precompress=precompress,
+        optimize_images=optimize_images,
+        shared_assets=shared_assets,
+        pdf_chunk_pages=pdf_chunk_pages,
+        pdf_workers=pdf_workers or DEFAULT_PDF_WORKERS,
+        pdf_worker_memory=pdf_worker_memory,
+    )
+    return format_documents(paths, options, jobs=jobs or default_jobs())
 
 
 def publish(
-    path: Path | Url, add_classes: str | None = None, no_minify: bool = False
+    paths: list[Path | Url],
+    add_classes: str | None = None,
+    no_minify: bool = False,
+    precompress: bool = False,
+    optimize_images: bool = False,
+    shared_assets: bool = False,
+    jobs: int | None = None,
 ) -> ActionResult:
     """
-    Publish (or re-publish) a document as a Textpress webpage.
+    Publish (or re-publish) documents as Textpress webpages.
 
     Uses `format` to convert and format the content and publishes the result.
+    Accepts several paths, directories, or globs; all documents are formatted
+    (several at once, up to `--jobs`) and then published together in one batch.
+    With `--precompress`, pages are uploaded gzip/brotli compressed. With
+    `--shared_assets`, CSS/JS common to all pages is uploaded once per account
+    and served with long-lived cache headers. With `--optimize_images`, images
+    are scaled down and modern-format versions are published alongside them.
     """
     from kash.exec import prepare_action_input
 
-    from textpress.actions.textpress_publish import textpress_publish
+    from textpress.actions.textpress_publish import DEFAULT_FORMAT_JOBS, textpress_publish
+
+    input = prepare_action_input(*paths)
+    return textpress_publish(
+        input,
+        add_classes=add_classes,
+        no_minify=no_minify,
+        precompress=precompress,
+        optimize_images=optimize_images,
+        shared_assets=shared_assets,
+        jobs=jobs or DEFAULT_FORMAT_JOBS,
+    )
+
+
+def watch(
+    paths: list[str],
+    add_classes: str | None = None,
+    no_minify: bool = False,
+    precompress: bool = False,
+    optimize_images: bool = False,
+    shared_assets: bool = False,
+    and_publish: bool = False,
+    debounce: float | None = None,
+    exclude: list[Path] | None = None,
+) -> None:
+    """
+    Watch documents and re-format them whenever they (or their metadata or assets)
+    change. With `--publish`, re-publish them instead.
 
-    input = prepare_action_input(path)
-    return textpress_publish(input, add_classes=add_classes, no_minify=no_minify)
+    Accepts files, directories, or globs. Everything is formatted once at the start.
+    Runs in a single process, so startup costs are only paid once. Press Ctrl-C to stop.
+    """
+    from kash.config.logger import get_logger
+    from rich import print as rprint
 
+    from textpress.cli.cli_parallel import FormatOptions, format_documents
+    from textpress.cli.cli_watch import DEFAULT_DEBOUNCE
+    from textpress.cli.cli_watch import watch as watch_inputs
+
+    log = get_logger(__name__)
+    options = FormatOptions(
+        add_classes=add_classes,
+        no_minify=no_minify,
+        precompress=precompress,
+        optimize_images=optimize_images,
+        shared_assets=shared_assets,
+    )
+
+    def on_change(docs: list[Path]) -> None:
+        rprint()
+        rprint(f"[bright_black]Changed ({len(docs)}): {', '.join(map(str, docs))}[/bright_black]")
+        if and_publish:
+            try:
+                publish(
+                    list(docs),
+                    add_classes=add_classes,
+                    no_minify=no_minify,
+                    precompress=precompress,
+                    optimize_images=optimize_images,
+                    shared_assets=shared_assets,
+                )
+            except Exception as e:
+                # Keep watching: the next change may fix it (or the network may come back).
+                log.error("Error publishing: %s: %s", e.__class__.__name__, e)
+                log.info("Error details", exc_info=e)
+                return
+        else:
+            outcomes = format_documents(list(docs), options, jobs=1)
+            for outcome in outcomes:
+                for store_path in outcome.store_paths:
+                    rprint(f"[bold cyan]{store_path}[/bold cyan]")
+        rprint("[bright_black]Watching for changes...[/bright_black]")
+
+    watch_inputs(paths, on_change, exclude=exclude, debounce=debounce or DEFAULT_DEBOUNCE)
+
+
+def daemon(action: str, work_root: Path, idle_timeout: float | None = None) -> None:
+    """
+    Start, stop, or check a background Textpress daemon (`start`, `stop`, `status`).
 
-def export(md_path: Path | Url) -> ActionResult:
+    While the daemon is running, `convert`, `format`, `publish`, and `export`
+    commands for the same work root run inside it, so they skip the startup time
+    of loading libraries and models. It exits by itself after being idle (30
+    minutes by default). Use `--no_daemon` on a command to run it directly.
     """
-    Export a document as new, clean .pdf and .docx files.
+    from rich import print as rprint
+
+    from textpress.cli.cli_daemon import (
+        DEFAULT_IDLE_TIMEOUT,
+        DaemonServer,
+        ping,
+        start_daemon,
+        stop_daemon,
+    )
+
+    if idle_timeout is None:
+        idle_timeout = DEFAULT_IDLE_TIMEOUT
+
+    if action == "start":
+        status = start_daemon(work_root, idle_timeout=idle_timeout)
+        rprint(f"[bold green]Daemon running[/bold green] (pid {status['pid']})")
+    elif action == "stop":
+        if stop_daemon(work_root):
+            rprint("[bold green]Daemon stopped[/bold green]")
+        else:
+            rprint("[bright_black]No daemon running[/bright_black]")
+    elif action == "status":
+        status = ping(work_root)
+        if status:
+            rprint(
+                f"[bold green]Daemon running[/bold green] (pid {status['pid']}, "
+                f"version {status['version']}, up {status['uptime']:.0f}s, "
+                f"{status['requests']} requests): {status['work_root']}"
+            )
+        else:
+            rprint("[bright_black]No daemon running[/bright_black]")
+    elif action == "run":
+        # Foreground server, as started by `start`.
+        DaemonServer(work_root, idle_timeout=idle_timeout).serve()
+    else:
+        raise ValueError(f"Unknown daemon action: {action}")
+
 
-    You can use the .docx file in Word or in Google Docs.
+def export(paths: list[Path | Url], jobs: int | None = None) -> list[FormatOutcome]:
     """
-    from kash.exec import prepare_action_input
+    Export documents as new, clean .pdf and .docx files.
 
-    from textpress.actions.textpress_export import textpress_export
+    You can use the .docx file in Word or in Google Docs. Each document's .pdf
+    and .docx are generated concurrently, and re-exporting unchanged content
+    reuses the earlier files. Accepts several paths, directories, or globs,
+    exported in parallel across `--jobs` processes (default: one per CPU).
+    """
+    from textpress.cli.cli_parallel import default_jobs, export_documents
 
-    input = prepare_action_input(md_path)
-    return textpress_export(input)
+    return export_documents(paths, jobs=jobs or default_jobs())
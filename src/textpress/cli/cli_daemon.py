@@ -0,0 +1,550 @@
+"""
+Optional resident daemon, so workspace commands skip the per-command startup
+cost (imports, kash setup, converter models).
+
+`tp daemon start` runs a background server for a work root, listening on a
+Unix socket in a directory only the current user can access. While it's
+running, `tp` commands for that work root are sent to it and just stream back
+its output. Requests are handled one at a time, in the client's working
+directory and with the client's `TEXTPRESS_*` environment variables. The
+daemon exits after an idle timeout, on `tp daemon stop`, or on SIGTERM.
+
+The daemon keeps kash set up and the work root's workspace open, and loads the
+PDF converter's models once, so requests only pay for their own work. Where
+there are no Unix sockets (as on Windows), or the socket directory can't be
+used safely, commands just run directly.
+
+The protocol is JSON lines. A request is one message and the response is a
+stream of `{"out": ...}`/`{"err": ...}` messages ending with `{"exit": code}`.
+
+The client side only uses the standard library, so it stays fast to import.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from importlib.metadata import version
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from kash.exec.runtime_settings import RuntimeSettingsManager
+
+PROTOCOL_VERSION = 1
+
+DEFAULT_IDLE_TIMEOUT = 30 * 60.0
+"""Seconds without requests before the daemon exits (0 to never exit)."""
+
+START_TIMEOUT = 60.0
+"""Seconds to wait for a newly started daemon to respond."""
+
+FORWARDED_ENV_PREFIX = "TEXTPRESS_"
+"""
+Environment variables sent with each command, since they pick the account and
+API and tune HTTP, and may differ from those the daemon was started with.
+"""
+
+log = logging.getLogger(__name__)
+
+
+def daemon_supported() -> bool:
+    """
+    Whether the daemon can run here. It needs Unix sockets and user IDs (to
+    check who owns the sockets), so it isn't available on Windows.
+    """
+    return hasattr(socket, "AF_UNIX") and hasattr(os, "getuid")
+
+
+def _package_version() -> str:
+    try:
+        return version("textpress")
+    except Exception:
+        return "unknown"
+
+
+def _socket_dir() -> Path:
+    """
+    Directory for daemon sockets: in `$XDG_RUNTIME_DIR` if there is one, or else
+    a per-user directory in the temp directory. Unix socket paths have a short
+    length limit, so they can't go in the work root. The directory must belong
+    to this user and be closed to others, so no one else can put a socket there.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and Path(runtime_dir).is_dir():
+        socket_dir = Path(runtime_dir) / "textpress"
+    else:
+        socket_dir = Path(tempfile.gettempdir()) / f"textpress-{os.getuid()}"
+    try:
+        socket_dir.mkdir(mode=0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(socket_dir)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Daemon socket directory is not private to this user: {socket_dir}")
+    return socket_dir
+
+
+def daemon_socket_path(work_root: Path) -> Path:
+    """
+    Socket for the daemon serving a work root.
+    """
+    key = hashlib.sha1(str(work_root.resolve()).encode()).hexdigest()[:12]
+    return _socket_dir() / f"{key}.sock"
+
+
+def _forwarded_env() -> dict[str, str]:
+    return {k: v for k, v in os.environ.items() if k.startswith(FORWARDED_ENV_PREFIX)}
+
+
+@contextmanager
+def _client_env(env: dict[str, str]) -> Iterator[None]:
+    """
+    Use the client's forwarded environment variables (and none of the daemon's
+    own) within the block.
+    """
+    saved = _forwarded_env()
+    for key in saved:
+        del os.environ[key]
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for key in _forwarded_env():
+            del os.environ[key]
+        os.environ.update(saved)
+
+
+def _send(sock: socket.socket, message: dict[str, Any]) -> None:
+    sock.sendall((json.dumps(message) + "\n").encode())
+
+
+def _connect(work_root: Path, timeout: float | None = None) -> socket.socket | None:
+    path = daemon_socket_path(work_root)
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"Not a daemon socket owned by this user: {path}")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        sock.close()
+        return None
+    return sock
+
+
+def _try_connect(work_root: Path, timeout: float | None = None) -> socket.socket | None:
+    """
+    Connect to the daemon for this work root, or return None if there isn't one
+    or it can't be used here, so commands can still run directly.
+    """
+    if not daemon_supported():
+        log.info("Daemon not supported on this platform")
+        return None
+    try:
+        return _connect(work_root, timeout=timeout)
+    except OSError as e:
+        log.warning("Not using the daemon: %s", e)
+        return None
+
+
+def _request(work_root: Path, message: dict[str, Any], timeout: float = 5.0) -> dict | None:
+    """
+    Send a control message and return the single reply, or None if no daemon.
+    """
+    sock = _try_connect(work_root, timeout=timeout)
+    if not sock:
+        return None
+    with sock:
+        _send(sock, message)
+        line = sock.makefile("r", encoding="utf-8").readline()
+    return json.loads(line) if line else None
+
+
+def ping(work_root: Path) -> dict | None:
+    return _request(work_root, {"op": "ping"})
+
+
+def run_in_daemon(work_root: Path, argv: list[str]) -> int | None:
+    """
+    Run a CLI command in the daemon for this work root, streaming its output.
+    Returns the exit code, or None if no daemon is running or it can't be used.
+    """
+    sock = _try_connect(work_root)
+    if not sock:
+        return None
+    with sock:
+        _send(
+            sock,
+            {
+                "op": "run",
+                "protocol": PROTOCOL_VERSION,
+                "version": _package_version(),
+                "argv": argv,
+                "cwd": os.getcwd(),
+                "env": _forwarded_env(),
+                "isatty": sys.stdout.isatty(),
+                "width": _terminal_width(),
+            },
+        )
+        try:
+            for line in sock.makefile("r", encoding="utf-8"):
+                message = json.loads(line)
+                if "out" in message:
+                    sys.stdout.write(message["out"])
+                    sys.stdout.flush()
+                elif "err" in message:
+                    sys.stderr.write(message["err"])
+                    sys.stderr.flush()
+                elif "exit" in message:
+                    return message["exit"]
+        except KeyboardInterrupt:
+            print("\nCancelled (the daemon will finish the current command)", file=sys.stderr)
+            return 130
+    # The daemon went away mid-command.
+    print("Textpress daemon closed the connection", file=sys.stderr)
+    return 1
+
+
+def _terminal_width() -> int:
+    import shutil
+
+    return shutil.get_terminal_size().columns
+
+
+def start_daemon(work_root: Path, idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> dict:
+    """
+    Start a background daemon for the work root (if one isn't already running)
+    and wait until it responds. Returns its status.
+    """
+    if not daemon_supported():
+        raise RuntimeError("The daemon needs Unix sockets, which aren't available here")
+    # Raises if the socket directory isn't private to this user.
+    daemon_socket_path(work_root)
+    status = ping(work_root)
+    if status:
+        return status
+
+    work_root = work_root.resolve()
+    log_path = work_root / "logs" / "daemon.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "ab") as log_file:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "textpress",
+                "--work_root",
+                str(work_root),
+                "daemon",
+                "run",
+                "--idle_timeout",
+                str(idle_timeout),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=log_file,
+            start_new_session=True,
+        )
+
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        status = ping(work_root)
+        if status:
+            return status
+    raise TimeoutError(f"Daemon didn't start within {START_TIMEOUT:.0f}s (see {log_path})")
+
+
+def stop_daemon(work_root: Path) -> bool:
+    """
+    Ask the daemon to shut down. Returns False if none was running.
+    """
+    return _request(work_root, {"op": "shutdown"}) is not None
+
+
+class _StreamWriter(io.TextIOBase):
+    """
+    Text stream that forwards writes to the client as JSON messages.
+    """
+
+    def __init__(self, sock: socket.socket, key: str, lock: threading.Lock, isatty: bool):
+        self._sock = sock
+        self._key = key
+        self._lock = lock
+        self._isatty = isatty
+        self.closed_by_client = False
+
+    def write(self, s: str) -> int:
+        if s and not self.closed_by_client:
+            with self._lock:
+                try:
+                    _send(self._sock, {self._key: s})
+                except OSError:
+                    # Client went away (e.g. Ctrl-C). Finish the command anyway.
+                    self.closed_by_client = True
+        return len(s)
+
+    def isatty(self) -> bool:
+        return self._isatty
+
+    @property
+    def encoding(self) -> str:  # pyright: ignore
+        return "utf-8"
+
+
+class DaemonServer:
+    """
+    Serves CLI commands for one work root, one request at a time.
+    """
+
+    def __init__(self, work_root: Path, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.work_root = work_root.resolve()
+        self.idle_timeout = idle_timeout
+        self.socket_path = daemon_socket_path(self.work_root)
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        self.requests = 0
+        self._http_env: dict[str, str] | None = None
+        self._runtime: RuntimeSettingsManager | None = None
+        self._stop = False
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "version": _package_version(),
+            "work_root": str(self.work_root),
+            "uptime": round(time.time() - self.started, 1),
+            "requests": self.requests,
+        }
+
+    def stop(self, *_args: object) -> None:
+        self._stop = True
+
+    def serve(self) -> None:
+        if ping(self.work_root):
+            raise RuntimeError(f"A daemon is already running for {self.work_root}")
+        # Any socket left from a daemon that didn't exit cleanly is stale.
+        self.socket_path.unlink(missing_ok=True)
+
+        self._warm_up()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(str(self.socket_path))
+        finally:
+            os.umask(old_umask)
+        server.listen(8)
+        server.settimeout(1.0)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+        print(f"Textpress daemon listening: {self.socket_path}", flush=True)
+
+        try:
+            while not self._stop:
+                try:
+                    conn, _addr = server.accept()
+                except TimeoutError:
+                    idle = time.monotonic() - self.last_request
+                    if self.idle_timeout and idle > self.idle_timeout:
+                        print(f"Idle for {idle:.0f}s, exiting", flush=True)
+                        break
+                    continue
+                with conn:
+                    conn.settimeout(None)
+                    self._handle(conn)
+                self.last_request = time.monotonic()
+        finally:
+            server.close()
+            self.socket_path.unlink(missing_ok=True)
+            if self._runtime:
+                self._runtime.__exit__(None, None, None)
+            print("Textpress daemon stopped", flush=True)
+
+    def _warm_up(self) -> None:
+        """
+        Pay the startup costs once, up front: imports, kash setup, loading the
+        workspace, and the PDF converter's models. The workspace's runtime stays
+        entered, so commands with default settings run in it as is.
+        """
+        from importlib.util import find_spec
+
+        from kash.config.setup import kash_setup
+        from kash.exec import kash_runtime
+
+        import textpress.actions.textpress_export  # noqa: F401
+        import textpress.actions.textpress_format  # noqa: F401
+        import textpress.actions.textpress_publish  # noqa: F401
+        from textpress.cli.cli_setup import load_env
+        from textpress.docs.pdf_chunks import marker_models
+
+        load_env()
+        if threading.current_thread() is threading.main_thread():
+            # Same arguments as a command without log options, so it's reused.
+            # (It sets a signal handler, so it can't run in other threads.)
+            kash_setup(rich_logging=True, kash_ws_root=self.work_root, console_log_level="warning")
+        self._runtime = kash_runtime(self.work_root / "workspace")
+        self._runtime.__enter__()
+        # Loads the workspace into kash's registry, where commands will find it.
+        self._runtime.settings.workspace.log_workspace_info()
+
+        if find_spec("marker"):
+            try:
+                marker_models()
+            except Exception as e:
+                print(f"Couldn't preload Marker models: {e}", flush=True)
+
+    def _handle(self, conn: socket.socket) -> None:
+        line = conn.makefile("r", encoding="utf-8").readline()
+        if not line:
+            return
+        request = json.loads(line)
+        op = request.get("op")
+        if op == "ping":
+            _send(conn, self.status())
+        elif op == "shutdown":
+            _send(conn, {"ok": True})
+            self._stop = True
+        elif op == "run":
+            self.requests += 1
+            _send(conn, {"exit": self._run(conn, request)})
+        else:
+            _send(conn, {"err": f"Unknown request: {op!r}\n"})
+            _send(conn, {"exit": 2})
+
+    def _console_log_handlers(self) -> list[logging.StreamHandler]:
+        # Plain stream handlers (not file handlers), which keep a fixed stream
+        # and so must be pointed at each client in turn.
+        return [
+            h
+            for h in logging.getLogger().handlers
+            if isinstance(h, logging.StreamHandler) and not isinstance(h, logging.FileHandler)
+        ]
+
+    def _run(self, conn: socket.socket, request: dict[str, Any]) -> int:
+        from contextlib import redirect_stderr, redirect_stdout
+
+        import rich
+        from kash.config.logger import get_highlighter, get_theme
+
+        from textpress.cli.cli_main import build_parser, run_workspace_command
+
+        lock = threading.Lock()
+        out = _StreamWriter(conn, "out", lock, request.get("isatty", False))
+        err = _StreamWriter(conn, "err", lock, request.get("isatty", False))
+
+        if request.get("version") != _package_version():
+            err.write(
+                f"Textpress daemon is version {_package_version()} but the CLI is "
+                f"{request.get('version')}. Restart it with `tp daemon stop`.\n"
+            )
+            return 2
+
+        env = request.get("env", {})
+        http_env = {k: v for k, v in env.items() if k.startswith("TEXTPRESS_HTTP_")}
+        if http_env != self._http_env:
+            # Pooled clients keep the settings they were made with.
+            from textpress.api.http_client import close_http_client
+
+            close_http_client()
+            self._http_env = http_env
+
+        cwd = os.getcwd()
+        with redirect_stdout(out), redirect_stderr(err), _client_env(env):  # pyright: ignore
+            # The console writes to the redirected stdout and matches the client's terminal.
+            rich.reconfigure(
+                theme=get_theme(),
+                highlighter=get_highlighter(),
+                force_terminal=out.isatty(),
+                width=request.get("width"),
+            )
+            for handler in self._console_log_handlers():
+                handler.setStream(err)  # pyright: ignore
+            try:
+                os.chdir(request["cwd"])
+                args = build_parser().parse_args(request["argv"])
+                return run_workspace_command(args.subcommand.replace("-", "_"), args)
+            except SystemExit as e:
+                # From argparse.
+                return e.code if isinstance(e.code, int) else 2
+            except Exception as e:
+                err.write(f"Error in daemon: {e.__class__.__name__}: {e}\n")
+                return 2
+            finally:
+                os.chdir(cwd)
+                for handler in self._console_log_handlers():
+                    handler.setStream(sys.__stderr__)  # pyright: ignore
+
+
+## Tests
+
+
+def test_stream_writer():
+    a, b = socket.socketpair()
+    with a, b:
+        writer = _StreamWriter(a, "out", threading.Lock(), isatty=False)
+        print("hello", file=writer)
+        a.shutdown(socket.SHUT_WR)
+        messages = [json.loads(line) for line in b.makefile("r", encoding="utf-8")]
+    assert messages == [{"out": "hello"}, {"out": "\n"}]
+    assert not writer.isatty()
+
+
+def test_client_env():
+    os.environ["TEXTPRESS_TEST_DAEMON"] = "daemon"
+    os.environ["TEXTPRESS_TEST_DAEMON_ONLY"] = "daemon"
+    try:
+        with _client_env({"TEXTPRESS_TEST_DAEMON": "client", "TEXTPRESS_TEST_CLIENT": "client"}):
+            assert os.environ["TEXTPRESS_TEST_DAEMON"] == "client"
+            assert os.environ["TEXTPRESS_TEST_CLIENT"] == "client"
+            assert "TEXTPRESS_TEST_DAEMON_ONLY" not in os.environ
+            os.environ["TEXTPRESS_TEST_LOADED"] = "from .env"
+        assert os.environ["TEXTPRESS_TEST_DAEMON"] == "daemon"
+        assert os.environ["TEXTPRESS_TEST_DAEMON_ONLY"] == "daemon"
+        assert "TEXTPRESS_TEST_CLIENT" not in os.environ
+        assert "TEXTPRESS_TEST_LOADED" not in os.environ
+    finally:
+        del os.environ["TEXTPRESS_TEST_DAEMON"]
+        del os.environ["TEXTPRESS_TEST_DAEMON_ONLY"]
+
+
+def test_run_in_daemon_unusable_socket_dir():
+    with tempfile.TemporaryDirectory() as tmp:
+        runtime_dir = Path(tmp)
+        (runtime_dir / "textpress").mkdir(mode=0o755)
+        (runtime_dir / "textpress").chmod(0o755)
+        saved = os.environ.get("XDG_RUNTIME_DIR")
+        os.environ["XDG_RUNTIME_DIR"] = str(runtime_dir)
+        try:
+            assert run_in_daemon(Path("a"), ["format", "a.md"]) is None
+            assert ping(Path("a")) is None
+        finally:
+            if saved is None:
+                del os.environ["XDG_RUNTIME_DIR"]
+            else:
+                os.environ["XDG_RUNTIME_DIR"] = saved
+
+
+def test_socket_dir():
+    socket_dir = _socket_dir()
+    info = os.lstat(socket_dir)
+    assert info.st_uid == os.getuid() and not info.st_mode & 0o077
+    assert daemon_socket_path(Path("a")).parent == socket_dir
@@ -29,6 +29,24 @@ tp format textpress/workspace/docs/airspeed_velocity_of_unladen_birds_1.doc.md -
 
 # Publish formatted Markdown to Textpress
 tp publish textpress/workspace/docs/airspeed_velocity_of_unladen_birds_1.doc.md --show
+
+# Publish many docs at once (directories and globs work too)
+tp publish reports/ 'notes/**/*.md'
+
+# Format a whole archive, using 8 processes
+tp format reports/ --jobs 8
+
+# Export docs as .docx and .pdf (for Word or Google Docs)
+tp export reports/ --jobs 4
+
+# Re-format (or with --publish, re-publish) docs whenever they change
+tp watch notes/ --publish
+
+# Keep a warm background process so repeated commands start instantly
+tp daemon start
+
+# See where the time goes: a timing summary, plus a trace in textpress/logs/
+tp publish report.md --profile
 ```
 
 For all commands: `tp --help`
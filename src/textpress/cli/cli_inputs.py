@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import glob
+from pathlib import Path
+
+from kash.utils.common.url import Url, is_url
+
+DOC_SUFFIXES = {".md", ".markdown", ".txt", ".docx", ".pdf", ".html", ".htm"}
+"""File types picked up when an input is a directory or glob."""
+
+GLOB_CHARS = set("*?[")
+
+
+def _is_doc_file(path: Path, rel_path: Path) -> bool:
+    # Sidematter assets are published along with their document, not on their own.
+    # Hidden files and directories are skipped.
+    return (
+        path.suffix.lower() in DOC_SUFFIXES
+        and not any(
+            part.endswith(".assets") or (part.startswith(".") and part not in (".", ".."))
+            for part in rel_path.parts
+        )
+        and path.is_file()
+    )
+
+
+def _glob_root(pattern: Path) -> Path:
+    """
+    The leading part of a glob pattern without wildcards, like `docs` for `docs/**/*.md`.
+    """
+    parts = pattern.parts
+    n = next((i for i, part in enumerate(parts) if GLOB_CHARS & set(part)), len(parts))
+    return Path(*parts[:n])
+
+
+def expand_inputs(inputs: list[str], exclude: list[Path] | None = None) -> list[Path | Url]:
+    """
+    Expand CLI inputs, which may be URLs, files, directories (searched recursively
+    for documents), or glob patterns, into a de-duplicated list of URLs and paths.
+    Anything under an `exclude` directory (like the work root) is skipped.
+    """
+    excluded = [p.resolve() for p in exclude or []]
+
+    def is_excluded(path: Path) -> bool:
+        resolved = path.resolve()
+        return any(resolved.is_relative_to(ex) for ex in excluded)
+
+    results: list[Path | Url] = []
+    seen: set[str] = set()
+
+    def add(item: Path | Url) -> None:
+        key = item if isinstance(item, str) else str(item.resolve())
+        if key not in seen:
+            seen.add(key)
+            results.append(item)
+
+    for input in inputs:
+        if is_url(input):
+            add(Url(input))
+            continue
+
+        path = Path(input).expanduser()
+        if path.is_dir():
+            for doc in sorted(path.rglob("*")):
+                if _is_doc_file(doc, doc.relative_to(path)) and not is_excluded(doc):
+                    add(doc)
+        elif path.exists():
+            add(path)
+        elif GLOB_CHARS & set(input):
+            root = _glob_root(path)
+            matches = sorted(Path(m) for m in glob.glob(str(path), recursive=True))
+            docs = [
+                m for m in matches if _is_doc_file(m, m.relative_to(root)) and not is_excluded(m)
+            ]
+            if not docs:
+                raise FileNotFoundError(f"No documents match: {input}")
+            for doc in docs:
+                add(doc)
+        else:
+            raise FileNotFoundError(f"File not found: {input}")
+
+    return results
+
+
+## Tests
+
+
+def test_expand_inputs():
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for name in [
+            "a.md",
+            "b.docx",
+            "notes.json",
+            "sub/c.md",
+            "sub/c.assets/image.html",
+            "work/workspace/d.md",
+        ]:
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_text("x")
+
+        cwd = Path.cwd()
+        os.chdir(root)
+        try:
+            assert expand_inputs(["."], exclude=[Path("work")]) == [
+                Path("a.md"),
+                Path("b.docx"),
+                Path("sub/c.md"),
+            ]
+            assert expand_inputs(["**/*.md", "a.md"], exclude=[Path("work")]) == [
+                Path("a.md"),
+                Path("sub/c.md"),
+            ]
+            # Only hidden parts the glob matched are skipped, not those in its root.
+            (root / ".notes/.draft").mkdir(parents=True)
+            (root / ".notes/e.md").write_text("x")
+            (root / ".notes/.draft/f.md").write_text("x")
+            assert expand_inputs([".notes/**/*.md"]) == [Path(".notes/e.md")]
+            assert expand_inputs([str(root / ".notes" / "*.md")]) == [root / ".notes/e.md"]
+            assert expand_inputs(["https://example.com/x", "b.docx"]) == [
+                Url("https://example.com/x"),
+                Path("b.docx"),
+            ]
+        finally:
+            os.chdir(cwd)
@@ -6,25 +6,29 @@ publish your content to Textpress.
 For more information: https://textpress.md
 """
 
+# Imports here are kept to what's needed to parse arguments, so `--help`,
+# `--version`, and `setup` are fast. Everything else is imported lazily, when
+# a command needs it. `tests/test_import_time.py` checks this.
+
+from __future__ import annotations
+
 import argparse
 import sys
+import time
 import webbrowser
+from contextlib import nullcontext
 from importlib.metadata import version
 from pathlib import Path
 from textwrap import dedent
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 
-from clideps.env_vars.env_enum import MissingEnvVar
 from clideps.utils.readable_argparse import ReadableColorFormatter, get_readable_console_width
-from kash.utils.common.url import Url, is_url
-from prettyfmt import fmt_path
 from rich import get_console
 from rich import print as rprint
 
-from textpress.api.textpress_api import get_user
-from textpress.api.textpress_env import get_api_config
 from textpress.cli.cli_commands import (
     convert,
+    daemon,
     export,
     files,
     format,
@@ -32,8 +36,12 @@ from textpress.cli.cli_commands import (
     paste,
     publish,
     setup,
+    watch,
 )
 
+if TYPE_CHECKING:
+    from kash.utils.common.url import Url
+
 APP_NAME = "textpress"
 
 DESCRIPTION = """Textpress: Simple publishing for complex docs"""
@@ -41,18 +49,26 @@ DESCRIPTION = """Textpress: Simple publishing for complex docs"""
 
 DEFAULT_WORK_ROOT = Path("./textpress")
 
-ALL_COMMANDS = [help, setup, paste, files, convert, format, publish, export]
+ALL_COMMANDS = [help, setup, paste, files, convert, format, publish, watch, export, daemon]
+
+ACTION_COMMANDS = [convert, format, publish, watch, export]
+
+MULTI_INPUT_COMMANDS = [format, publish, watch, export]
+
+DAEMON_COMMANDS = [convert, format, publish, export]
+"""Commands that run in the daemon, if one is running for the work root."""
 
-ACTION_COMMANDS = [convert, format, publish, export]
+VERSION_PACKAGES = ["kash-shell", "kash-docs"]
+"""Dependencies whose versions are shown with `--version`."""
 
 
 def get_version_name(with_kash: bool = False) -> str:
     try:
         textpress_version = version(APP_NAME)
         if with_kash:
-            from kash.shell.version import get_full_version_name
-
-            return f"{APP_NAME} v{textpress_version} ({get_full_version_name(True)})"
+            # From package metadata, since importing kash to ask it is slow.
+            deps = ", ".join(f"{package} v{version(package)}" for package in VERSION_PACKAGES)
+            return f"{APP_NAME} v{textpress_version} ({deps})"
         else:
             return f"{APP_NAME} v{textpress_version}"
     except Exception:
@@ -86,6 +102,16 @@ def add_action_flags(parser: argparse.ArgumentParser) -> None:
         action="store_true",
         help="refetch cached web or media content, even if it is already in the workspace cache",
     )
+    parser.add_argument(
+        "--no_daemon",
+        action="store_true",
+        help="run directly, even if a background daemon is running (see `daemon`)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time each step of the run and save a Chrome trace of it in the logs directory",
+    )
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -122,7 +148,15 @@ def build_parser() -> argparse.ArgumentParser:
         # Options for all actions:
         if func in ACTION_COMMANDS:
             add_action_flags(subparser)
-            subparser.add_argument("input", type=str, help="Path or URL to the input file")
+            if func in MULTI_INPUT_COMMANDS:
+                subparser.add_argument(
+                    "input",
+                    type=str,
+                    nargs="+",
+                    help="Paths or URLs to the input files, or directories or globs of files",
+                )
+            else:
+                subparser.add_argument("input", type=str, help="Path or URL to the input file")
 
         # Options for convert command:
         if func in {convert}:
@@ -139,6 +173,7 @@ def build_parser() -> argparse.ArgumentParser:
                 action="store_true",
                 help="after it is complete, open the result in your web browser",
             )
+        if func in {format, publish, watch}:
             subparser.add_argument(
                 "--add_classes",
                 type=str,
@@ -150,6 +185,84 @@ def build_parser() -> argparse.ArgumentParser:
                 action="store_true",
                 help="Skip HTML/CSS/JS/Tailwind minification step.",
             )
+            subparser.add_argument(
+                "--precompress",
+                action="store_true",
+                help="write gzip/brotli compressed copies of the outputs and publish those",
+            )
+            subparser.add_argument(
+                "--optimize_images",
+                action="store_true",
+                help="scale down large images and add WebP/AVIF versions (needs Pillow)",
+            )
+            subparser.add_argument(
+                "--shared_assets",
+                action="store_true",
+                help="move the CSS/JS common to all pages into shared, long-cached files",
+            )
+
+        if func in {convert, format}:
+            subparser.add_argument(
+                "--pdf_chunk_pages",
+                type=int,
+                default=0,
+                help="convert PDFs this many pages at a time, in parallel, with progress (default: all at once)",
+            )
+            subparser.add_argument(
+                "--pdf_workers",
+                type=int,
+                default=None,
+                help="number of processes converting PDF chunks in parallel (default: 2)",
+            )
+            subparser.add_argument(
+                "--pdf_worker_memory",
+                type=int,
+                default=0,
+                help="memory cap for each PDF worker process, in MB (default: no cap)",
+            )
+
+        if func in {format, export}:
+            subparser.add_argument(
+                "--jobs",
+                type=int,
+                default=None,
+                help="number of processes handling documents in parallel (default: CPU count)",
+            )
+
+        if func in {watch}:
+            subparser.add_argument(
+                "--publish",
+                action="store_true",
+                help="publish changed documents, not just format them",
+            )
+            subparser.add_argument(
+                "--debounce",
+                type=float,
+                default=None,
+                help="seconds to wait for changes to settle before processing (default: 1.0)",
+            )
+
+        if func in {publish}:
+            subparser.add_argument(
+                "--jobs",
+                type=int,
+                default=None,
+                help="number of documents to format concurrently (default: 4)",
+            )
+
+        # `daemon` options:
+        if func in {daemon}:
+            subparser.add_argument(
+                "action",
+                choices=["start", "stop", "status", "run"],
+                help="start or stop the daemon, or show its status",
+            )
+            subparser.add_argument(
+                "--idle_timeout",
+                type=float,
+                default=None,
+                help="seconds without requests before the daemon exits, or 0 for never (default: 1800)",
+            )
 
         # `setup` options:
         if func in {setup}:
@@ -199,9 +312,16 @@ _placehoder_username = "<your_username>"
 
 
 def public_url_for(path: Path) -> Url:
+    from kash.utils.common.url import Url
+
+    from textpress.actions.textpress_publish import api_cache
+    from textpress.api.textpress_api import get_user
+    from textpress.api.textpress_env import get_api_config
+
     config = get_api_config()
     publish_root = config.publish_root
-    username = get_user(config).username
+    # Cached, so publishing several files only looks up the user once.
+    username = get_user(config, api_cache()).username
     if not username.strip():
         raise ValueError("Username is not set (configuration error?)")
     filename = path.name
@@ -211,6 +331,8 @@ def public_url_for(path: Path) -> Url:
 
 
 def local_url_for(path: Path) -> Url:
+    from kash.utils.common.url import Url
+
     return Url(f"file://{path.resolve()}")
 
 
@@ -219,10 +341,17 @@ def open_url(url: Url) -> None:
     webbrowser.open(url)
 
 
-def display_output(ws_path: Path, store_paths: list[Path], published_urls: list[Url]) -> None:
+def display_output(
+    ws_path: Path, store_paths: list[Path], published_urls: list[Url], failed: bool = False
+) -> None:
+    from prettyfmt import fmt_path
+
     rprint()
     rprint()
-    rprint("[bold green]Success![/bold green]")
+    if failed:
+        rprint("[bold yellow]Done, but some documents failed.[/bold yellow]")
+    else:
+        rprint("[bold green]Success![/bold green]")
     rprint(f"[bright_black]Processed files in the workspace: {fmt_path(ws_path)}[/bright_black]")
 
     if store_paths:
@@ -240,6 +369,32 @@ def display_output(ws_path: Path, store_paths: list[Path], published_urls: list[
     rprint()
 
 
+def save_profile(subcommand: str) -> None:
+    """
+    Stop tracing, save the trace, and show the time spent in each step.
+    """
+    from kash.config.logger import get_log_settings
+    from prettyfmt import fmt_path, fmt_size_human
+
+    from textpress.spans import span_totals, stop_trace, write_trace
+
+    events = stop_trace()
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    trace_path = get_log_settings().log_dir / f"textpress_{subcommand}_{timestamp}.trace.json"
+    write_trace(trace_path, events)
+
+    rprint()
+    rprint("[bright_black]Time by step (overlapping steps each count in full):[/bright_black]")
+    for total in span_totals(events):
+        size = f"  {fmt_size_human(total.bytes)}" if total.bytes else ""
+        rprint(
+            f"[bright_black]  {total.seconds:8.3f}s  {total.count:4}x  {total.name}{size}[/bright_black]"
+        )
+    rprint(
+        f"[bright_black]Trace (open in https://ui.perfetto.dev): {fmt_path(trace_path)}[/bright_black]"
+    )
+
+
 def clean_class_names(classes_str: str) -> str:
     """
     Clean and normalize space or comma-separated class names and remove quotes.
@@ -252,13 +407,21 @@ def clean_class_names(classes_str: str) -> str:
 def run_workspace_command(subcommand: str, args: argparse.Namespace) -> int:
     # Lazy imports! Can be slow so only do for processing commands.
     import httpx
+    from clideps.env_vars.env_enum import MissingEnvVar
     from kash.commands.base.show_command import show
     from kash.config.logger import CustomLogger, get_log_settings, get_logger
     from kash.config.setup import kash_setup
     from kash.exec import kash_runtime
+    from kash.exec.runtime_settings import current_runtime_settings
     from kash.model import ActionResult, Format
+    from kash.utils.common.url import Url, is_url
+    from prettyfmt import fmt_path
 
+    from textpress.api.textpress_env import get_api_config
+    from textpress.cli.cli_inputs import expand_inputs
+    from textpress.cli.cli_parallel import default_jobs, print_timings
     from textpress.cli.cli_setup import load_env
+    from textpress.spans import start_trace
 
     log: CustomLogger = get_logger(__name__)
 
@@ -277,9 +440,19 @@ def run_workspace_command(subcommand: str, args: argparse.Namespace) -> int:
 
     rerun = getattr(args, "rerun", False)
     refetch = getattr(args, "refetch", False)
-
-    # Run actions in the context of this workspace.
-    with kash_runtime(ws_path, rerun=rerun, refetch=refetch) as runtime:
+    profile = getattr(args, "profile", False)
+    if profile:
+        start_trace()
+
+    # Run actions in the context of this workspace. In the daemon, the runtime
+    # for the workspace with default settings is already entered and kept open.
+    runtime_manager = kash_runtime(ws_path, rerun=rerun, refetch=refetch)
+    runtime_context = (
+        nullcontext(runtime_manager.settings)
+        if current_runtime_settings() == runtime_manager.settings
+        else runtime_manager
+    )
+    with runtime_context as runtime:
         # Show the user the workspace info.
         runtime.workspace.log_workspace_info()
 
@@ -294,59 +467,100 @@ def run_workspace_command(subcommand: str, args: argparse.Namespace) -> int:
                 store_paths.append(store_path)
             elif subcommand == files.__name__:
                 files(all=args.all)
+            elif subcommand == publish.__name__:
+                inputs = expand_inputs(args.input, exclude=[ws_root])
+                result = publish(
+                    inputs,
+                    add_classes=clean_class_names(args.add_classes),
+                    no_minify=args.no_minify,
+                    precompress=args.precompress,
+                    optimize_images=args.optimize_images,
+                    shared_assets=args.shared_assets,
+                    jobs=args.jobs,
+                )
+
+                html_urls: list[Url] = []
+                for item in result.items:
+                    assert item.store_path
+                    url = public_url_for(ws_path / Path(item.store_path).name)
+                    store_paths.append(Path(item.store_path))
+                    published_urls.append(url)
+                    if item.format == Format.html:
+                        html_urls.append(url)
+
+                # Only open a browser for a single document, not a whole batch.
+                if args.show and len(html_urls) == 1 and _placehoder_username not in html_urls[0]:
+                    webbrowser.open(html_urls[0])
+            elif subcommand == watch.__name__:
+                watch(
+                    args.input,
+                    add_classes=clean_class_names(args.add_classes),
+                    no_minify=args.no_minify,
+                    precompress=args.precompress,
+                    optimize_images=args.optimize_images,
+                    shared_assets=args.shared_assets,
+                    and_publish=args.publish,
+                    debounce=args.debounce,
+                    exclude=[ws_root],
+                )
+            elif subcommand in (format.__name__, export.__name__):
+                inputs = expand_inputs(args.input, exclude=[ws_root])
+                jobs = args.jobs or default_jobs()
+                start = time.perf_counter()
+                if subcommand == export.__name__:
+                    outcomes = export(inputs, jobs=jobs)
+                else:
+                    outcomes = format(
+                        inputs,
+                        add_classes=clean_class_names(args.add_classes),
+                        no_minify=args.no_minify,
+                        precompress=args.precompress,
+                        optimize_images=args.optimize_images,
+                        shared_assets=args.shared_assets,
+                        pdf_chunk_pages=args.pdf_chunk_pages,
+                        pdf_workers=args.pdf_workers,
+                        pdf_worker_memory=args.pdf_worker_memory,
+                        jobs=jobs,
+                    )
+                for outcome in outcomes:
+                    store_paths.extend(outcome.store_paths)
+
+                if len(outcomes) > 1:
+                    print_timings(
+                        outcomes,
+                        time.perf_counter() - start,
+                        jobs=min(jobs, len(outcomes)),
+                        verb="Exported" if subcommand == export.__name__ else "Formatted",
+                    )
+                if any(outcome.error for outcome in outcomes):
+                    # Still show the documents that succeeded.
+                    if store_paths:
+                        display_output(ws_path, store_paths, published_urls, failed=True)
+                    log_file = get_log_settings().log_file_path
+                    rprint(
+                        f"[bright_black]See logs for more details: {fmt_path(log_file)}[/bright_black]"
+                    )
+                    return 2
+
+                html_paths = [p for p in store_paths if p.suffix == ".html"]
+                if getattr(args, "show", False) and len(html_paths) == 1:
+                    open_url(local_url_for(path=ws_path / html_paths[0]))
             else:
                 # Commands with a single input path and store path outputs.
                 input = Url(args.input) if is_url(args.input) else Path(args.input)
                 if subcommand == convert.__name__:
-                    result = convert(input)
+                    result = convert(
+                        input,
+                        pdf_chunk_pages=args.pdf_chunk_pages,
+                        pdf_workers=args.pdf_workers,
+                        pdf_worker_memory=args.pdf_worker_memory,
+                    )
                     assert result.items[0].store_path
                     store_paths.append(Path(result.items[0].store_path))
 
                     if args.show:
                         # Show the converted file using kash show command
                         show(str(ws_path / Path(result.items[0].store_path)), console=True)
-                elif subcommand == format.__name__:
-                    result = format(
-                        input,
-                        add_classes=clean_class_names(args.add_classes),
-                        no_minify=args.no_minify,
-                    )
-
-                    md_item = result.get_by_format(Format.markdown, Format.md_html)
-                    html_item = result.get_by_format(Format.html)
-                    assert md_item.store_path and html_item.store_path
-
-                    store_paths.extend([Path(md_item.store_path), Path(html_item.store_path)])
-
-                    local_url = local_url_for(path=ws_path / Path(html_item.store_path))
-                    if args.show:
-                        open_url(local_url)
-                elif subcommand == publish.__name__:
-                    result = publish(
-                        input,
-                        add_classes=clean_class_names(args.add_classes),
-                        no_minify=args.no_minify,
-                    )
-
-                    md_item = result.get_by_format(Format.markdown, Format.md_html)
-                    html_item = result.get_by_format(Format.html)
-                    assert md_item.store_path and html_item.store_path
-
-                    md_url = public_url_for(ws_path / Path(md_item.store_path).name)
-                    html_url = public_url_for(ws_path / Path(html_item.store_path).name)
-
-                    store_paths.extend([Path(md_item.store_path), Path(html_item.store_path)])
-                    published_urls.extend([md_url, html_url])
-                    if args.show and _placehoder_username not in html_url:
-                        webbrowser.open(html_url)
-                elif subcommand == export.__name__:
-                    result = export(input)
-
-                    docx_item = result.get_by_format(Format.docx)
-                    pdf_item = result.get_by_format(Format.pdf)
-                    assert docx_item.store_path and pdf_item.store_path
-
-                    store_paths.extend([Path(docx_item.store_path), Path(pdf_item.store_path)])
                 else:
                     raise ValueError(f"Unknown subcommand: {args.subcommand}")
 
@@ -376,6 +590,9 @@ def run_workspace_command(subcommand: str, args: argparse.Namespace) -> int:
             log_file = get_log_settings().log_file_path
             rprint(f"[bright_black]See logs for more details: {fmt_path(log_file)}[/bright_black]")
             return 2
+        finally:
+            if profile:
+                save_profile(subcommand)
 
     return 0
 
@@ -404,6 +621,16 @@ def main() -> None:
     elif subcommand == help.__name__:
         help()
         return
+    elif subcommand == daemon.__name__:
+        daemon(args.action, Path(args.work_root), idle_timeout=args.idle_timeout)
+        return
+
+    if subcommand in {f.__name__ for f in DAEMON_COMMANDS} and not args.no_daemon:
+        from textpress.cli.cli_daemon import run_in_daemon
+
+        exit_code = run_in_daemon(Path(args.work_root), sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
 
     sys.exit(run_workspace_command(subcommand, args))
 
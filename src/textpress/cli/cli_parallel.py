@@ -0,0 +1,315 @@
+"""
+Formatting (or exporting) many documents at once, fanned out across a pool of
+worker processes.
+
+Workers never write to the user's workspace. Each sets up kash the same way as
+the CLI, but in a private scratch workspace, and runs the action there. That
+does the slow work and leaves its results in the content-keyed caches
+(converted Markdown and PDFs, rendered and minified pages, optimized images,
+exports). The action is
+then run again in this process, one document at a time, where it mostly finds
+its results cached, and kash saves them to the workspace as usual.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from kash.utils.common.url import Url
+from prettyfmt import fmt_path
+from rich import print as rprint
+
+from textpress.docs.pdf_chunks import DEFAULT_PDF_WORKERS, chunking_available
+from textpress.spans import add_events, span, start_trace, take_events, tracing_enabled
+
+if TYPE_CHECKING:
+    from kash.config.logger import LogLevel
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
+
+
+@dataclass(frozen=True)
+class FormatOptions:
+    add_title: bool = False
+    add_classes: str | None = None
+    no_minify: bool = False
+    precompress: bool = False
+    optimize_images: bool = False
+    shared_assets: bool = False
+    pdf_chunk_pages: int = 0
+    pdf_workers: int = DEFAULT_PDF_WORKERS
+    pdf_worker_memory: int = 0
+
+
+@dataclass(frozen=True)
+class WorkerSetup:
+    """
+    What a worker process needs to recreate the CLI's kash runtime.
+    """
+
+    ws_root: Path
+    scratch_dir: Path
+    """Where each worker makes its own scratch workspace."""
+    console_log_level: LogLevel
+    rerun: bool = False
+    refetch: bool = False
+    profile: bool = False
+
+
+@dataclass
+class FormatOutcome:
+    """
+    Result of formatting (or exporting) one document.
+    """
+
+    input: Path | Url
+    store_paths: list[Path] = field(default_factory=list)
+    seconds: float = 0.0
+    error: str | None = None
+    trace_events: list[dict[str, Any]] = field(default_factory=list)
+    """Spans recorded in a worker process, if profiling."""
+
+
+def _run_one(input: Path | Url, verb: str, run: Callable[[], list[Path]]) -> FormatOutcome:
+    from kash.config.logger import get_logger
+
+    log = get_logger(__name__)
+    start = time.perf_counter()
+    try:
+        with span(verb, input=str(input)):
+            store_paths = run()
+    except Exception as e:
+        log.error("Error %s %s: %s: %s", verb, fmt_path(input), e.__class__.__name__, e)
+        log.info("Error details", exc_info=e)
+        return FormatOutcome(
+            input=input,
+            seconds=time.perf_counter() - start,
+            error=f"{e.__class__.__name__}: {e}",
+        )
+    return FormatOutcome(input=input, store_paths=store_paths, seconds=time.perf_counter() - start)
+
+
+def format_one(input: Path | Url, options: FormatOptions) -> FormatOutcome:
+    """
+    Format one document in the current kash runtime, capturing any failure.
+    """
+    from kash.exec import prepare_action_input
+    from kash.model import Format
+
+    from textpress.actions.textpress_format import precompress_outputs, textpress_format
+
+    def run() -> list[Path]:
+        format_args = asdict(options)
+        precompress = format_args.pop("precompress")
+        result = textpress_format(prepare_action_input(input), **format_args)
+        md_item = result.get_by_format(Format.markdown, Format.md_html)
+        html_item = result.get_by_format(Format.html)
+        assert md_item.store_path and html_item.store_path
+        if precompress:
+            precompress_outputs([md_item, html_item])
+        return [Path(md_item.store_path), Path(html_item.store_path)]
+
+    return _run_one(input, "formatting", run)
+
+
+def export_one(input: Path | Url) -> FormatOutcome:
+    """
+    Export one document as .docx and .pdf in the current kash runtime, capturing
+    any failure.
+    """
+    from kash.exec import prepare_action_input
+    from kash.model import Format
+
+    from textpress.actions.textpress_export import textpress_export
+
+    def run() -> list[Path]:
+        result = textpress_export(prepare_action_input(input))
+        docx_item = result.get_by_format(Format.docx)
+        pdf_item = result.get_by_format(Format.pdf)
+        assert docx_item.store_path and pdf_item.store_path
+        return [Path(docx_item.store_path), Path(pdf_item.store_path)]
+
+    return _run_one(input, "exporting", run)
+
+
+def _init_worker(setup: WorkerSetup) -> None:
+    from kash.config.setup import kash_setup
+    from kash.exec import kash_runtime
+
+    from textpress.cli.cli_setup import load_env
+
+    load_env()
+    if setup.profile:
+        start_trace()
+    kash_setup(
+        rich_logging=True, kash_ws_root=setup.ws_root, console_log_level=setup.console_log_level
+    )
+    # The runtime stays active for the life of the worker process.
+    scratch_ws = setup.scratch_dir / f"worker_{os.getpid()}"
+    kash_runtime(scratch_ws, rerun=setup.rerun, refetch=setup.refetch).__enter__()
+
+
+def _worker_setup(scratch_dir: Path) -> WorkerSetup:
+    from kash.config.logger import get_log_settings
+    from kash.exec.runtime_settings import current_runtime_settings
+
+    settings = current_runtime_settings()
+    return WorkerSetup(
+        ws_root=settings.workspace_dir.resolve().parent,
+        scratch_dir=scratch_dir,
+        console_log_level=get_log_settings().log_console_level,
+        rerun=settings.rerun,
+        refetch=settings.refetch,
+        profile=tracing_enabled(),
+    )
+
+
+def _run_traced(task: Callable[..., FormatOutcome], *args: Any) -> FormatOutcome:
+    # In a worker process, so send its spans back with the outcome.
+    outcome = task(*args)
+    outcome.trace_events = take_events()
+    return outcome
+
+
+def _run_in_workers(
+    task: Callable[..., FormatOutcome], inputs: list[Path | Url], args: tuple, jobs: int
+) -> list[FormatOutcome]:
+    with tempfile.TemporaryDirectory(prefix="textpress_scratch_") as scratch_dir:
+        # Spawn rather than fork, since the parent already has kash threads running.
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(_worker_setup(Path(scratch_dir)),),
+        ) as executor:
+            futures = {
+                executor.submit(_run_traced, task, input, *args): i
+                for i, input in enumerate(inputs)
+            }
+            outcomes: list[FormatOutcome | None] = [None] * len(inputs)
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    outcomes[i] = outcome = future.result()
+                    add_events(outcome.trace_events)
+                except Exception as e:
+                    # Only if the worker itself died.
+                    outcomes[i] = FormatOutcome(
+                        input=inputs[i], error=f"{e.__class__.__name__}: {e}"
+                    )
+    return [outcome for outcome in outcomes if outcome]
+
+
+def warm_caches(
+    task: Callable[..., FormatOutcome],
+    inputs: list[Path | Url],
+    *args: Any,
+    jobs: int,
+    cacheable: Callable[[Path | Url], bool] = lambda _input: True,
+) -> dict[Path | Url, FormatOutcome]:
+    """
+    Run `task(input, *args)` on documents in up to `jobs` worker processes, each
+    in its own scratch workspace, to do the slow work and fill the caches (see
+    above). `task` must be a module-level function, so it can be sent to workers.
+    Documents for which `cacheable` is false would be converted all over again
+    later, so they're skipped. Returns the outcome for each document run, or
+    nothing if there's no gain from workers.
+    """
+    from kash.exec.runtime_settings import current_runtime_settings
+
+    # With rerun, nothing is read from the caches, so filling them would be wasted.
+    cached_inputs = [] if current_runtime_settings().rerun else list(filter(cacheable, inputs))
+    jobs = min(jobs, len(cached_inputs))
+    if jobs <= 1:
+        return {}
+    return dict(zip(cached_inputs, _run_in_workers(task, cached_inputs, args, jobs), strict=True))
+
+
+def run_documents(
+    task: Callable[..., FormatOutcome],
+    inputs: list[Path | Url],
+    *args: Any,
+    jobs: int,
+    cacheable: Callable[[Path | Url], bool] = lambda _input: True,
+) -> list[FormatOutcome]:
+    """
+    Run `task(input, *args)` on each document in the current workspace, with the
+    slow work done first in worker processes by `warm_caches`. A failure on one
+    document doesn't stop the others. Outcomes are returned in input order.
+    """
+    warmed = warm_caches(task, inputs, *args, jobs=jobs, cacheable=cacheable)
+    outcomes: list[FormatOutcome] = []
+    for input in inputs:
+        warm = warmed.get(input)
+        if warm and warm.error:
+            outcomes.append(warm)
+            continue
+        outcome = task(input, *args)
+        if warm:
+            # The document's time is the worker's, where the work was done. Its
+            # rerun here is mostly cache hits, and runs after the workers finish.
+            outcome.seconds = warm.seconds
+        outcomes.append(outcome)
+    return outcomes
+
+
+def format_cacheable(input: Path | Url) -> bool:
+    """
+    Whether formatting a document leaves results in the caches to reuse. All
+    conversions are cached by content, except PDFs if they can't be split.
+    """
+    return chunking_available() or not str(input).lower().endswith(".pdf")
+
+
+def format_documents(
+    inputs: list[Path | Url], options: FormatOptions, jobs: int
+) -> list[FormatOutcome]:
+    """
+    Format documents, several at once. See `run_documents`.
+    """
+    return run_documents(format_one, inputs, options, jobs=jobs, cacheable=format_cacheable)
+
+
+def export_documents(inputs: list[Path | Url], jobs: int) -> list[FormatOutcome]:
+    """
+    Export documents, several at once. Each document's .docx and .pdf are also
+    generated concurrently, so work is pipelined across the batch.
+    """
+    return run_documents(export_one, inputs, jobs=jobs)
+
+
+def print_timings(
+    outcomes: list[FormatOutcome], wall_seconds: float, jobs: int, verb: str = "Formatted"
+) -> None:
+    """
+    Summary of a batch: counts, total and per-document times, and any failures.
+    """
+    failed = [o for o in outcomes if o.error]
+    doc_seconds = sum(o.seconds for o in outcomes)
+    rprint()
+    rprint(
+        f"[bright_black]{verb} {len(outcomes) - len(failed)} of {len(outcomes)} documents "
+        f"in {wall_seconds:.1f}s with {jobs} jobs "
+        f"({doc_seconds:.1f}s total, {doc_seconds / max(1, len(outcomes)):.1f}s per document, "
+        f"{doc_seconds / max(wall_seconds, 1e-9):.1f}x parallelism)[/bright_black]"
+    )
+    slowest = sorted(outcomes, key=lambda o: o.seconds, reverse=True)[:3]
+    if len(outcomes) > 1:
+        rprint("[bright_black]Slowest:[/bright_black]")
+        for o in slowest:
+            rprint(f"[bright_black]  {o.seconds:6.1f}s  {fmt_path(o.input)}[/bright_black]")
+    if failed:
+        rprint()
+        rprint(f"[bold red]Failed ({len(failed)}):[/bold red]")
+        for o in failed:
+            rprint(f"[red]  {fmt_path(o.input)}: {o.error}[/red]")
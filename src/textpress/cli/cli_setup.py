@@ -8,7 +8,6 @@ from clideps.env_vars.dotenv_utils import (
     load_dotenv_paths,
     update_env_file,
 )
-from clideps.ui.inputs import input_confirm, input_simple_string
 from clideps.ui.rich_output import (
     format_failure,
     format_success,
@@ -101,6 +100,9 @@ def show_setup() -> bool:
 
 
 def interactive_setup() -> None:
+    # Prompt libraries are slow to import, so only load them when prompting.
+    from clideps.ui.inputs import input_confirm, input_simple_string
+
     try:
         print_heading("Configuring environment variables")
 
@@ -0,0 +1,194 @@
+"""
+Watch mode: poll input documents (and their sidematter) for changes and re-run
+formatting or publishing in the same warm process.
+
+Polling avoids a platform-specific watcher dependency and is cheap at this
+scale: each poll is one stat per watched file.
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sidematter_format import Sidematter
+
+from textpress.cli.cli_inputs import expand_inputs
+
+DEFAULT_POLL_INTERVAL = 0.5
+"""Seconds between scans for changes."""
+
+DEFAULT_DEBOUNCE = 1.0
+"""Seconds with no further changes before processing, so a burst of saves is handled once."""
+
+DEFAULT_MAX_DELAY = 10.0
+"""Process pending changes after this long even if files keep changing."""
+
+FileState = tuple[int, int]
+"""Size and mtime_ns of a file."""
+
+
+def watched_files(doc: Path) -> list[Path]:
+    """
+    A document and its sidematter files (metadata and assets).
+    """
+    files = [doc]
+    sm = Sidematter(doc).resolve(parse_meta=False)
+    if sm.meta_path and sm.meta_path.exists():
+        files.append(sm.meta_path)
+    if sm.assets_dir and sm.assets_dir.is_dir():
+        files.extend(sorted(p for p in sm.assets_dir.rglob("*") if p.is_file()))
+    return files
+
+
+def scan(inputs: list[str], exclude: list[Path] | None = None) -> dict[Path, dict[Path, FileState]]:
+    """
+    Current state of each input document's files, keyed by document. Directories
+    and globs are re-expanded on each scan, so new documents are picked up.
+    URLs aren't watched.
+    """
+    found: list[Path] = []
+    for input in inputs:
+        try:
+            found += [
+                doc for doc in expand_inputs([input], exclude=exclude) if isinstance(doc, Path)
+            ]
+        except FileNotFoundError:
+            # Editors often save by replacing the file, so it may briefly be missing.
+            continue
+
+    docs: dict[Path, dict[Path, FileState]] = {}
+    for doc in dict.fromkeys(found):
+        states: dict[Path, FileState] = {}
+        for path in watched_files(doc):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            states[path] = (stat.st_size, stat.st_mtime_ns)
+        docs[doc] = states
+    return docs
+
+
+def changed_docs(
+    old: dict[Path, dict[Path, FileState]], new: dict[Path, dict[Path, FileState]]
+) -> list[Path]:
+    """
+    Documents that are new or whose own or sidematter files changed. Removed
+    documents are ignored.
+    """
+    return [doc for doc, states in new.items() if old.get(doc) != states]
+
+
+@dataclass
+class Debouncer:
+    """
+    Coalesces changes: a document changed several times is only processed once,
+    after `debounce` seconds with no further changes (or at most `max_delay`
+    seconds after its first pending change).
+    """
+
+    debounce: float = DEFAULT_DEBOUNCE
+    max_delay: float = DEFAULT_MAX_DELAY
+    pending: dict[Path, None] = field(default_factory=dict)
+    first_change: float = 0.0
+    last_change: float = 0.0
+
+    def add(self, docs: list[Path], now: float) -> None:
+        if not docs:
+            return
+        if not self.pending:
+            self.first_change = now
+        self.pending.update(dict.fromkeys(docs))
+        self.last_change = now
+
+    def ready(self, now: float) -> list[Path]:
+        """
+        Pending documents, if it's time to process them, and clears them.
+        """
+        if not self.pending:
+            return []
+        if now - self.last_change < self.debounce and now - self.first_change < self.max_delay:
+            return []
+        docs = list(self.pending)
+        self.pending.clear()
+        return docs
+
+
+def watch(
+    inputs: list[str],
+    on_change: Callable[[list[Path]], None],
+    *,
+    exclude: list[Path] | None = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    debounce: float = DEFAULT_DEBOUNCE,
+    initial: bool = True,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> None:
+    """
+    Call `on_change` with the changed documents whenever inputs change, until
+    `should_stop()` is true (or forever). If `initial` is set, all documents are
+    processed once at the start.
+    """
+    debouncer = Debouncer(debounce=debounce)
+    state = scan(inputs, exclude)
+    if initial and state:
+        on_change(list(state))
+        # Don't re-trigger on changes made before or during the first run.
+        state = scan(inputs, exclude)
+
+    while not should_stop():
+        time.sleep(poll_interval)
+        new_state = scan(inputs, exclude)
+        debouncer.add(changed_docs(state, new_state), time.monotonic())
+        state = new_state
+
+        docs = debouncer.ready(time.monotonic())
+        if docs:
+            on_change(docs)
+            # Edits made while processing are picked up on the next scan.
+
+
+## Tests
+
+
+def test_debouncer():
+    a, b = Path("a.md"), Path("b.md")
+    debouncer = Debouncer(debounce=1.0, max_delay=5.0)
+    debouncer.add([a], now=0.0)
+    debouncer.add([a, b], now=0.5)
+    assert debouncer.ready(now=1.0) == []
+    assert debouncer.ready(now=1.6) == [a, b]
+    assert debouncer.ready(now=2.0) == []
+
+    # Continuous changes are still processed after `max_delay`.
+    for i in range(10):
+        debouncer.add([a], now=10.0 + i * 0.6)
+        if debouncer.ready(now=10.0 + i * 0.6) == [a]:
+            break
+    assert 10.0 + i * 0.6 >= 15.0
+
+
+def test_scan_changes():
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        doc = root / "doc.md"
+        doc.write_text("# Doc")
+        (root / "doc.assets").mkdir()
+        image = root / "doc.assets" / "image.png"
+        image.write_bytes(b"png")
+
+        before = scan([str(root)])
+        assert list(before) == [doc]
+        assert set(before[doc]) == {doc, image}
+
+        image.write_bytes(b"png2")
+        other = root / "other.md"
+        other.write_text("# Other")
+        os.utime(image, ns=(0, 1))
+        assert changed_docs(before, scan([str(root)])) == [doc, other]
@@ -0,0 +1,248 @@
+"""
+Minification of formatted pages with tminify, memoized at two levels:
+
+- The minified page, by a hash of the input HTML, so re-formatting an
+  unchanged document skips minification entirely.
+- The compiled Tailwind CSS, by the page's `<style>` sources and the set of
+  Tailwind classes it uses. Documents using the same template usually share
+  these, so Tailwind only runs for the first of them.
+
+Tailwind finds classes by scanning the whole page (text, attributes and
+scripts) for candidates, so only Tailwind can tell which of a page's tokens
+are classes. Each compile records which of the tokens it was given had rules
+in the output, and a page whose tokens were all seen before is keyed by just
+its classes. A page with new tokens (like new words in its text) is compiled
+again, from a stand-in page listing all its tokens, so the CSS is the same as
+tminify would compile from the page itself.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import tempfile
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+from tminify.main import STYLE_TAG_PATTERN, tminify
+from tminify.version import get_version_name
+
+from textpress.docs.render_cache import RenderCache
+
+log = logging.getLogger(__name__)
+
+MINIFIED_CACHE_DIR_NAME = "textpress_minified"
+"""Minified pages by input hash, kept in the cache directory."""
+
+TAILWIND_CACHE_DIR_NAME = "textpress_tailwind_css"
+"""Compiled Tailwind CSS by class set, kept in the cache directory."""
+
+TAILWIND_TOKENS_CACHE_DIR_NAME = "textpress_tailwind_tokens"
+"""Tokens seen by Tailwind and whether they were classes, by `<style>` sources."""
+
+TAILWIND_CDN_SCRIPT = '<script src="https://cdn.jsdelivr.net/npm/@tailwindcss/browser@4"></script>'
+
+TAILWIND_CDN_PATTERN = re.compile(
+    r'<script[^>]*src=["\'][^"\']*@tailwindcss/browser[^"\']*["\'][^>]*></script>', re.I
+)
+"""Same as tminify's check for the Tailwind v4 CDN script."""
+
+_STYLE_TAG = re.compile(STYLE_TAG_PATTERN, re.DOTALL | re.I)
+_DECLARATIONS = re.compile(r"\{[^{}]*\}")
+_CLASS_SELECTOR = re.compile(r"\.((?:[\w-]|\\[0-9a-fA-F]{1,6} ?|\\[^0-9a-fA-F\n])+)")
+_CSS_ESCAPE = re.compile(r"\\([0-9a-fA-F]{1,6}) ?|\\(.)")
+
+
+@dataclass(frozen=True)
+class MinifyCaches:
+    pages: RenderCache
+    tailwind_css: RenderCache
+    tailwind_tokens: RenderCache
+
+    def log_stats(self) -> None:
+        log.info(
+            "Minify cache: pages %s hits, %s misses; Tailwind CSS %s hits, %s misses",
+            self.pages.hits,
+            self.pages.misses,
+            self.tailwind_css.hits,
+            self.tailwind_css.misses,
+        )
+
+
+@cache
+def minify_caches(cache_dir: Path) -> MinifyCaches:
+    return MinifyCaches(
+        pages=RenderCache(cache_dir / MINIFIED_CACHE_DIR_NAME),
+        tailwind_css=RenderCache(cache_dir / TAILWIND_CACHE_DIR_NAME, suffix=".css"),
+        tailwind_tokens=RenderCache(cache_dir / TAILWIND_TOKENS_CACHE_DIR_NAME, suffix=".json"),
+    )
+
+
+def _cache_key(*parts: str) -> str:
+    # The tminify version covers its minifier and Tailwind versions too.
+    hasher = hashlib.sha256(get_version_name().encode())
+    for part in parts:
+        hasher.update(b"\0" + part.encode())
+    return hasher.hexdigest()
+
+
+def page_tokens(html: str) -> set[str]:
+    """
+    The page's whitespace-separated tokens, outside `<style>` tags. Tailwind
+    candidates never contain whitespace, so each one is within a single token.
+    """
+    return set(_STYLE_TAG.sub("", html).split())
+
+
+def css_class_names(css: str) -> set[str]:
+    """
+    Unescaped names of the classes in the CSS's selectors.
+    """
+    selectors = _DECLARATIONS.sub("{}", css)
+    return {
+        _CSS_ESCAPE.sub(lambda m: m.group(2) or chr(int(m.group(1), 16)), m.group(1))
+        for m in _CLASS_SELECTOR.finditer(selectors)
+    }
+
+
+def compile_tailwind_css(tokens: set[str], style_css: str) -> str:
+    """
+    Compile Tailwind CSS for a page with the given tokens and `<style>` sources,
+    by running tminify on a stand-in page with the tokens one per line.
+    """
+    page = (
+        f"<html><head>{TAILWIND_CDN_SCRIPT}<style>{style_css}</style></head><body>\n"
+        + "\n".join(sorted(tokens))
+        + "\n</body></html>"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        src_path = Path(tmp) / "tokens.html"
+        out_path = Path(tmp) / "tokens.out.html"
+        src_path.write_text(page)
+        tminify(src_path, out_path, minify_html=False)
+        match = _STYLE_TAG.search(out_path.read_text())
+    if not match:
+        raise ValueError("No compiled CSS in Tailwind output")
+    return match.group(1)
+
+
+def _load_tokens(caches: MinifyCaches, key: str) -> dict[str, bool]:
+    data = caches.tailwind_tokens.get(key)
+    try:
+        return json.loads(data) if data else {}
+    except ValueError:
+        return {}
+
+
+def inline_tailwind(html: str, caches: MinifyCaches, rerun: bool = False) -> str:
+    """
+    If the page uses the Tailwind CDN script, replace it (and the page's
+    `<style>` tags, which Tailwind compiles in) with the compiled CSS, as
+    tminify does, but reusing CSS already compiled for the same classes.
+    """
+    if not TAILWIND_CDN_PATTERN.search(html):
+        return html
+
+    style_css = "\n".join(_STYLE_TAG.findall(html))
+    tokens = page_tokens(html)
+    tokens_key = _cache_key("tailwind_tokens", style_css)
+    known = _load_tokens(caches, tokens_key)
+
+    css = None
+    if not rerun and tokens <= known.keys():
+        classes = sorted(token for token in tokens if known[token])
+        key = _cache_key("tailwind", style_css, "\n".join(classes))
+        css = caches.tailwind_css.get(key)
+        if css is not None:
+            log.info("Using cached Tailwind CSS for %s classes: %s", len(classes), key)
+
+    if css is None:
+        css = compile_tailwind_css(tokens, style_css)
+        # A token that produced a rule contains its class name. Others produced
+        # nothing, so they don't affect the CSS of any page.
+        names = css_class_names(css)
+        seen = {token: any(name in token for name in names) for token in tokens}
+        classes = sorted(token for token, is_class in seen.items() if is_class)
+        caches.tailwind_css.put(_cache_key("tailwind", style_css, "\n".join(classes)), css)
+        # Reloaded, so tokens seen by other processes meanwhile are kept.
+        known = _load_tokens(caches, tokens_key)
+        caches.tailwind_tokens.put(tokens_key, json.dumps({**known, **seen}))
+
+    html = _STYLE_TAG.sub("", html)
+    return TAILWIND_CDN_PATTERN.sub(lambda _m: f"<style>{css}</style>", html, count=1)
+
+
+def minify_page(html: str, cache_dir: Path, rerun: bool = False) -> str:
+    """
+    Compile Tailwind (if used) and minify a full HTML page, using cached results
+    when possible, unless `rerun` is set.
+    """
+    caches = minify_caches(cache_dir)
+    key = _cache_key("page", html)
+    minified = None if rerun else caches.pages.get(key)
+    if minified is not None:
+        log.info("Using cached minified page: %s", key)
+    else:
+        processed = inline_tailwind(html, caches, rerun=rerun)
+        with tempfile.TemporaryDirectory() as tmp:
+            src_path = Path(tmp) / "page.html"
+            out_path = Path(tmp) / "page.min.html"
+            src_path.write_text(processed)
+            tminify(src_path, out_path)
+            minified = out_path.read_text()
+        caches.pages.put(key, minified)
+    caches.log_stats()
+    return minified
+
+
+## Tests
+
+
+def test_css_class_names():
+    css = (
+        ".flex{display:flex}.md\\:p-4:hover{padding:1rem}.\\32 xl\\:w-\\[3\\.5rem\\]{width:3.5rem}"
+        "@media (width>=40rem){.sm\\:block{display:block}}:where(.group):hover .x{top:0}"
+    )
+    assert css_class_names(css) == {"flex", "md:p-4", "2xl:w-[3.5rem]", "sm:block", "group", "x"}
+
+
+def test_inline_tailwind_reuses_css():
+    with tempfile.TemporaryDirectory() as tmp:
+        caches = minify_caches(Path(tmp))
+        template = (
+            f"<html><head>{TAILWIND_CDN_SCRIPT}<style>.x {{ @apply flex; }}</style></head>"
+            '<body class="p-4"><p> {text} </p></body></html>'
+        )
+        css = ".p-4{padding:1rem}.x{display:flex}"
+        # As if compiled before, for a page with the same template and different text.
+        tokens = page_tokens(template.replace("{text}", "Old text"))
+        known = {token: "p-4" in token for token in tokens}
+        caches.tailwind_tokens.put(
+            _cache_key("tailwind_tokens", ".x { @apply flex; }"), json.dumps(known)
+        )
+        classes = "\n".join(sorted(token for token in tokens if known[token]))
+        caches.tailwind_css.put(_cache_key("tailwind", ".x { @apply flex; }", classes), css)
+
+        page = template.replace("{text}", "text Old")
+        assert inline_tailwind(page, caches) == (
+            f"<html><head><style>{css}</style></head>"
+            '<body class="p-4"><p> text Old </p></body></html>'
+        )
+        assert (caches.tailwind_css.hits, caches.tailwind_css.misses) == (1, 0)
+
+        # Pages without Tailwind are left alone.
+        assert inline_tailwind("<p>Hi</p>", caches) == "<p>Hi</p>"
+
+
+def test_minify_page_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = Path(tmp)
+        page = "<html><body><p>Hello</p></body></html>"
+        # As if minified before.
+        minify_caches(cache_dir).pages.put(_cache_key("page", page), "<p>Hello")
+
+        assert minify_page(page, cache_dir) == "<p>Hello"
+        assert minify_caches(cache_dir).pages.hits == 1
@@ -0,0 +1,388 @@
+"""
+Optimization of a page's local images. Oversized images are scaled down, and
+WebP (and AVIF, if Pillow supports it) versions are added at a few widths, so
+browsers can pick the smallest suitable file. Each `<img>` becomes a
+`<picture>` with a `srcset` per format, keeping the original format as the
+fallback, and gets `width`/`height` so the layout doesn't shift as it loads.
+
+Images are changed in the page's own copy of its assets (the export), never
+in the source document's. Encoded images (and each source's format and size)
+are cached by source hash, so re-formatting only decodes and encodes new or
+changed images.
+
+Needs Pillow (installed with kash-docs). Without it, images are left as is.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import logging
+import posixpath
+import re
+import shutil
+from dataclasses import dataclass, field
+from functools import cache
+from importlib.util import find_spec
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import quote, unquote, urlparse
+
+from strif import atomic_output_file, hash_file
+
+if TYPE_CHECKING:
+    from PIL.Image import Image
+
+log = logging.getLogger(__name__)
+
+IMAGE_CACHE_VERSION = 1
+"""Bump if encoding settings change, so cached images are re-encoded."""
+
+MAX_IMAGE_WIDTH = 1600
+"""Wider images are scaled down (twice the content column width, for high-DPI screens)."""
+
+SRCSET_WIDTHS = (480, 960, 1600)
+"""Widths offered in `srcset`s, besides the image's own width if that's smaller."""
+
+IMAGE_SIZES = "(max-width: 800px) 100vw, 800px"
+"""The `sizes` hint: images display at most at about the content column width."""
+
+MIN_OPTIMIZE_BYTES = 8 * 1024
+"""Smaller images aren't worth the extra files."""
+
+OPTIMIZABLE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+"""Raster formats we re-encode. GIFs may be animated, so are left alone."""
+
+MODERN_FORMATS: dict[str, tuple[str, str]] = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+}
+"""Pillow format and MIME type of the formats we add, in order of preference."""
+
+SAVE_OPTIONS: dict[str, dict[str, Any]] = {
+    "AVIF": {"quality": 60},
+    "WEBP": {"quality": 80, "method": 6},
+    "JPEG": {"quality": 85, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+}
+"""Pillow save options by format."""
+
+_IMG_TAG = re.compile(r"<img\b[^>]*>", re.I)
+_ATTR = re.compile(r"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)))?""")
+
+
+@cache
+def available_formats() -> tuple[str, ...]:
+    """
+    Modern formats we can encode. Empty if Pillow isn't installed.
+    """
+    if not find_spec("PIL"):
+        log.warning("Pillow isn't installed, so images won't be optimized")
+        return ()
+    from PIL import features
+
+    return tuple(fmt for fmt in MODERN_FORMATS if features.check(fmt))
+
+
+@dataclass(frozen=True)
+class SourceInfo:
+    """
+    What we need to know about a source image to pick its variants.
+    """
+
+    pil_format: str
+    width: int
+    height: int
+    """Size once rotated upright per its EXIF orientation."""
+
+
+def _decode(path: Path) -> tuple[SourceInfo, Image]:
+    from PIL import Image as PILImage
+    from PIL import ImageOps
+
+    with PILImage.open(path) as opened:
+        pil_format = opened.format or "PNG"
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+    return SourceInfo(pil_format, image.width, image.height), image
+
+
+class _LazyImage:
+    """
+    A source image, only decoded when first needed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._decoded: tuple[SourceInfo, Image] | None = None
+
+    def _decode(self) -> tuple[SourceInfo, Image]:
+        if self._decoded is None:
+            self._decoded = _decode(self.path)
+        return self._decoded
+
+    @property
+    def decoded(self) -> bool:
+        return self._decoded is not None
+
+    @property
+    def info(self) -> SourceInfo:
+        return self._decode()[0]
+
+    @property
+    def image(self) -> Image:
+        return self._decode()[1]
+
+
+@dataclass(frozen=True)
+class OptimizedImage:
+    width: int
+    height: int
+    sources: dict[str, list[tuple[Path, int]]]
+    """Variant files and their widths, by MIME type, in order of preference."""
+
+
+@dataclass
+class ImageOptimizer:
+    """
+    Optimizes images in place, caching encoded images in `cache_dir`.
+    """
+
+    cache_dir: Path
+    formats: list[str] = field(default_factory=lambda: list(available_formats()))
+    hits: int = 0
+    misses: int = 0
+    decodes: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    def _source_info(self, source_hash: str, source: _LazyImage) -> SourceInfo:
+        info_path = self.cache_dir / f"{source_hash}-v{IMAGE_CACHE_VERSION}.json"
+        try:
+            return SourceInfo(**json.loads(info_path.read_text()))
+        except (FileNotFoundError, ValueError, TypeError):
+            pass
+        info = source.info
+        with atomic_output_file(info_path, make_parents=True) as tmp_path:
+            Path(tmp_path).write_text(json.dumps(info.__dict__))
+        return info
+
+    def _encoded(self, source_hash: str, source: _LazyImage, width: int, pil_format: str) -> Path:
+        """
+        The image scaled to `width` and encoded, from the cache if possible.
+        """
+        from PIL import Image as PILImage
+
+        ext = pil_format.lower()
+        cache_path = self.cache_dir / f"{source_hash}-v{IMAGE_CACHE_VERSION}-{width}.{ext}"
+        if cache_path.exists():
+            self.hits += 1
+            return cache_path
+        self.misses += 1
+
+        image = source.image
+        if width < image.width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), PILImage.Resampling.LANCZOS)
+        if pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, **SAVE_OPTIONS.get(pil_format, {}))
+        with atomic_output_file(cache_path, make_parents=True) as tmp_path:
+            Path(tmp_path).write_bytes(buffer.getvalue())
+        return cache_path
+
+    def optimize(self, path: Path) -> OptimizedImage | None:
+        """
+        Scale down the image at `path` if it's oversized and write modern format
+        variants next to it. Returns None if the image was left alone.
+        """
+        if not self.formats or path.suffix.lower() not in OPTIMIZABLE_SUFFIXES:
+            return None
+        size = path.stat().st_size
+        if size < MIN_OPTIMIZE_BYTES:
+            return None
+
+        from PIL import UnidentifiedImageError
+
+        # Decoding is slow, so it's only done if something isn't cached.
+        source = _LazyImage(path)
+        source_hash = hash_file(path, "sha256").hex[:24]
+        try:
+            info = self._source_info(source_hash, source)
+        except (UnidentifiedImageError, OSError) as e:
+            log.warning("Not optimizing unreadable image: %s: %s", path, e)
+            return None
+        pil_format = info.pil_format
+        width = min(info.width, MAX_IMAGE_WIDTH)
+        height = round(info.height * width / info.width)
+
+        # Replace an oversized original with a scaled-down copy in the same format.
+        if info.width > MAX_IMAGE_WIDTH:
+            shutil.copyfile(self._encoded(source_hash, source, width, pil_format), path)
+        fallback_size = path.stat().st_size
+
+        widths = sorted({w for w in SRCSET_WIDTHS if w < width} | {width})
+        sources: dict[str, list[tuple[Path, int]]] = {}
+        total_size = fallback_size
+        for fmt in self.formats:
+            pil_fmt, mime = MODERN_FORMATS[fmt]
+            if pil_fmt == pil_format:
+                continue
+            variants = [
+                (self._encoded(source_hash, source, w, pil_fmt), path.with_suffix(f".{w}w.{fmt}"))
+                for w in widths
+            ]
+            # Only worth offering if it's smaller than the fallback.
+            if variants[-1][0].stat().st_size >= fallback_size:
+                continue
+            for cache_path, out_path in variants:
+                shutil.copyfile(cache_path, out_path)
+            sources[mime] = [
+                (out_path, w) for (_c, out_path), w in zip(variants, widths, strict=True)
+            ]
+            total_size += sum(out_path.stat().st_size for out_path, _w in sources[mime])
+
+        self.decodes += source.decoded
+        self.bytes_before += size
+        self.bytes_after += fallback_size
+        log.info(
+            "Optimized image %s: %s -> %s bytes, plus %s variants (%s bytes total)",
+            path,
+            size,
+            fallback_size,
+            sum(len(v) for v in sources.values()),
+            total_size,
+        )
+        return OptimizedImage(width=width, height=height, sources=sources)
+
+
+def _parse_attrs(tag: str) -> dict[str, str | None]:
+    # Raw attribute values, as written (still HTML-escaped).
+    inner = tag[len("<img") :].rstrip(">").rstrip("/")
+    return {
+        m.group(1).lower(): next((g for g in m.groups()[1:] if g is not None), None)
+        for m in _ATTR.finditer(inner)
+    }
+
+
+def _format_attrs(attrs: dict[str, str | None]) -> str:
+    return "".join(
+        f" {name}" if value is None else f' {name}="{value.replace(chr(34), "&quot;")}"'
+        for name, value in attrs.items()
+    )
+
+
+def _local_image(src: str, page_dir: Path) -> Path | None:
+    url = urlparse(src)
+    if url.scheme or url.netloc or src.startswith("/"):
+        return None
+    path = (page_dir / unquote(url.path)).resolve()
+    if not path.is_relative_to(page_dir.resolve()) or not path.is_file():
+        return None
+    return path
+
+
+def _srcset(src: str, variants: list[tuple[Path, int]]) -> str:
+    src_dir = posixpath.dirname(urlparse(src).path)
+    return ", ".join(
+        f"{posixpath.join(src_dir, quote(out_path.name))} {width}w" for out_path, width in variants
+    )
+
+
+def optimize_page_images(html: str, page_dir: Path, optimizer: ImageOptimizer) -> str:
+    """
+    Optimize the local images of a page in `page_dir` and rewrite its `<img>`
+    tags to use them. Images already with a `srcset` or in a `<picture>` are
+    left alone.
+    """
+
+    def replace(match: re.Match[str]) -> str:
+        tag = match.group(0)
+        before = match.string[: match.start()].lower()
+        if before.rfind("<picture") > before.rfind("</picture"):
+            return tag
+        attrs = _parse_attrs(tag)
+        src = attrs.get("src")
+        if not src or "srcset" in attrs:
+            return tag
+        path = _local_image(src, page_dir)
+        optimized = path and optimizer.optimize(path)
+        if not optimized:
+            return tag
+
+        attrs.setdefault("width", str(optimized.width))
+        attrs.setdefault("height", str(optimized.height))
+        attrs.setdefault("loading", "lazy")
+        attrs.setdefault("decoding", "async")
+        img = f"<img{_format_attrs(attrs)}>"
+        if not optimized.sources:
+            return img
+        sources = "".join(
+            f'<source type="{mime}" srcset="{_srcset(src, variants)}" sizes="{IMAGE_SIZES}">'
+            for mime, variants in optimized.sources.items()
+        )
+        return f"<picture>{sources}{img}</picture>"
+
+    result = _IMG_TAG.sub(replace, html)
+    if optimizer.bytes_before:
+        log.info(
+            "Image optimization: %s -> %s bytes for originals; %s cached, %s new encodes",
+            optimizer.bytes_before,
+            optimizer.bytes_after,
+            optimizer.hits,
+            optimizer.misses,
+        )
+    return result
+
+
+## Tests
+
+
+def test_optimize_page_images():
+    import random
+    import tempfile
+
+    from PIL import Image as PILImage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        page_dir = Path(tmp) / "page"
+        assets_dir = page_dir / "doc.assets"
+        assets_dir.mkdir(parents=True)
+        # Noise, so it doesn't compress to almost nothing.
+        noise = random.Random(0).randbytes(2000 * 1000 * 3)
+        original = Path(tmp) / "original.png"
+        PILImage.frombytes("RGB", (2000, 1000), noise).save(original)
+        shutil.copyfile(original, assets_dir / "big shot.png")
+        PILImage.new("RGB", (40, 20)).save(assets_dir / "tiny.png")
+
+        html = (
+            '<p><img src="doc.assets/big%20shot.png" alt="A &quot;shot&quot;" /></p>'
+            '<img src="doc.assets/tiny.png"><img src="https://example.com/x.png">'
+        )
+        optimizer = ImageOptimizer(Path(tmp) / "cache", formats=["webp"])
+        result = optimize_page_images(html, page_dir, optimizer)
+
+        srcset = ", ".join(
+            f"doc.assets/big%20shot.{w}w.webp {w}w" for w in (480, 960, MAX_IMAGE_WIDTH)
+        )
+        assert result == (
+            f'<p><picture><source type="image/webp" srcset="{srcset}" sizes="{IMAGE_SIZES}">'
+            '<img src="doc.assets/big%20shot.png" alt="A &quot;shot&quot;" width="1600" '
+            'height="800" loading="lazy" decoding="async"></picture></p>'
+            '<img src="doc.assets/tiny.png"><img src="https://example.com/x.png">'
+        )
+        with PILImage.open(assets_dir / "big shot.png") as fallback:
+            assert fallback.size == (1600, 800)
+        with PILImage.open(assets_dir / "big shot.480w.webp") as variant:
+            assert variant.size == (480, 240)
+        assert (optimizer.hits, optimizer.misses, optimizer.decodes) == (0, 4, 1)
+
+        # Formatting again (with a fresh copy of the original) only uses the cache,
+        # without decoding the image.
+        shutil.copyfile(original, assets_dir / "big shot.png")
+        optimizer = ImageOptimizer(Path(tmp) / "cache", formats=["webp"])
+        assert optimize_page_images(html, page_dir, optimizer) == result
+        assert (optimizer.hits, optimizer.misses, optimizer.decodes) == (4, 0, 0)
@@ -0,0 +1,362 @@
+"""
+Conversion of large PDFs to Markdown in chunks of pages. The PDF is split into
+page ranges, which are converted across a pool of worker processes (each with
+an optional memory cap), and the Markdown is joined back together in page
+order, so the result doesn't depend on which chunk finishes first.
+
+Each chunk's result is cached by a hash of the chunk's content, so converting
+a PDF again (or an edited version of it, where only some pages changed) only
+converts the chunks that are new. Progress is reported as each chunk finishes.
+
+Splitting uses pypdfium2 (installed with Marker). Without it, callers should
+convert the whole PDF at once.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import re
+import tempfile
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
+from importlib.util import find_spec
+from pathlib import Path
+
+from textpress.docs.render_cache import RenderCache
+
+log = logging.getLogger(__name__)
+
+PDF_CHUNK_CACHE_DIR_NAME = "textpress_pdf_chunks"
+"""Converted PDF chunks by content hash, kept in the cache directory."""
+
+CHUNK_CACHE_VERSION = 1
+"""Bump if chunk conversion changes, so cached chunks are converted again."""
+
+DEFAULT_CHUNK_PAGES = 20
+"""Pages per chunk. Smaller chunks use less memory per worker and show more progress."""
+
+DEFAULT_PDF_WORKERS = 2
+"""Worker processes converting chunks. Each loads its own converter models."""
+
+CONVERTER_PACKAGES = {"marker": "marker-pdf", "markitdown": "markitdown"}
+
+_SAVE_STAMPS = re.compile(
+    rb"/ID\s*\[\s*<[0-9A-Fa-f]*>\s*<[0-9A-Fa-f]*>\s*\]|/CreationDate\s*\([^)]*\)"
+)
+"""The file ID and creation date set on each save, which aren't part of the content."""
+
+
+@cache
+def chunking_available() -> bool:
+    if not find_spec("pypdfium2"):
+        log.warning("pypdfium2 isn't installed, so PDFs will be converted in one pass")
+        return False
+    return True
+
+
+@dataclass(frozen=True)
+class PdfChunk:
+    first_page: int
+    """1-based, inclusive."""
+    last_page: int
+    path: Path
+    content_hash: str
+
+    @property
+    def pages(self) -> str:
+        return f"{self.first_page}-{self.last_page}"
+
+
+@dataclass(frozen=True)
+class ChunkResult:
+    markdown: str
+    images: dict[str, bytes] = field(default_factory=dict)
+    """Encoded image files, by filename."""
+
+    def to_json(self) -> str:
+        images = {name: base64.b64encode(data).decode() for name, data in self.images.items()}
+        return json.dumps({"markdown": self.markdown, "images": images})
+
+    @classmethod
+    def from_json(cls, data: str) -> ChunkResult:
+        parsed = json.loads(data)
+        images = {name: base64.b64decode(value) for name, value in parsed["images"].items()}
+        return cls(markdown=parsed["markdown"], images=images)
+
+
+def split_pdf(pdf_path: Path, out_dir: Path, chunk_pages: int) -> list[PdfChunk]:
+    """
+    Split a PDF into files of up to `chunk_pages` pages each (or one file, if
+    `chunk_pages` is 0), in page order.
+    """
+    import pypdfium2 as pdfium
+
+    source = pdfium.PdfDocument(pdf_path)
+    chunk_pages = chunk_pages or max(1, len(source))
+    try:
+        chunks = []
+        for start in range(0, len(source), chunk_pages):
+            end = min(start + chunk_pages, len(source))
+            chunk_doc = pdfium.PdfDocument.new()
+            chunk_doc.import_pages(source, list(range(start, end)))
+            buffer = io.BytesIO()
+            chunk_doc.save(buffer)
+            chunk_doc.close()
+            data = buffer.getvalue()
+            path = out_dir / f"pages_{start + 1:05d}-{end:05d}.pdf"
+            path.write_bytes(data)
+            content_hash = hashlib.sha256(_SAVE_STAMPS.sub(b"", data)).hexdigest()
+            chunks.append(PdfChunk(start + 1, end, path, content_hash))
+    finally:
+        source.close()
+    return chunks
+
+
+@cache
+def marker_models() -> dict:
+    """
+    Marker's models, loaded once per process (each worker, or the daemon) and
+    reused for all its conversions, since loading them is slow.
+    """
+    from marker.models import create_model_dict
+
+    return create_model_dict()
+
+
+def convert_chunk(pdf_path: Path, converter: str) -> ChunkResult:
+    """
+    Convert one PDF (usually a chunk of a larger one) to Markdown.
+    """
+    if converter == "markitdown":
+        from kash.kits.docs.doc_formats.convert_pdf_markitdown import pdf_to_md_markitdown
+
+        return ChunkResult(markdown=pdf_to_md_markitdown(pdf_path).markdown)
+    elif converter == "marker":
+        from marker.converters.pdf import PdfConverter
+        from marker.output import text_from_rendered
+
+        rendered = PdfConverter(artifact_dict=marker_models())(str(pdf_path))
+        markdown, _, images = text_from_rendered(rendered)
+        encoded = {}
+        for name, image in images.items():
+            buffer = io.BytesIO()
+            image.save(buffer, format=None if Path(name).suffix else "PNG")
+            encoded[name] = buffer.getvalue()
+        return ChunkResult(markdown=str(markdown or ""), images=encoded)
+    else:
+        raise ValueError(f"Invalid PDF converter: {converter}")
+
+
+def _init_worker(max_memory_mb: int) -> None:
+    if max_memory_mb:
+        import resource
+
+        # Caps the worker's address space, so a runaway chunk fails with a
+        # MemoryError instead of taking down the machine.
+        limit = max_memory_mb * 1024 * 1024
+        _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _prefixed_images(chunk: PdfChunk, result: ChunkResult) -> ChunkResult:
+    # Converters name images by page within the chunk, so prefix names with the
+    # chunk's pages to keep them unique across chunks.
+    markdown = result.markdown
+    images = {}
+    for name, data in result.images.items():
+        new_name = f"pages_{chunk.pages}_{name}"
+        markdown = markdown.replace(f"({name})", f"({new_name})")
+        images[new_name] = data
+    return ChunkResult(markdown=markdown, images=images)
+
+
+def chunk_cache_key(chunk: PdfChunk, converter: str) -> str:
+    try:
+        converter_version = version(CONVERTER_PACKAGES.get(converter, converter))
+    except PackageNotFoundError:
+        converter_version = None
+    inputs = {
+        "cache_version": CHUNK_CACHE_VERSION,
+        "converter": converter,
+        "converter_version": converter_version,
+        "content_hash": chunk.content_hash,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def join_chunks(results: list[ChunkResult]) -> ChunkResult:
+    """
+    Join chunk results, in order, into one document.
+    """
+    markdown = "\n\n".join(r.markdown.strip() for r in results if r.markdown.strip())
+    images = {name: data for r in results for name, data in r.images.items()}
+    return ChunkResult(markdown=markdown + "\n", images=images)
+
+
+def convert_pdf_in_chunks(
+    pdf_path: Path,
+    converter: str,
+    cache_dir: Path,
+    chunk_pages: int = DEFAULT_CHUNK_PAGES,
+    workers: int = DEFAULT_PDF_WORKERS,
+    max_worker_memory_mb: int = 0,
+    use_cache: bool = True,
+    progress: Callable[[PdfChunk, int, int], None] | None = None,
+) -> ChunkResult:
+    """
+    Convert a PDF to Markdown in chunks of `chunk_pages` pages (0 for a single
+    chunk), using up to `workers` processes, each capped at `max_worker_memory_mb`
+    (if set). A single chunk is converted in this process, unless capped.
+    `progress` is called with each chunk as it finishes, the number of chunks
+    done, and the total.
+    """
+    chunk_cache = RenderCache(cache_dir / PDF_CHUNK_CACHE_DIR_NAME, suffix=".json")
+    with tempfile.TemporaryDirectory() as tmp:
+        chunks = split_pdf(pdf_path, Path(tmp), chunk_pages)
+        keys = [chunk_cache_key(chunk, converter) for chunk in chunks]
+        results: list[ChunkResult | None] = [None] * len(chunks)
+        if use_cache:
+            for i, key in enumerate(keys):
+                cached = chunk_cache.get(key)
+                if cached is not None:
+                    results[i] = ChunkResult.from_json(cached)
+        todo = [i for i, result in enumerate(results) if result is None]
+        log.info(
+            "Converting %s of %s chunks of %s (%s cached)",
+            len(todo),
+            len(chunks),
+            pdf_path,
+            len(chunks) - len(todo),
+        )
+
+        def finished(i: int, result: ChunkResult) -> None:
+            result = _prefixed_images(chunks[i], result)
+            results[i] = result
+            chunk_cache.put(keys[i], result.to_json())
+            if progress:
+                progress(chunks[i], sum(1 for r in results if r is not None), len(chunks))
+
+        if todo and (workers <= 1 or len(todo) == 1) and not max_worker_memory_mb:
+            for i in todo:
+                finished(i, convert_chunk(chunks[i].path, converter))
+        elif todo:
+            # Spawn rather than fork, since the parent may have threads running.
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(todo)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(max_worker_memory_mb,),
+            ) as executor:
+                futures = {
+                    executor.submit(convert_chunk, chunks[i].path, converter): i for i in todo
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        raise RuntimeError(
+                            f"Converting pages {chunks[i].pages} of {pdf_path} failed "
+                            f"(smaller chunks or a larger memory cap may help): "
+                            f"{e.__class__.__name__}: {e}"
+                        ) from e
+                    finished(i, result)
+
+    return join_chunks([result for result in results if result is not None])
+
+
+## Tests
+
+
+def _make_pdf(pages: list[str]) -> bytes:
+    # A minimal PDF with a line of text on each page.
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 18 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n".encode()
+    return out + f"startxref\n{xref}\n%%EOF\n".encode()
+
+
+def test_convert_pdf_in_chunks():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = Path(tmp) / "doc.pdf"
+        pdf_path.write_bytes(_make_pdf([f"Page {n} text" for n in range(1, 6)]))
+        cache_dir = Path(tmp) / "cache"
+
+        done: list[tuple[str, int, int]] = []
+        result = convert_pdf_in_chunks(
+            pdf_path,
+            "markitdown",
+            cache_dir,
+            chunk_pages=2,
+            workers=2,
+            progress=lambda chunk, n, total: done.append((chunk.pages, n, total)),
+        )
+        assert sorted(pages for pages, _n, _total in done) == ["1-2", "3-4", "5-5"]
+        assert [(n, total) for _pages, n, total in done] == [(1, 3), (2, 3), (3, 3)]
+        lines = [line.strip("\x0c") for line in result.markdown.split("\n") if line.strip()]
+        assert lines == [f"Page {n} text" for n in range(1, 6)]
+
+        # Chunks are hashed by content (not the random file ID), so converting
+        # again only uses the cache.
+        chunk_cache = RenderCache(cache_dir / PDF_CHUNK_CACHE_DIR_NAME, suffix=".json")
+        chunks = split_pdf(pdf_path, Path(tmp), 2)
+        assert [chunk.pages for chunk in chunks] == ["1-2", "3-4", "5-5"]
+        assert all(chunk_cache.get(chunk_cache_key(c, "markitdown")) for c in chunks)
+        assert convert_pdf_in_chunks(pdf_path, "markitdown", cache_dir, chunk_pages=2) == result
+
+        # With no chunk size, the whole PDF is one chunk.
+        assert [chunk.pages for chunk in split_pdf(pdf_path, Path(tmp), 0)] == ["1-5"]
+        whole = convert_pdf_in_chunks(pdf_path, "markitdown", cache_dir, chunk_pages=0, workers=2)
+        lines = [line.strip("\x0c") for line in whole.markdown.split("\n") if line.strip()]
+        assert lines == [f"Page {n} text" for n in range(1, 6)]
+
+
+def test_join_chunks():
+    first = _prefixed_images(
+        PdfChunk(1, 2, Path("a.pdf"), ""),
+        ChunkResult("# Title\n\n![](_page_0_Picture_1.jpeg)\n", {"_page_0_Picture_1.jpeg": b"a"}),
+    )
+    second = _prefixed_images(
+        PdfChunk(3, 4, Path("b.pdf"), ""),
+        ChunkResult("![](_page_0_Picture_1.jpeg)\n", {"_page_0_Picture_1.jpeg": b"b"}),
+    )
+    joined = join_chunks([first, second, ChunkResult("  \n")])
+    assert joined.markdown == (
+        "# Title\n\n![](pages_1-2__page_0_Picture_1.jpeg)\n\n![](pages_3-4__page_0_Picture_1.jpeg)\n"
+    )
+    assert joined.images == {
+        "pages_1-2__page_0_Picture_1.jpeg": b"a",
+        "pages_3-4__page_0_Picture_1.jpeg": b"b",
+    }
+    assert ChunkResult.from_json(joined.to_json()) == joined
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from strif import atomic_output_file
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+"""Size budget for cached pages."""
+
+EVICT_TO_FRACTION = 0.8
+"""When over budget, evict down to this fraction of it, so eviction isn't needed on every write."""
+
+
+class RenderCache:
+    """
+    Content-addressed cache of rendered pages (or other generated files, like
+    minified pages, CSS or exports), so re-formatting a document whose inputs
+    haven't changed skips the work.
+
+    Each entry is a file named by its key (a hash of all its inputs),
+    so entries never go stale, and are simply evicted least recently used
+    first (by mtime, which is touched on each hit) once the cache is over
+    `max_bytes`. Writes are atomic, so several processes can share a cache.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES, suffix: str = ".html"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._size: int | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def _counted(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            html = path.read_text(encoding="utf-8")
+            os.utime(path)
+        except FileNotFoundError:
+            self._counted(False)
+            return None
+        self._counted(True)
+        return html
+
+    def get_file(self, key: str) -> Path | None:
+        """
+        Path to a cached entry, for binary entries added with `put_file`.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._counted(False)
+            return None
+        self._counted(True)
+        return path
+
+    def put(self, key: str, html: str) -> None:
+        data = html.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with atomic_output_file(self._path(key), make_parents=True) as tmp_path:
+            Path(tmp_path).write_bytes(data)
+        self._added(len(data))
+
+    def put_file(self, key: str, src_path: Path) -> None:
+        size = src_path.stat().st_size
+        if size > self.max_bytes:
+            return
+        with atomic_output_file(self._path(key), make_parents=True) as tmp_path:
+            shutil.copyfile(src_path, tmp_path)
+        self._added(size)
+
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        entries = []
+        for path in self.cache_dir.glob(f"*{self.suffix}"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _path, stat in self._entries())
+
+    def _evict(self) -> None:
+        # Rescan, since other processes may have added or evicted entries.
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime_ns)
+        size = sum(stat.st_size for _path, stat in entries)
+        target = self.max_bytes * EVICT_TO_FRACTION
+        evicted = 0
+        for path, stat in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+            evicted += 1
+        self._size = size
+        log.info("Evicted %s entries from cache: %s", evicted, self.cache_dir)
+
+
+## Tests
+
+
+def test_render_cache():
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RenderCache(Path(tmp) / "render", max_bytes=2500)
+        assert cache.get("a") is None
+        cache.put("a", "A" * 1000)
+        assert cache.get("a") == "A" * 1000
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # Over budget, the least recently used entries are evicted.
+        time.sleep(0.01)
+        cache.put("b", "B" * 1000)
+        time.sleep(0.01)
+        assert cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", "C" * 1000)
+        assert cache.get("b") is None
+        assert cache.get("a") and cache.get("c")
+
+        # Oversized pages aren't cached.
+        cache.put("d", "D" * 3000)
+        assert cache.get("d") is None
+
+        # Binary files, too.
+        src_path = Path(tmp) / "doc.pdf"
+        src_path.write_bytes(b"%PDF" * 100)
+        files = RenderCache(Path(tmp) / "files", suffix=".pdf")
+        assert files.get_file("e") is None
+        files.put_file("e", src_path)
+        cached_path = files.get_file("e")
+        assert cached_path and cached_path.read_bytes() == src_path.read_bytes()
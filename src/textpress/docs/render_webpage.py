@@ -1,17 +1,88 @@
+import hashlib
+import json
+import logging
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
 from pathlib import Path
 
+import jinja2
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from kash.config import colors
+from kash.config.settings import global_settings
 from kash.model import Item
-from kash.web_gen.template_render import additional_template_dirs, render_web_template
+from kash.web_gen.template_render import additional_template_dirs, get_template_dirs
+
+from textpress.spans import span
+
+log = logging.getLogger(__name__)
 
 templates_dir = Path(__file__).parent / "templates"
 
+TEMPLATE_BYTECODE_DIR_NAME = "textpress_jinja_bytecode"
+"""Compiled templates, kept in the cache directory so new processes can skip compiling."""
 
-def render_webpage(item: Item, add_title_h1: bool = False, add_classes: str | None = None) -> str:
+
+def template_search_path() -> tuple[Path, ...]:
     """
-    Generate a simple web page from a single item.
-    If `add_title_h1` is True, the title will be inserted as an h1 heading above the body.
-    If `add_classes` is provided, they will be added to the body as a class attribute.
+    Template directories for rendering pages, in the same order kash's
+    `render_web_template` would use within `additional_template_dirs(templates_dir)`:
+    any template dirs already in context, then ours, then kash's base templates.
+    """
+    with additional_template_dirs(templates_dir):
+        return tuple(get_template_dirs())
+
+
+def bytecode_cache_dir() -> Path:
+    """
+    Bytecode cache directory for the current Jinja version. Jinja also checks
+    the Python version and the template source checksum before using an entry.
+    """
+    return (
+        global_settings().system_cache_dir
+        / TEMPLATE_BYTECODE_DIR_NAME
+        / f"jinja-{jinja2.__version__}"
+    )
+
+
+@cache
+def template_env(
+    search_paths: tuple[Path, ...], autoescape: bool = True, bytecode_dir: Path | None = None
+) -> Environment:
+    """
+    Shared Jinja environment for a template search path. Compiled templates are
+    cached in the environment and, with `auto_reload`, recompiled only when a
+    template file's mtime changes. With a `bytecode_dir`, compiled templates are
+    also saved to disk for use by later processes.
     """
+    bytecode_cache = None
+    if bytecode_dir:
+        try:
+            bytecode_dir.mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(bytecode_dir))
+        except OSError as e:
+            log.warning("Not caching compiled templates: %s", e)
+    return Environment(
+        loader=FileSystemLoader(search_paths),
+        autoescape=autoescape,
+        auto_reload=True,
+        bytecode_cache=bytecode_cache,
+    )
+
+
+def render_web_template(
+    template_filename: str, data: dict, css_overrides: dict[str, str] | None = None
+) -> str:
+    """
+    Same as kash's `render_web_template` (with our templates dir added to the
+    search path), but reusing compiled templates across calls and processes
+    rather than recompiling them each time.
+    """
+    env = template_env(template_search_path(), bytecode_dir=bytecode_cache_dir())
+    template = env.get_template(template_filename)
+    return template.render({**data, "color_defs": colors.generate_css_vars(css_overrides or {})})
+
+
+def _social_meta(item: Item) -> dict[str, str]:
     # Build social metadata from item fields
     social_meta = {}
     if item.title:
@@ -32,17 +103,158 @@ def render_webpage(item: Item, add_title_h1: bool = False, add_classes: str | No
         if "twitter_handle" in item.extra:
             social_meta["twitter_handle"] = item.extra["twitter_handle"]
 
-    with additional_template_dirs(templates_dir):
-        return render_web_template(
+    return social_meta
+
+
+def template_version(search_paths: tuple[Path, ...]) -> str:
+    """
+    Hash of everything besides the item that affects rendered pages: the
+    template files and the versions of textpress and kash (which renders the
+    Markdown and color definitions).
+    """
+    # Only stats the files, so edits (picked up by Jinja's auto_reload) change
+    # the version without rehashing every template on every render.
+    files = tuple(
+        (search_path, path.relative_to(search_path), stat.st_size, stat.st_mtime_ns)
+        for search_path in search_paths
+        for path in sorted(search_path.rglob("*"))
+        if path.is_file() and (stat := path.stat())
+    )
+    return _template_version(files)
+
+
+@cache
+def _template_version(files: tuple[tuple[Path, Path, int, int], ...]) -> str:
+    hasher = hashlib.sha256()
+    for package in ["textpress", "kash-shell"]:
+        try:
+            hasher.update(f"{package} {version(package)}\n".encode())
+        except PackageNotFoundError:
+            pass
+    for search_path, rel_path, _size, _mtime_ns in files:
+        hasher.update(f"{rel_path.as_posix()}\n".encode())
+        hasher.update((search_path / rel_path).read_bytes())
+    return hasher.hexdigest()
+
+
+def render_cache_key(item: Item, add_title_h1: bool = False, add_classes: str | None = None) -> str:
+    """
+    Key for the page `render_webpage` would produce for this item: a hash of
+    everything it depends on.
+    """
+    inputs = {
+        "template_version": template_version(template_search_path()),
+        "format": item.format and item.format.value,
+        "body": item.body,
+        "title": item.title,
+        "thumbnail_url": item.thumbnail_url,
+        "social_meta": _social_meta(item),
+        "add_title_h1": add_title_h1,
+        "add_classes": add_classes,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def render_webpage(item: Item, add_title_h1: bool = False, add_classes: str | None = None) -> str:
+    """
+    Generate a simple web page from a single item.
+    If `add_title_h1` is True, the title will be inserted as an h1 heading above the body.
+    If `add_classes` is provided, they will be added to the body as a class attribute.
+    """
+    social_meta = _social_meta(item)
+    with span("markdown_to_html", bytes=len(item.body or "")):
+        content_html = item.body_as_html()
+    with span("render_webpage") as s:
+        html = render_web_template(
             "textpress_webpage.html.jinja",
             data={
                 "title": item.title,
                 "add_title_h1": add_title_h1,
                 "add_classes": add_classes,
-                "content_html": item.body_as_html(),
+                "content_html": content_html,
                 "thumbnail_url": item.thumbnail_url,
                 "social_meta": social_meta if social_meta else None,
                 "enable_themes": True,
                 "show_theme_toggle": False,
             },
         )
+        s.set(bytes=len(html))
+    return html
+
+
+## Tests
+
+
+def test_template_env_reloads_changed_templates():
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template_path = Path(tmp) / "page.html.jinja"
+        template_path.write_text("Hello {{ name }}")
+        env = template_env((Path(tmp),))
+        assert template_env((Path(tmp),)) is env
+
+        template = env.get_template("page.html.jinja")
+        assert template.render(name="<you>") == "Hello &lt;you&gt;"
+        assert env.get_template("page.html.jinja") is template
+
+        template_path.write_text("Goodbye {{ name }}")
+        stat = template_path.stat()
+        os.utime(template_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert env.get_template("page.html.jinja").render(name="you") == "Goodbye you"
+
+
+def test_template_search_path():
+    with additional_template_dirs(Path("/site/templates")):
+        search_path = template_search_path()
+    assert search_path[:2] == (Path("/site/templates"), templates_dir)
+    assert template_search_path()[0] == templates_dir
+
+
+def test_template_version():
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / "a").mkdir()
+        (root / "b").mkdir()
+        (root / "a/page.jinja").write_text("A")
+        original = template_version((root,))
+        assert template_version((root,)) == original
+
+        # Moving a template to another directory changes the version.
+        (root / "a/page.jinja").rename(root / "b/page.jinja")
+        moved = template_version((root,))
+        assert moved != original
+
+        # As does an edit, as soon as the file's mtime changes.
+        (root / "b/page.jinja").write_text("B")
+        stat = (root / "b/page.jinja").stat()
+        os.utime(root / "b/page.jinja", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert template_version((root,)) not in (original, moved)
+
+
+def test_template_bytecode_cache():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template_dir = Path(tmp) / "templates"
+        template_dir.mkdir()
+        (template_dir / "page.html.jinja").write_text("Hello {{ name }}")
+        bytecode_dir = Path(tmp) / "bytecode"
+
+        env = template_env((template_dir,), bytecode_dir=bytecode_dir)
+        assert env.get_template("page.html.jinja").render(name="you") == "Hello you"
+        assert len(list(bytecode_dir.iterdir())) == 1
+
+        # A new environment (as in a new process) loads the saved bytecode.
+        cached = Environment(
+            loader=FileSystemLoader(template_dir),
+            bytecode_cache=FileSystemBytecodeCache(str(bytecode_dir)),
+        )
+        compiled: list[str] = []
+        cached.compile = lambda *args, **kwargs: compiled.append(args[0])  # pyright: ignore
+        assert cached.get_template("page.html.jinja").render(name="you") == "Hello you"
+        assert compiled == []
@@ -0,0 +1,119 @@
+"""
+Shared assets: large inline `<style>` and `<script>` blocks (the theme CSS and
+scripts every page from the same template carries) moved out into
+content-hashed files, so they're uploaded once per account and cached by
+browsers across pages, instead of being repeated in every page.
+
+Each block is replaced in place by a `<link>` or (non-deferred) `<script src>`,
+so styles cascade and scripts run in the same order as before. Assets are
+written to a `_shared` directory next to the page and referenced relative to
+it, so pages work the same locally and once published.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from pathlib import Path
+
+from strif import atomic_output_file
+
+from textpress.api.textpress_api import SHARED_ASSETS_DIR
+
+MIN_SHARED_ASSET_SIZE = 1024
+"""Smaller blocks stay inline, since a separate request costs more than it saves."""
+
+_INLINE_BLOCK = re.compile(r"<(style|script)>(.*?)</\1>", re.DOTALL | re.I)
+"""Only blocks without attributes, so JSON data, modules, etc. are left alone."""
+
+_RELATIVE_CSS_URL = re.compile(r"""url\(\s*['"]?(?![a-z][a-z0-9+.-]*:|/|#)""", re.I)
+"""A `url()` that would resolve differently once the CSS is moved to another directory."""
+
+_SHARED_ASSET_REF = re.compile(
+    rf"""(?:href|src)=["']?({re.escape(SHARED_ASSETS_DIR)}/[0-9a-f]+\.(?:css|js))["'\s>]"""
+)
+
+_SUFFIXES = {"style": ".css", "script": ".js"}
+
+
+def _write_asset(assets_dir: Path, content: str, suffix: str) -> Path:
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:20]
+    path = assets_dir / f"{digest}{suffix}"
+    # Content-addressed, so an existing file already has this content.
+    if not path.exists():
+        with atomic_output_file(path, make_parents=True) as tmp_path:
+            Path(tmp_path).write_text(content, encoding="utf-8")
+    return path
+
+
+def externalize_assets(html: str, page_dir: Path) -> tuple[str, list[Path]]:
+    """
+    Move large inline style and script blocks into shared asset files under
+    `page_dir/_shared`. Returns the updated HTML and the asset files it uses.
+    """
+    assets_dir = page_dir / SHARED_ASSETS_DIR
+    assets: list[Path] = []
+
+    def replace(match: re.Match[str]) -> str:
+        tag, content = match.group(1).lower(), match.group(2)
+        if len(content.encode("utf-8")) < MIN_SHARED_ASSET_SIZE:
+            return match.group(0)
+        if tag == "style" and _RELATIVE_CSS_URL.search(content):
+            return match.group(0)
+        path = _write_asset(assets_dir, content, _SUFFIXES[tag])
+        assets.append(path)
+        href = f"{SHARED_ASSETS_DIR}/{path.name}"
+        if tag == "style":
+            return f'<link rel="stylesheet" href="{href}">'
+        return f'<script src="{href}"></script>'
+
+    return _INLINE_BLOCK.sub(replace, html), list(dict.fromkeys(assets))
+
+
+def shared_asset_uploads(html_path: Path) -> dict[str, Path]:
+    """
+    Upload paths for the shared assets a page references.
+    """
+    html = html_path.read_text(encoding="utf-8", errors="replace")
+    return {
+        upload_path: html_path.parent / upload_path
+        for upload_path in dict.fromkeys(_SHARED_ASSET_REF.findall(html))
+    }
+
+
+## Tests
+
+
+def test_externalize_assets():
+    import tempfile
+
+    big_css = "body { color: red; }\n" * 100
+    big_js = "console.log('hi');\n" * 100
+    html = (
+        f"<html><head><style>{big_css}</style><style>p {{ margin: 0; }}</style>"
+        f'<style>.x {{ background: url("img/x.png"); }}{big_css}</style>'
+        f'<script type="application/ld+json">{{"a": 1}}</script></head>'
+        f"<body><p>Hi</p><script>{big_js}</script></body></html>"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        page_dir = Path(tmp)
+        out_html, assets = externalize_assets(html, page_dir)
+        css_path, js_path = assets
+        assert css_path.read_text() == big_css and js_path.read_text() == big_js
+        assert out_html == (
+            f'<html><head><link rel="stylesheet" href="_shared/{css_path.name}">'
+            "<style>p { margin: 0; }</style>"
+            f'<style>.x {{ background: url("img/x.png"); }}{big_css}</style>'
+            '<script type="application/ld+json">{"a": 1}</script></head>'
+            f'<body><p>Hi</p><script src="_shared/{js_path.name}"></script></body></html>'
+        )
+
+        # Same content, same files.
+        assert externalize_assets(html, page_dir) == (out_html, assets)
+
+        page_path = page_dir / "page.html"
+        page_path.write_text(out_html)
+        assert shared_asset_uploads(page_path) == {
+            f"_shared/{css_path.name}": css_path,
+            f"_shared/{js_path.name}": js_path,
+        }
@@ -0,0 +1,253 @@
+"""
+Lightweight timing spans, to see where a run's time goes (converting,
+rendering, minifying, hashing, presigning, uploading, committing), saved as a
+Chrome trace that can be opened in https://ui.perfetto.dev or chrome://tracing.
+
+Tracing is off unless `start_trace()` is called, as `--profile` does. While
+it's off, `span()` returns a shared no-op span, so instrumentation costs about
+a function call.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from strif import atomic_output_file
+
+
+class Span:
+    """
+    A timed region, used as a context manager. This base class is the no-op
+    used while tracing is off.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> Span:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        pass
+
+    def set(self, **args: Any) -> None:
+        """
+        Add details to the span, like byte counts (by convention, `bytes`).
+        """
+
+
+_NO_SPAN = Span()
+
+
+class _RecordingSpan(Span):
+    __slots__ = ("name", "args", "_ts_us", "_start_ns")
+
+    def __init__(self, name: str, args: dict[str, Any]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> Span:
+        # Wall clock timestamps, so spans from worker processes line up.
+        self._ts_us = time.time_ns() // 1000
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        dur_us = (time.perf_counter_ns() - self._start_ns) / 1000
+        trace = _trace
+        if trace:
+            trace.add(self.name, self._ts_us, dur_us, self.args)
+
+    def set(self, **args: Any) -> None:
+        self.args.update(args)
+
+
+class Trace:
+    """
+    Spans recorded so far, as Chrome trace events. Thread safe.
+    """
+
+    def __init__(self) -> None:
+        self.events: list[dict[str, Any]] = []
+        self._named_threads: set[tuple[int, int]] = set()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ts_us: int, dur_us: float, args: dict[str, Any]) -> None:
+        pid, tid = os.getpid(), threading.get_ident()
+        event = {
+            "name": name,
+            "cat": "textpress",
+            "ph": "X",
+            "ts": ts_us,
+            "dur": dur_us,
+            "pid": pid,
+            "tid": tid,
+            "args": args,
+        }
+        with self._lock:
+            if (pid, tid) not in self._named_threads:
+                self._named_threads.add((pid, tid))
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": tid,
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            self.events.append(event)
+
+
+_trace: Trace | None = None
+
+
+def span(name: str, **args: Any) -> Span:
+    """
+    A span to time a block with `with span("name", key=value):`. Args are shown
+    with the span in the trace.
+    """
+    if _trace is None:
+        return _NO_SPAN
+    return _RecordingSpan(name, args)
+
+
+def tracing_enabled() -> bool:
+    return _trace is not None
+
+
+def start_trace() -> None:
+    global _trace
+    _trace = Trace()
+
+
+def stop_trace() -> list[dict[str, Any]]:
+    """
+    Stop tracing and return the events recorded.
+    """
+    global _trace
+    trace, _trace = _trace, None
+    return trace.events if trace else []
+
+
+def take_events() -> list[dict[str, Any]]:
+    """
+    Remove and return the events recorded so far, leaving tracing on. Worker
+    processes use this to send their spans back to the parent.
+    """
+    trace = _trace
+    if not trace:
+        return []
+    with trace._lock:
+        events, trace.events = trace.events, []
+        trace._named_threads.clear()
+    return events
+
+
+def add_events(events: list[dict[str, Any]]) -> None:
+    """
+    Add events recorded elsewhere (like in a worker process) to the current trace.
+    """
+    trace = _trace
+    if trace and events:
+        with trace._lock:
+            trace.events.extend(events)
+
+
+def write_trace(path: Path, events: list[dict[str, Any]]) -> None:
+    """
+    Write events as a Chrome trace (JSON object format).
+    """
+    data = {"traceEvents": events, "displayTimeUnit": "ms"}
+    with atomic_output_file(path, make_parents=True) as tmp_path:
+        Path(tmp_path).write_text(json.dumps(data))
+
+
+@contextmanager
+def tracing(path: Path) -> Iterator[None]:
+    """
+    Record spans within the block and write them to `path`.
+    """
+    start_trace()
+    try:
+        yield
+    finally:
+        write_trace(path, stop_trace())
+
+
+@dataclass(frozen=True)
+class SpanTotal:
+    name: str
+    count: int
+    seconds: float
+    bytes: int
+
+
+def span_totals(events: list[dict[str, Any]]) -> list[SpanTotal]:
+    """
+    Total time and bytes for each span name, most time first. Nested and
+    concurrent spans each count in full, so totals can exceed the run time.
+    """
+    totals: dict[str, tuple[int, float, int]] = {}
+    for event in events:
+        if event["ph"] != "X":
+            continue
+        count, dur_us, nbytes = totals.get(event["name"], (0, 0.0, 0))
+        totals[event["name"]] = (
+            count + 1,
+            dur_us + event["dur"],
+            nbytes + int(event["args"].get("bytes", 0)),
+        )
+    return sorted(
+        (
+            SpanTotal(name, count, dur_us / 1e6, nbytes)
+            for name, (count, dur_us, nbytes) in totals.items()
+        ),
+        key=lambda total: total.seconds,
+        reverse=True,
+    )
+
+
+## Tests
+
+
+def test_spans():
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    assert span("off") is _NO_SPAN
+
+    def upload(n: int) -> None:
+        with span("upload", bytes=n):
+            time.sleep(0.01)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "trace.json"
+        with tracing(path):
+            with span("outer", input="a.md") as outer:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(upload, [10, 20]))
+                outer.set(bytes=5)
+            add_events(
+                [{"name": "upload", "ph": "X", "ts": 0, "dur": 1e6, "pid": 1, "tid": 1, "args": {}}]
+            )
+        assert not tracing_enabled()
+
+        events = json.loads(path.read_text())["traceEvents"]
+
+    spans = [e for e in events if e["ph"] == "X"]
+    assert sorted(e["name"] for e in spans) == ["outer", "upload", "upload", "upload"]
+    assert {e["args"]["name"] for e in events if e["ph"] == "M"} >= {"MainThread"}
+    outer_event = next(e for e in spans if e["name"] == "outer")
+    assert outer_event["args"] == {"input": "a.md", "bytes": 5}
+
+    totals = {total.name: total for total in span_totals(events)}
+    assert totals["upload"].count == 3 and totals["upload"].bytes == 30
+    assert totals["upload"].seconds >= 1.0
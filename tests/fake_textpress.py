@@ -0,0 +1,243 @@
+"""
+An in-memory fake of the Textpress sync API and presigned storage, for testing
+the API client without a network. Install it with `FakeTextpress().serve()`.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from urllib.parse import urlparse
+
+import httpx
+
+from textpress.api import http_client
+from textpress.api.textpress_env import ApiConfig
+
+API_ROOT = "https://api.test"
+STORAGE_ROOT = "https://storage.test"
+
+TEST_CONFIG = ApiConfig(api_key="tp_test", api_root=API_ROOT, publish_root="https://pub.test")
+
+
+class FakeTextpress:
+    def __init__(self, files: dict[str, bytes] | None = None):
+        self.lock = threading.Lock()
+        self.version = 1
+        self.contents: dict[str, bytes] = dict(files or {})
+        self.staged: dict[str, bytes] = {}
+        self.content_encodings: dict[str, str] = {}
+        self.cache_controls: dict[str, str] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.presigned_paths: list[str] = []
+        self.fail_uploads: set[str] = set()
+        self.upload_delay = 0.0
+        self.external_commits: list[dict[str, bytes]] = []
+        """Commits by "another publisher", each applied just before one of ours."""
+        self.concurrent_uploads = 0
+        self.max_concurrent_uploads = 0
+        self.multipart_enabled = True
+        self.multipart_uploads: dict[str, dict] = {}
+        self.fail_parts: set[int] = set()
+        self.unpresigned_parts: set[int] = set()
+        """Parts left out of multipart presign responses."""
+        self.multipart_start_status: int | None = None
+        """If set, multipart starts fail with this status."""
+        self.part_puts: list[int] = []
+        self.not_modified = 0
+        """Number of manifest requests answered with 304 Not Modified."""
+
+    @property
+    def files(self) -> dict[str, str]:
+        return {path: hashlib.md5(data).hexdigest() for path, data in self.contents.items()}
+
+    def manifest_json(self) -> dict:
+        return {
+            "version": self.version,
+            "generatedAt": datetime.now(UTC).isoformat(),
+            "files": self.files,
+        }
+
+    def count(self, method: str, path: str) -> int:
+        return sum(1 for m, p in self.requests if m == method and p == path)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        url = urlparse(str(request.url))
+        with self.lock:
+            self.requests.append((request.method, url.path))
+
+        if f"{url.scheme}://{url.netloc}" == STORAGE_ROOT:
+            return self._handle_storage(request, url.path.lstrip("/"))
+
+        if request.headers.get("x-api-key") != TEST_CONFIG.api_key:
+            return httpx.Response(401)
+
+        if request.method == "GET" and url.path == "/api/user":
+            return httpx.Response(200, json={"userId": "u1", "username": "tester"})
+        if request.method == "GET" and url.path == "/api/sync/manifest":
+            with self.lock:
+                etag = f'"v{self.version}"'
+                if request.headers.get("If-None-Match") == etag:
+                    self.not_modified += 1
+                    return httpx.Response(304, headers={"ETag": etag})
+                return httpx.Response(200, json=self.manifest_json(), headers={"ETag": etag})
+        if request.method == "POST" and url.path == "/api/sync/presign-batch":
+            return self._handle_presign(json.loads(request.read()))
+        if request.method == "POST" and url.path == "/api/sync/commit":
+            return self._handle_commit(json.loads(request.read()))
+        if self.multipart_enabled and request.method == "POST":
+            if url.path == "/api/sync/multipart/start":
+                return self._handle_multipart_start(json.loads(request.read()))
+            if url.path == "/api/sync/multipart/presign-parts":
+                return self._handle_multipart_presign(json.loads(request.read()))
+            if url.path == "/api/sync/multipart/complete":
+                return self._handle_multipart_complete(json.loads(request.read()))
+
+        return httpx.Response(404)
+
+    def _handle_presign(self, body: dict) -> httpx.Response:
+        with self.lock:
+            if body["baseVersion"] != self.version:
+                return httpx.Response(409, json={"error": "version conflict"})
+            current = self.files
+            uploads = []
+            for upload in body["uploads"]:
+                self.presigned_paths.append(upload["path"])
+                if current.get(upload["path"]) == upload["md5"]:
+                    continue
+                headers = {
+                    "Content-MD5": base64.b64encode(bytes.fromhex(upload["md5"])).decode(),
+                    "Content-Type": upload["contentType"],
+                }
+                if "contentEncoding" in upload:
+                    headers["Content-Encoding"] = upload["contentEncoding"]
+                if "cacheControl" in upload:
+                    headers["Cache-Control"] = upload["cacheControl"]
+                uploads.append(
+                    {
+                        "path": upload["path"],
+                        "url": f"{STORAGE_ROOT}/{upload['path']}",
+                        "headers": headers,
+                    }
+                )
+            return httpx.Response(
+                200,
+                json={"uploads": uploads, "delete": body["delete"], "baseVersion": self.version},
+            )
+
+    def _handle_multipart_start(self, body: dict) -> httpx.Response:
+        if self.multipart_start_status:
+            return httpx.Response(self.multipart_start_status)
+        with self.lock:
+            upload_id = f"mp{len(self.multipart_uploads) + 1}"
+            self.multipart_uploads[upload_id] = {**body, "parts": {}}
+            return httpx.Response(200, json={"uploadId": upload_id, "partSize": body["partSize"]})
+
+    def _handle_multipart_presign(self, body: dict) -> httpx.Response:
+        if body["uploadId"] not in self.multipart_uploads:
+            return httpx.Response(404, json={"error": "no such upload"})
+        parts = [
+            {
+                "partNumber": part["partNumber"],
+                "url": f"{STORAGE_ROOT}/_parts/{body['uploadId']}/{part['partNumber']}",
+                "headers": {},
+            }
+            for part in body["parts"]
+            if part["partNumber"] not in self.unpresigned_parts
+        ]
+        return httpx.Response(200, json={"parts": parts})
+
+    def _handle_multipart_complete(self, body: dict) -> httpx.Response:
+        with self.lock:
+            upload = self.multipart_uploads.pop(body["uploadId"])
+            numbers = [part["partNumber"] for part in body["parts"]]
+            data = b"".join(upload["parts"][n] for n in numbers)
+            if hashlib.md5(data).hexdigest() != upload["md5"]:
+                return httpx.Response(400, json={"error": "bad md5"})
+            self.staged[upload["path"]] = data
+            return httpx.Response(200, json={})
+
+    def _handle_storage(self, request: httpx.Request, path: str) -> httpx.Response:
+        if request.method != "PUT":
+            return httpx.Response(405)
+        if path.startswith("_parts/"):
+            return self._handle_part(request, path)
+        with self.lock:
+            self.concurrent_uploads += 1
+            self.max_concurrent_uploads = max(self.max_concurrent_uploads, self.concurrent_uploads)
+        try:
+            time.sleep(self.upload_delay)
+            if path in self.fail_uploads:
+                return httpx.Response(500)
+            data = request.read()
+            md5_b64 = base64.b64encode(hashlib.md5(data).digest()).decode()
+            if request.headers.get("Content-MD5") != md5_b64:
+                return httpx.Response(400, json={"error": "bad md5"})
+            with self.lock:
+                self.staged[path] = data
+            return httpx.Response(200)
+        finally:
+            with self.lock:
+                self.concurrent_uploads -= 1
+
+    def _handle_part(self, request: httpx.Request, path: str) -> httpx.Response:
+        _, upload_id, number = path.split("/")
+        with self.lock:
+            self.part_puts.append(int(number))
+        if int(number) in self.fail_parts:
+            return httpx.Response(500)
+        data = request.read()
+        md5 = hashlib.md5(data)
+        if request.headers.get("Content-MD5") != base64.b64encode(md5.digest()).decode():
+            return httpx.Response(400, json={"error": "bad md5"})
+        with self.lock:
+            self.multipart_uploads[upload_id]["parts"][int(number)] = data
+        return httpx.Response(200, headers={"ETag": f'"{md5.hexdigest()}"'})
+
+    def _handle_commit(self, body: dict) -> httpx.Response:
+        with self.lock:
+            if self.external_commits:
+                self.contents.update(self.external_commits.pop(0))
+                self.version += 1
+            if body["baseVersion"] != self.version:
+                return httpx.Response(409, json={"error": "version conflict"})
+            for upload in body["uploads"]:
+                data = self.staged.get(upload["path"])
+                if data is None or hashlib.md5(data).hexdigest() != upload["md5"]:
+                    return httpx.Response(400, json={"error": f"not uploaded: {upload['path']}"})
+            for upload in body["uploads"]:
+                self.contents[upload["path"]] = self.staged.pop(upload["path"])
+                if "contentEncoding" in upload:
+                    self.content_encodings[upload["path"]] = upload["contentEncoding"]
+                if "cacheControl" in upload:
+                    self.cache_controls[upload["path"]] = upload["cacheControl"]
+            for delete in body["delete"]:
+                self.contents.pop(delete["path"], None)
+            self.version += 1
+            return httpx.Response(200, json=self.manifest_json())
+
+    def async_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    @contextmanager
+    def serve(self) -> Iterator[FakeTextpress]:
+        """
+        Route the shared HTTP clients to this fake for the duration of the block.
+        """
+        clients = {
+            pool: httpx.Client(transport=httpx.MockTransport(self.handle))
+            for pool in http_client.HttpPool
+        }
+        old_clients = http_client._http_clients.swap(clients)
+        try:
+            yield self
+        finally:
+            http_client._http_clients.set(old_clients)
+            for client in clients.values():
+                client.close()
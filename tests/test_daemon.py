@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from textpress.cli.cli_daemon import (
+    DaemonServer,
+    daemon_socket_path,
+    ping,
+    start_daemon,
+    stop_daemon,
+)
+
+
+def test_daemon_lifecycle(tmp_path: Path):
+    server = DaemonServer(tmp_path, idle_timeout=0)
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    try:
+        # Allow for the daemon's warm-up imports.
+        deadline = time.monotonic() + 60
+        status = None
+        while not status and time.monotonic() < deadline:
+            thread.join(0.2)
+            status = ping(tmp_path)
+        assert status and status["work_root"] == str(tmp_path.resolve())
+        assert status["requests"] == 0
+    finally:
+        assert stop_daemon(tmp_path)
+        thread.join(5)
+
+    assert not thread.is_alive()
+    assert not daemon_socket_path(tmp_path).exists()
+    assert ping(tmp_path) is None
+
+
+def test_daemon_idle_timeout(tmp_path: Path):
+    server = DaemonServer(tmp_path, idle_timeout=0.5)
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    assert not daemon_socket_path(tmp_path).exists()
+
+
+def test_daemon_runs_command(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "a.md").write_text("# Hello\n\nSome *text*.\n")
+    work_root = tmp_path / "textpress"
+
+    # The daemon has no API key. The client's is sent with the command.
+    monkeypatch.delenv("TEXTPRESS_API_KEY", raising=False)
+    start_daemon(work_root, idle_timeout=120)
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "textpress", "format", "a.md", "--no_minify"],
+            cwd=tmp_path,
+            env={**os.environ, "TEXTPRESS_API_KEY": "tp_client"},
+            capture_output=True,
+            text=True,
+            timeout=300,
+        )
+        assert proc.returncode == 0, proc.stdout + proc.stderr
+        assert "textpress/workspace/exports/a.html" in proc.stdout
+
+        status = ping(work_root)
+        assert status and status["requests"] == 1
+        assert "Some <em>text</em>." in (work_root / "workspace/exports/a.html").read_text()
+    finally:
+        assert stop_daemon(work_root)
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_format_batch_in_workers(tmp_path: Path):
+    for name in ["a", "b", "c"]:
+        (tmp_path / f"{name}.md").write_text(f"# Doc {name}\n\nSome *text* in {name}.\n")
+
+    env = {**os.environ, "TEXTPRESS_API_KEY": "tp_test"}
+    cmd = [sys.executable, "-m", "textpress.cli.cli_main", "format", "a.md", "b.md", "c.md"]
+    proc = subprocess.run(
+        [*cmd, "--no_minify", "--jobs", "2"],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    # Only this process saved to the workspace, so names are unique and each
+    # export records the action that made it.
+    exports = tmp_path / "textpress" / "workspace" / "exports"
+    assert sorted(p.name for p in exports.iterdir()) == [
+        "a.html",
+        "a.md",
+        "b.html",
+        "b.md",
+        "c.html",
+        "c.md",
+    ]
+    for name in ["a", "b", "c"]:
+        html = (exports / f"{name}.html").read_text()
+        assert "action_name: textpress_format" in html
+        assert f"Some <em>text</em> in {name}." in html
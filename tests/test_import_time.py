@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET_MS = 150
+"""
+Budget for importing textpress's own modules for `tp --help`. It was ~250ms
+before imports were made lazy and is ~60ms now, so this leaves headroom for
+slower machines while still catching a heavy import sneaking back in.
+"""
+
+HEAVY_MODULES = ["kash", "pydantic", "httpx", "questionary", "textpress.api.textpress_api"]
+"""Modules that `--help`, `--version`, and `setup --show` shouldn't need."""
+
+_IMPORT_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(*args: str) -> list[tuple[str, int, bool]]:
+    """
+    Each module imported when running the CLI, with its cumulative import time in
+    microseconds and whether it was imported at the top level.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "textpress", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "TEXTPRESS_API_KEY": "x"},
+    )
+    return [
+        (match.group(3), int(match.group(1)), not match.group(2))
+        for match in map(_IMPORT_LINE.match, result.stderr.splitlines())
+        if match
+    ]
+
+
+def test_help_import_time_budget():
+    # Best of a few runs, to reduce noise (and so bytecode is already compiled).
+    best_ms = min(
+        sum(
+            us
+            for name, us, top_level in import_times("--help")
+            if top_level and name.startswith("textpress")
+        )
+        / 1000
+        for _ in range(3)
+    )
+    assert best_ms < IMPORT_TIME_BUDGET_MS, (
+        f"`tp --help` spent {best_ms:.0f}ms importing textpress modules "
+        f"(budget {IMPORT_TIME_BUDGET_MS}ms)"
+    )
+
+
+def test_light_commands_avoid_heavy_imports():
+    for args in [["--help"], ["--version"], ["setup", "--show"]]:
+        modules = [name for name, _us, _top_level in import_times(*args)]
+        heavy = [m for m in modules if any(m == h or m.startswith(h + ".") for h in HEAVY_MODULES)]
+        assert not heavy, f"`tp {' '.join(args)}` imported {sorted(heavy)[:5]}"
@@ -0,0 +1,139 @@
+import hashlib
+import os
+from pathlib import Path
+
+from fake_textpress import TEST_CONFIG, FakeTextpress
+
+from textpress.api.multipart_upload import (
+    MultipartSettings,
+    PartNotPresigned,
+    hash_file_parts,
+    part_checksums,
+)
+from textpress.api.textpress_api import UploadError, publish_files
+
+PART_SIZE = 64 * 1024
+
+
+def _settings(tmp_path: Path) -> MultipartSettings:
+    return MultipartSettings(
+        threshold=PART_SIZE,
+        part_size=PART_SIZE,
+        part_retries=0,
+        resume_dir=tmp_path / "resume",
+    )
+
+
+def _big_file(tmp_path: Path) -> list[tuple[Path, str]]:
+    path = tmp_path / "talk.mp4"
+    path.write_bytes(os.urandom(PART_SIZE * 3 + 1000))
+    return [(path, "doc.assets/talk.mp4"), (tmp_path / "doc.md", "doc.md")]
+
+
+def test_multipart_upload_resumes_failed_parts(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.fail_parts = {2}
+    files = _big_file(tmp_path)
+    files[1][0].write_text("# Doc\n")
+    settings = _settings(tmp_path)
+
+    with fake.serve():
+        try:
+            publish_files(files, config=TEST_CONFIG, multipart=settings)
+            raise AssertionError("Expected UploadError")
+        except UploadError as e:
+            assert list(e.failures) == ["doc.assets/talk.mp4"]
+        assert sorted(fake.part_puts) == [1, 2, 3, 4]
+        assert fake.count("POST", "/api/sync/commit") == 0
+        assert len(list(settings.resume_dir.iterdir())) == 1  # pyright: ignore
+
+        # A rerun only sends the failed part, then completes and commits.
+        fake.fail_parts = set()
+        fake.part_puts = []
+        result = publish_files(files, config=TEST_CONFIG, multipart=settings)
+
+    assert fake.part_puts == [2]
+    assert fake.count("POST", "/api/sync/multipart/start") == 1
+    assert fake.contents["doc.assets/talk.mp4"] == files[0][0].read_bytes()
+    assert result.summary() == "0 unchanged, 2 uploaded"
+    assert list(settings.resume_dir.iterdir()) == []  # pyright: ignore
+
+
+def test_multipart_falls_back_to_single_put(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.multipart_enabled = False
+    files = _big_file(tmp_path)[:1]
+
+    with fake.serve():
+        publish_files(files, config=TEST_CONFIG, multipart=_settings(tmp_path))
+
+    assert fake.part_puts == []
+    assert fake.count("PUT", "/doc.assets/talk.mp4") == 1
+    assert fake.contents["doc.assets/talk.mp4"] == files[0][0].read_bytes()
+
+
+def test_multipart_restarts_expired_upload(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.fail_parts = {2}
+    files = _big_file(tmp_path)[:1]
+    settings = _settings(tmp_path)
+
+    with fake.serve():
+        try:
+            publish_files(files, config=TEST_CONFIG, multipart=settings)
+            raise AssertionError("Expected UploadError")
+        except UploadError:
+            pass
+
+        # The server forgets the upload, so the resume record is stale.
+        fake.multipart_uploads.clear()
+        fake.fail_parts = set()
+        fake.part_puts = []
+        publish_files(files, config=TEST_CONFIG, multipart=settings)
+
+    assert fake.count("POST", "/api/sync/multipart/start") == 2
+    assert sorted(fake.part_puts) == [1, 2, 3, 4]
+    assert fake.contents["doc.assets/talk.mp4"] == files[0][0].read_bytes()
+    assert list(settings.resume_dir.iterdir()) == []  # pyright: ignore
+
+
+def test_multipart_part_not_presigned(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.unpresigned_parts = {3}
+    files = _big_file(tmp_path)[:1]
+
+    with fake.serve():
+        try:
+            publish_files(files, config=TEST_CONFIG, multipart=_settings(tmp_path))
+            raise AssertionError("Expected UploadError")
+        except UploadError as e:
+            failure = e.failures["doc.assets/talk.mp4"]
+
+    assert isinstance(failure, UploadError)
+    assert isinstance(failure.failures["doc.assets/talk.mp4#part3"], PartNotPresigned)
+    assert sorted(fake.part_puts) == [1, 2, 4]
+    assert fake.count("POST", "/api/sync/commit") == 0
+
+
+def test_multipart_falls_back_on_client_error(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.multipart_start_status = 403
+    files = _big_file(tmp_path)[:1]
+
+    with fake.serve():
+        publish_files(files, config=TEST_CONFIG, multipart=_settings(tmp_path))
+
+    assert fake.count("PUT", "/doc.assets/talk.mp4") == 1
+    assert fake.contents["doc.assets/talk.mp4"] == files[0][0].read_bytes()
+
+
+def test_hash_file_parts(tmp_path: Path):
+    path = _big_file(tmp_path)[0][0]
+    data = path.read_bytes()
+
+    assert hash_file_parts(path, PART_SIZE) == hashlib.md5(data).hexdigest()
+    checksums = part_checksums(path, PART_SIZE)
+    assert [c.md5 for c in checksums] == [
+        hashlib.md5(data[i : i + PART_SIZE]).hexdigest() for i in range(0, len(data), PART_SIZE)
+    ]
+    assert [c.size for c in checksums] == [PART_SIZE] * 3 + [1000]
@@ -0,0 +1,219 @@
+import os
+import time
+from pathlib import Path
+
+from fake_textpress import TEST_CONFIG, FakeTextpress
+
+from textpress.api.api_cache import ApiCache
+from textpress.api.file_metadata_cache import FileMetadataCache
+from textpress.api.textpress_api import UploadError, get_user, publish_files
+from textpress.spans import span_totals, start_trace, stop_trace
+
+
+def _write_files(tmp_path: Path, count: int) -> list[tuple[Path, str]]:
+    files: list[tuple[Path, str]] = []
+    for i in range(count):
+        path = tmp_path / f"file_{i}.txt"
+        path.write_text(f"content {i}\n")
+        files.append((path, f"doc.assets/file_{i}.txt"))
+    return files
+
+
+def test_publish_files_uploads_concurrently(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.upload_delay = 0.05
+    files = _write_files(tmp_path, 12)
+
+    with fake.serve():
+        result = publish_files(files, max_workers=4, config=TEST_CONFIG)
+
+    assert sorted(result.manifest.files) == sorted(up for _p, up in files)
+    assert fake.max_concurrent_uploads == 4
+    assert fake.count("POST", "/api/sync/commit") == 1
+
+
+def test_publish_files_no_commit_on_upload_failure(tmp_path: Path):
+    fake = FakeTextpress()
+    fake.fail_uploads = {"doc.assets/file_1.txt", "doc.assets/file_3.txt"}
+    files = _write_files(tmp_path, 5)
+
+    with fake.serve():
+        try:
+            publish_files(files, config=TEST_CONFIG)
+            raise AssertionError("Expected UploadError")
+        except UploadError as e:
+            assert set(e.failures) == fake.fail_uploads
+
+    # All uploads were attempted but nothing was committed.
+    assert fake.count("PUT", "/doc.assets/file_4.txt") == 1
+    assert fake.count("POST", "/api/sync/commit") == 0
+    assert fake.version == 1
+    assert fake.contents == {}
+
+
+def test_publish_files_skips_unchanged(tmp_path: Path):
+    fake = FakeTextpress()
+    files = _write_files(tmp_path, 10)
+
+    with fake.serve():
+        first = publish_files(files, config=TEST_CONFIG)
+        assert first.summary() == "0 unchanged, 10 uploaded"
+
+        # Republishing with no changes makes no presign or commit calls.
+        again = publish_files(files, config=TEST_CONFIG)
+        assert again.summary() == "10 unchanged, 0 uploaded"
+        assert again.manifest.version == first.manifest.version
+
+        files[3][0].write_text("edited\n")
+        fake.presigned_paths.clear()
+        edited = publish_files(files, config=TEST_CONFIG)
+
+    assert edited.summary() == "9 unchanged, 1 uploaded"
+    assert edited.uploaded == ["doc.assets/file_3.txt"]
+    assert fake.presigned_paths == ["doc.assets/file_3.txt"]
+    assert fake.count("POST", "/api/sync/presign-batch") == 2
+    assert fake.count("POST", "/api/sync/commit") == 2
+    assert fake.contents["doc.assets/file_3.txt"] == b"edited\n"
+
+
+def test_publish_files_uses_metadata_cache(tmp_path: Path):
+    fake = FakeTextpress()
+    files = _write_files(tmp_path, 4)
+    old = time.time() - 60
+    for path, _up in files:
+        os.utime(path, (old, old))
+    cache_path = tmp_path / "cache.json"
+
+    with fake.serve():
+        publish_files(files, config=TEST_CONFIG, metadata_cache=FileMetadataCache(cache_path))
+        cache = FileMetadataCache(cache_path)
+        result = publish_files(files, config=TEST_CONFIG, metadata_cache=cache)
+
+    assert (cache.hits, cache.misses) == (4, 0)
+    assert result.summary() == "4 unchanged, 0 uploaded"
+
+
+def test_publish_files_revalidates_manifest(tmp_path: Path):
+    fake = FakeTextpress()
+    files = _write_files(tmp_path, 3)
+    cache_path = tmp_path / "api_cache.json"
+
+    with fake.serve():
+        first = publish_files(files, config=TEST_CONFIG, api_cache=ApiCache(cache_path))
+        # The manifest changed with our commit, so this fetches it again.
+        again = publish_files(files, config=TEST_CONFIG, api_cache=ApiCache(cache_path))
+        assert fake.not_modified == 0
+
+        # Now it's unchanged, so it's only revalidated.
+        steady = publish_files(files, config=TEST_CONFIG, api_cache=ApiCache(cache_path))
+        assert fake.not_modified == 1
+        assert steady.manifest == again.manifest
+
+        users = [get_user(TEST_CONFIG, ApiCache(cache_path)) for _ in range(3)]
+
+    assert first.summary() == "0 unchanged, 3 uploaded"
+    assert steady.summary() == "3 unchanged, 0 uploaded"
+    assert {user.username for user in users} == {"tester"}
+    assert fake.count("GET", "/api/user") == 1
+
+
+def test_publish_files_spans(tmp_path: Path):
+    fake = FakeTextpress()
+    files = _write_files(tmp_path, 3)
+
+    start_trace()
+    try:
+        with fake.serve():
+            publish_files(files, config=TEST_CONFIG)
+    finally:
+        events = stop_trace()
+
+    totals = {total.name: total for total in span_totals(events)}
+    assert set(totals) == {"get_manifest", "hash_file", "presign", "upload_file", "commit"}
+    assert totals["upload_file"].count == 3
+    assert totals["upload_file"].bytes == sum(path.stat().st_size for path, _up in files)
+
+
+def test_publish_files_rebases_on_conflict(tmp_path: Path):
+    fake = FakeTextpress()
+    files: list[tuple[Path, str]] = []
+    for name in ["a.md", "b.md", "c.md"]:
+        (tmp_path / name).write_text(f"ours {name}\n")
+        files.append((tmp_path / name, name))
+
+    # Another publisher commits first: same content for b.md, different for c.md.
+    fake.external_commits = [{"b.md": b"ours b.md\n", "c.md": b"theirs\n", "z.md": b"z\n"}]
+
+    with fake.serve():
+        result = publish_files(files, config=TEST_CONFIG)
+
+    assert result.retries == 1
+    assert sorted(result.uploaded) == ["a.md", "c.md"]
+    assert result.unchanged == ["b.md"]
+    # Only the conflicting file is uploaded again.
+    assert fake.count("PUT", "/a.md") == 1
+    assert fake.count("PUT", "/c.md") == 2
+    assert fake.count("POST", "/api/sync/commit") == 2
+    assert fake.contents == {
+        "a.md": b"ours a.md\n",
+        "b.md": b"ours b.md\n",
+        "c.md": b"ours c.md\n",
+        "z.md": b"z\n",
+    }
+    assert result.manifest.version == 3
+
+
+def test_publish_files_conflict_with_same_content(tmp_path: Path):
+    fake = FakeTextpress()
+    (tmp_path / "a.md").write_text("ours\n")
+    # Another publisher commits the same content first, leaving nothing to do.
+    fake.external_commits = [{"a.md": b"ours\n"}]
+
+    with fake.serve():
+        result = publish_files([(tmp_path / "a.md", "a.md")], config=TEST_CONFIG)
+
+    assert result.summary() == "1 unchanged, 0 uploaded, 1 conflict retries"
+    assert fake.count("POST", "/api/sync/commit") == 1
+
+
+def test_publish_files_precompressed(tmp_path: Path):
+    import gzip
+
+    from textpress.api.precompress import precompress_file
+
+    fake = FakeTextpress()
+    page = tmp_path / "page.html"
+    page.write_text("<p>Hello, world!</p>\n" * 200)
+    precompress_file(page, ["gzip"])
+    files = [(page, "page.html"), *_write_files(tmp_path, 1)]
+
+    with fake.serve():
+        result = publish_files(files, config=TEST_CONFIG, precompressed=True)
+        assert result.summary() == "0 unchanged, 2 uploaded"
+
+        # The compressed bytes are deterministic, so a republish is a no-op.
+        assert publish_files(files, config=TEST_CONFIG, precompressed=True).uploaded == []
+
+    assert gzip.decompress(fake.contents["page.html"]) == page.read_bytes()
+    assert fake.content_encodings == {"page.html": "gzip"}
+
+
+def test_publish_files_shared_assets(tmp_path: Path):
+    from textpress.api.textpress_api import IMMUTABLE_CACHE_CONTROL
+
+    fake = FakeTextpress()
+    asset = tmp_path / "abc123.css"
+    asset.write_text("body { color: red; }")
+    page_files = _write_files(tmp_path, 1)
+
+    with fake.serve():
+        publish_files([(asset, "_shared/abc123.css"), *page_files], config=TEST_CONFIG)
+        # Another page using the same shared asset only uploads its own files.
+        other = tmp_path / "other.txt"
+        other.write_text("other")
+        result = publish_files(
+            [(asset, "_shared/abc123.css"), (other, "other.txt")], config=TEST_CONFIG
+        )
+
+    assert result.uploaded == ["other.txt"]
+    assert fake.cache_controls == {"_shared/abc123.css": IMMUTABLE_CACHE_CONTROL}
@@ -0,0 +1,62 @@
+import asyncio
+from pathlib import Path
+
+from fake_textpress import TEST_CONFIG, FakeTextpress
+
+from textpress.api import textpress_api_async
+
+
+def test_async_publish_files(tmp_path: Path):
+    fake = FakeTextpress()
+    docs: list[list[tuple[Path, str]]] = []
+    for doc in ["a", "b", "c"]:
+        files: list[tuple[Path, str]] = []
+        for name in [f"{doc}.md", f"{doc}.html"]:
+            path = tmp_path / name
+            path.write_text(f"contents of {name}\n")
+            files.append((path, name))
+        docs.append(files)
+
+    async def publish_all():
+        async with fake.async_client() as client:
+            # Docs are published one after another here since each commit
+            # bumps the manifest version.
+            results = []
+            for files in docs:
+                results.append(
+                    await textpress_api_async.publish_files(client, files, config=TEST_CONFIG)
+                )
+            user, again = await asyncio.gather(
+                textpress_api_async.get_user(client, TEST_CONFIG),
+                textpress_api_async.publish_files(client, docs[0], config=TEST_CONFIG),
+            )
+            return results, user, again
+
+    results, user, again = asyncio.run(publish_all())
+
+    assert [r.summary() for r in results] == ["0 unchanged, 2 uploaded"] * 3
+    assert again.summary() == "2 unchanged, 0 uploaded"
+    assert user.username == "tester"
+    assert fake.version == 4
+    assert fake.contents["b.html"] == b"contents of b.html\n"
+
+
+def test_async_publish_files_rebases_on_conflict(tmp_path: Path):
+    fake = FakeTextpress()
+    files: list[tuple[Path, str]] = []
+    for name in ["a.md", "b.md", "c.md"]:
+        (tmp_path / name).write_text(f"ours {name}\n")
+        files.append((tmp_path / name, name))
+    fake.external_commits = [{"b.md": b"ours b.md\n", "c.md": b"theirs\n"}]
+
+    async def publish():
+        async with fake.async_client() as client:
+            return await textpress_api_async.publish_files(client, files, config=TEST_CONFIG)
+
+    result = asyncio.run(publish())
+
+    assert result.retries == 1
+    assert sorted(result.uploaded) == ["a.md", "c.md"]
+    assert result.unchanged == ["b.md"]
+    assert fake.count("PUT", "/c.md") == 2
+    assert fake.contents["c.md"] == b"ours c.md\n"
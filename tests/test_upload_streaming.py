@@ -0,0 +1,57 @@
+import hashlib
+import tracemalloc
+from pathlib import Path
+
+import httpx
+
+from textpress.api.textpress_api import upload_file
+
+FILE_SIZE = 32 * 1024 * 1024
+
+
+class StreamingSink(httpx.BaseTransport):
+    """
+    Consumes request bodies chunk by chunk (like a real socket would) without
+    buffering them, recording what was received.
+    """
+
+    def __init__(self):
+        self.headers: httpx.Headers | None = None
+        self.received = 0
+        self.md5 = hashlib.md5()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.headers = request.headers
+        for chunk in request.stream:  # pyright: ignore
+            self.received += len(chunk)
+            self.md5.update(chunk)
+        return httpx.Response(200)
+
+
+def test_upload_file_streams_with_flat_memory(tmp_path: Path):
+    path = tmp_path / "big.bin"
+    with open(path, "wb") as f:
+        for i in range(FILE_SIZE // (1024 * 1024)):
+            f.write(bytes([i % 256]) * (1024 * 1024))
+
+    sink = StreamingSink()
+    upload_info = {
+        "url": "https://storage.test/big.bin",
+        "headers": {"Content-Type": "application/octet-stream"},
+    }
+
+    with httpx.Client(transport=sink) as client:
+        tracemalloc.start()
+        try:
+            upload_file(client, path, upload_info)
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert sink.received == FILE_SIZE
+    assert sink.md5.hexdigest() == hashlib.md5(path.read_bytes()).hexdigest()
+    assert sink.headers is not None
+    assert sink.headers["Content-Length"] == str(FILE_SIZE)
+    assert "Transfer-Encoding" not in sink.headers
+    # Peak should be a few chunks, not anywhere near the file size.
+    assert peak < 4 * 1024 * 1024